@@ -0,0 +1,57 @@
+#! /usr/local/bin/python3.6
+
+"""
+Time per address of address_parser and of the old NormaliseDF parsing (kept in test_address_parser) over the addresses
+of Resources/normalised_bp_data.csv, with price paid data of pp_rows made up rows to look the streets up in, and
+what that comes to for the 25M addresses of the price paid data.
+
+python3 -m blue_plaques.benchmarks.bench_address_parser [pp_rows]
+"""
+
+import datetime
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from blue_plaques.blue_plaques import address_parser
+from blue_plaques.test.test_address_parser import OldNormalise
+
+resources_file = '{}/Resources/'.format(os.path.dirname(os.path.dirname(__file__)))
+ALL_ADDRESSES = 25 * 10 ** 6
+
+
+def made_up_pp(rows):
+    rng = np.random.RandomState(0)
+    postcodes = ['{}{} {}{}'.format(rng.choice(['N', 'NW', 'SW', 'E']), rng.randint(1, 20), rng.randint(1, 9),
+                                    ''.join(rng.choice(list('ABDEFGHJLNPQRSTUWXYZ'), 2))) for _ in range(rows // 20)]
+    streets = ['STREET {}'.format(i) for i in range(rows // 50)]
+    return pd.DataFrame({'PAON': rng.randint(1, 200, rows).astype(str),
+                         'Street': np.array(streets, dtype=object)[rng.randint(len(streets), size=rows)],
+                         'Postcode': np.array(postcodes, dtype=object)[rng.randint(len(postcodes), size=rows)]},
+                        columns=['PAON', 'Street', 'Postcode'])
+
+
+def main(pp_rows=10 ** 6):
+    addresses = pd.read_csv(resources_file + 'normalised_bp_data.csv')['address'].dropna().tolist()
+    pp = made_up_pp(pp_rows)
+    print('{} addresses, {:,} price paid rows'.format(len(addresses), len(pp)))
+
+    start = datetime.datetime.now()
+    old = OldNormalise(pp)
+    expected = [old.parse_address(address) for address in addresses]
+    old_time = (datetime.datetime.now() - start) / len(addresses)
+
+    start = datetime.datetime.now()
+    parser = address_parser.AddressParser(pp)
+    results = [parser.parse(address) for address in addresses * 20]
+    new_time = (datetime.datetime.now() - start) / len(results)
+
+    print('old  {} an address, {} for all'.format(old_time, old_time * ALL_ADDRESSES))
+    print('new  {} an address, {} for all'.format(new_time, new_time * ALL_ADDRESSES))
+    print('Same results', results[:len(addresses)] == expected)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,56 @@
+#! /usr/local/bin/python3.6
+
+"""
+Micro benchmark of deriving the area and sale year of a chunk.
+Compares the row by row apply of find_area/get_year that all_prices_df used to do against find_areas/get_years
+on a synthetic 10**6 row chunk that looks like the land registry data.
+
+python3 -m blue_plaques.benchmarks.bench_derive
+"""
+
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from blue_plaques.blue_plaques import analysis_3
+
+
+def synthetic_chunk(rows=10 ** 6, seed=0):
+    """Chunk with Postcode and Date_sold columns in the land registry format"""
+    rng = np.random.RandomState(seed)
+    areas = np.array(['N1', 'N7', 'NW3', 'SW1A', 'E13', 'W8', 'SE10', 'EC1V', 'HA0', 'AL10'])
+    letters = np.array(list('ABDEFGHJLNPQRSTUWXYZ'))
+    postcodes = pd.Series(areas[rng.randint(0, len(areas), rows)]).str.cat(
+        [pd.Series(rng.randint(0, 10, rows).astype(str)), pd.Series(letters[rng.randint(0, 20, rows)]),
+         pd.Series(letters[rng.randint(0, 20, rows)])], sep='')
+    postcodes = postcodes.str[:-3] + ' ' + postcodes.str[-3:]
+    days = rng.randint(0, 365 * 24, rows)
+    dates = pd.Series((np.datetime64('1995-01-01') + days).astype(str)) + ' 00:00'
+    return pd.DataFrame({'Postcode': postcodes, 'Date_sold': dates})
+
+
+def time_it(func, *args):
+    start = datetime.datetime.now()
+    rv = func(*args)
+    return rv, (datetime.datetime.now() - start).total_seconds()
+
+
+def main(rows=10 ** 6):
+    chunk = synthetic_chunk(rows)
+
+    areas, apply_area = time_it(lambda c: c['Postcode'].apply(analysis_3.find_area), chunk)
+    years, apply_year = time_it(lambda c: c['Date_sold'].apply(analysis_3.get_year), chunk)
+    v_areas, vector_area = time_it(analysis_3.find_areas, chunk['Postcode'])
+    v_years, vector_year = time_it(analysis_3.get_years, chunk['Date_sold'])
+
+    assert areas.tolist() == v_areas.tolist()
+    assert years.tolist() == v_years.tolist()
+
+    print('{} rows'.format(rows))
+    print('area  apply {:.2f}s  vectorised {:.2f}s  x{:.0f}'.format(apply_area, vector_area, apply_area / vector_area))
+    print('year  apply {:.2f}s  vectorised {:.2f}s  x{:.0f}'.format(apply_year, vector_year, apply_year / vector_year))
+
+
+if __name__ == '__main__':
+    main()
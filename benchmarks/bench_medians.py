@@ -0,0 +1,65 @@
+#! /usr/local/bin/python3.6
+
+"""
+Memory and accuracy of the two median engines of house_prices_stats against holding every price in memory.
+Runs on synthetic lognormal prices (or on a land registry csv if one is given) in chunks like read_csv.
+
+python3 -m blue_plaques.benchmarks.bench_medians [pp-complete.csv]
+"""
+
+import datetime
+import sys
+
+import numpy as np
+import pandas as pd
+
+from blue_plaques.blue_plaques import accumulators
+from blue_plaques.blue_plaques import analysis_3
+
+
+def synthetic_chunks(rows=2 * 10 ** 6, chunksize=10 ** 6, groups=2000, seed=0):
+    """Chunks of Area, Year, Price with a few thousand area/years"""
+    rng = np.random.RandomState(seed)
+    areas = np.array(['A{}'.format(i) for i in range(groups // 20)])
+    for start in range(0, rows, chunksize):
+        n = min(chunksize, rows - start)
+        yield pd.DataFrame({'Area': areas[rng.randint(0, len(areas), n)], 'Year': rng.randint(1995, 2015, n),
+                            'Price': np.round(np.exp(rng.normal(12, 0.7, n)))})
+
+
+def csv_chunks(csv_file):
+    files = analysis_3.Data(csv_file, None)
+    for chunk in analysis_3.Data.read_csv(files, 6):
+        yield pd.DataFrame({'Area': analysis_3.find_areas(chunk['Postcode']),
+                            'Year': analysis_3.get_years(chunk['Date_sold']), 'Price': chunk['Price']})
+
+
+def main(chunks, alpha=0.005):
+    chunks = list(chunks)
+    everything = pd.concat(chunks)
+    in_memory = everything.groupby(['Area', 'Year'])['Price'].median()
+    print('All prices in memory   {:>12,} bytes'.format(int(everything.memory_usage(deep=True).sum())))
+
+    start = datetime.datetime.now()
+
+    stats = accumulators.AreaYearStats(alpha)
+    for chunk in chunks:
+        stats.update(chunk['Area'], chunk['Year'], chunk['Price'])
+    approx_time = datetime.datetime.now()
+    exact = accumulators.ExactMedians(stats)
+    for chunk in chunks:
+        exact.update(chunk['Area'], chunk['Year'], chunk['Price'])
+    exact_medians = exact.medians()
+    exact_time = datetime.datetime.now()
+
+    print('Approx (sketch) memory {:>12,} bytes  {}'.format(stats.nbytes(), approx_time - start))
+    print('Exact 2nd pass memory  {:>12,} bytes  {}'.format(stats.nbytes() + exact.nbytes(), exact_time - approx_time))
+    print('Approx vs exact', accumulators.median_accuracy(stats.medians(), exact_medians))
+    print('Exact vs in memory', accumulators.median_accuracy(exact_medians, in_memory))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(csv_chunks(sys.argv[1]))
+    else:
+        main(synthetic_chunks())
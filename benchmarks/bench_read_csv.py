@@ -0,0 +1,72 @@
+#! /usr/local/bin/python3.6
+
+"""
+Benchmark of Data.read_csv on the price paid text.
+Compares reading every column untyped (how the analysis read the csv before) against reading only the columns a
+consumer needs with pinned dtypes, for the price stats (price_columns) and the save methods (match_columns), with the
+c engine and with pyarrow if it is installed. Time is the whole pass; memory is the biggest chunk held and the peak
+that tracemalloc sees while parsing.
+
+python3 -m blue_plaques.benchmarks.bench_read_csv pp-complete.csv [chunk_power]
+"""
+
+import contextlib
+import datetime
+import io
+import sys
+import tracemalloc
+
+from blue_plaques.blue_plaques import analysis_3
+
+
+def read_all(files, chunk_power, **kwargs):
+    """Reads the whole csv and returns the rows and the biggest chunk in bytes"""
+    rows = 0
+    chunk_bytes = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for chunk in analysis_3.Data.read_csv_text(files, chunk_power, **kwargs):
+            rows += len(chunk)
+            chunk_bytes = max(chunk_bytes, int(chunk.memory_usage(deep=True).sum()))
+    return rows, chunk_bytes
+
+
+def time_read(files, chunk_power, **kwargs):
+    """
+    Reads the csv twice, once timed and once with tracemalloc on (it slows parsing down)
+    :return: rows, seconds, biggest chunk in bytes, tracemalloc peak in bytes
+    """
+    start = datetime.datetime.now()
+    rows, chunk_bytes = read_all(files, chunk_power, **kwargs)
+    seconds = (datetime.datetime.now() - start).total_seconds()
+    tracemalloc.start()
+    read_all(files, chunk_power, **kwargs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return rows, seconds, chunk_bytes, peak
+
+
+def main(csv_file, chunk_power=5):
+    files = analysis_3.Data(csv_file, None)
+    readers = [('all columns untyped', {}),
+               ('price_columns typed', {'columns': analysis_3.price_columns, 'typed': True}),
+               ('match_columns typed', {'columns': analysis_3.match_columns, 'typed': True})]
+    try:
+        import pyarrow
+        readers += [('price_columns typed pyarrow', {'columns': analysis_3.price_columns, 'typed': True,
+                                                     'engine': 'pyarrow'}),
+                    ('match_columns typed pyarrow', {'columns': analysis_3.match_columns, 'typed': True,
+                                                     'engine': 'pyarrow'})]
+    except ImportError:
+        print('pyarrow not installed, skipping the pyarrow engine')
+
+    base = None
+    for name, kwargs in readers:
+        rows, seconds, chunk_bytes, peak = time_read(files, chunk_power, **kwargs)
+        if base is None:
+            base = seconds, peak
+        print('{:<28} {} rows  {:.2f}s (x{:.1f})  chunk {:.1f}MB  peak {:.1f}MB (x{:.1f})'.format(
+            name, rows, seconds, base[0] / seconds, chunk_bytes / 2 ** 20, peak / 2 ** 20, base[1] / peak))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1], *[int(arg) for arg in sys.argv[2:3]])
@@ -0,0 +1,37 @@
+#! /usr/local/bin/python3.6
+
+"""
+Time of the resampling tests at the size of the real samples: 10,000 resamples of a few hundred bp weighted prices
+against 1.68M controls, rounded to 4 significant figures like the weighted prices are.
+
+python3 -m blue_plaques.benchmarks.bench_resampling [resamples] [workers]
+"""
+
+import datetime
+import sys
+
+import numpy as np
+
+from blue_plaques.blue_plaques import resampling
+
+
+def synthetic_samples(controls=1680000, bps=400, seed=0):
+    rng = np.random.RandomState(seed)
+    round_sig = np.vectorize(lambda x: float('{:.4g}'.format(x)))
+    return round_sig(np.exp(rng.normal(12.2, 0.8, bps))), round_sig(np.exp(rng.normal(12, 0.8, controls)))
+
+
+def main(resamples=10000, workers=1):
+    exp, ctr = synthetic_samples()
+    start = datetime.datetime.now()
+    resampling.ResamplingTests.independent_samples((exp, ctr), resamples, workers=workers)
+    independent_time = datetime.datetime.now()
+    resampling.ResamplingTests.single_sample(exp, ctr.mean(), resamples, workers=workers)
+    single_time = datetime.datetime.now()
+    print('{} controls, {} distinct'.format(len(ctr), len(np.unique(ctr))))
+    print('Independent samples {}'.format(independent_time - start))
+    print('Single sample       {}'.format(single_time - independent_time))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,81 @@
+#! /usr/local/bin/python3.6
+
+"""
+Time of the bs4 and fast backends of wiki_tables on the plaque list pages, checking they give the same rows.
+Uses the pages saved in the wiki cache (see http_cache and collection.PlaqueScrape) if there are any, otherwise
+pages laid out like the London list made from Resources/wiki_bp_data.csv.
+
+python3 -m blue_plaques.benchmarks.bench_wiki_tables [repeats]
+"""
+
+import datetime
+import html
+import os
+import sys
+
+import pandas as pd
+
+from blue_plaques.blue_plaques import http_cache
+from blue_plaques.blue_plaques import wiki_tables
+
+resources_file = '{}/Resources/'.format(os.path.dirname(os.path.dirname(__file__)))
+plaque_urls = ['https://en.wikipedia.org/wiki/List_of_English_Heritage_blue_plaques_in_London',
+               'https://en.wikipedia.org/wiki/List_of_English_Heritage_blue_plaques_in_the_Royal_Borough_of_'
+               'Kensington_and_Chelsea',
+               'https://en.wikipedia.org/wiki/List_of_English_Heritage_blue_plaques_in_the_London_Borough_of_Camden',
+               'https://en.wikipedia.org/wiki/List_of_English_Heritage_blue_plaques_in_the_City_of_Westminster']
+
+
+def saved_pages():
+    cache = http_cache.ResponseCache(resources_file + 'wiki_cache/', offline=True)
+    pages = []
+    for url in plaque_urls:
+        try:
+            pages.append(cache.get(url))
+        except IOError:
+            pass
+    return pages
+
+
+def synthetic_pages(copies=3):
+    """A page per list with a sortable table of every plaque in wiki_bp_data.csv, copies times over"""
+    df = pd.read_csv(resources_file + 'wiki_bp_data.csv').fillna('')
+    rows = []
+    for _, plaque in df.iterrows():
+        rows.append('<tr class="vevent">\n<th scope="row"><span class="fn"><a href="{}" title="{}">{}</a></span></th>'
+                    '\n<td>{} lived here</td>\n<td>{}<br><span class="plainlinks nourlexpansion"><a class="external '
+                    'text" href="//geohack.toolforge.org/"><span class="geo-default">51.5°N 0.1°W</span></a></span>'
+                    '</td>\n<td>{}</td>\n<td><a href="/wiki/File:Plaque.jpg" class="image"><img src="p.jpg" '
+                    'width="100"></a></td>\n</tr>\n'.format(html.escape(plaque['wiki'].replace(wiki_tables.WIKI_HEAD,
+                                                                                                ''))
+                                                            , html.escape(plaque['person']),
+                                                            html.escape(plaque['person']),
+                                                            html.escape(plaque['person']),
+                                                            html.escape(plaque['address']), plaque['year'][:4]))
+    body = ('<!DOCTYPE html><html><head><title>List</title></head><body><div id="content">'
+            '<div role="note" class="hatnote navigation-not-searchable">Main article: <a href="/wiki/Camden">Camden'
+            '</a></div><table class="wikitable sortable"><tr><th>Person</th><th>Inscription</th><th>Location</th>'
+            '<th>Year</th><th>Image</th></tr>\n' + ''.join(rows) * copies + '</table></div></body></html>')
+    return [body] * len(plaque_urls)
+
+
+def main(repeats=3):
+    pages = saved_pages()
+    print('{} saved pages'.format(len(pages)) if pages else 'No saved pages, using synthetic ones')
+    pages = pages or synthetic_pages()
+    times = {}
+    results = {}
+    for backend in ['bs4', 'fast']:
+        start = datetime.datetime.now()
+        for _ in range(repeats):
+            results[backend] = [wiki_tables.parse_page(page, backend) for page in pages]
+        times[backend] = (datetime.datetime.now() - start) / repeats
+    rows = sum(len(result[0]) for result in results['bs4'])
+    print('{} rows in {:,} characters of html'.format(rows, sum(len(page) for page in pages)))
+    print('bs4   {}'.format(times['bs4']))
+    print('fast  {}'.format(times['fast']))
+    print('Same rows and links', results['bs4'] == results['fast'])
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -55,7 +55,8 @@ Single sample t-test
 
 from blue_plaques.blue_plaques import plaque_scrape
 from blue_plaques.blue_plaques import analysis_3
-import requests
+from blue_plaques.blue_plaques import download
+from blue_plaques.blue_plaques import incremental
 import os
 
 
@@ -76,18 +77,19 @@ def from_scratch(folder):
     # Save the csv file from source
     # https://www.gov.uk/government/statistical-data-sets/price-paid-data-downloads
 
+    # It is streamed to disk, carrying on from where it got to if the connection drops or this is run again, and
+    # parsed into the columnar cache (see store.py) as it comes in
     csv_url = 'http://prod.publicdata.landregistry.gov.uk.s3-website-eu-west-1.amazonaws.com/pp-complete.csv'
-    r = requests.get(csv_url)
-    with open(folder + 'pp-complete.csv', 'wb') as f:
-        f.write(r.content)
+    csv_file = folder + 'pp-complete.csv'
+    analysis_3.Data.ingest(analysis_3.Data(csv_file, None), source=download.Download(csv_url, csv_file))
 
-    # Gather the soup and save data to bp_info.csv inside folder (defined above)
+    # Gather the soup and save data to bp_info.csv inside folder (defined above), the pages are saved in its wiki_cache/
+    # and only downloaded again if they changed (see http_cache.py)
     plaque_scrape.main('https://en.wikipedia.org/wiki/List_of_English_Heritage_blue_plaques_in_London',
                        folder)
 
     bp_file = folder + 'bp_csv.csv'
 
-    csv_file = folder + 'pp-complete.csv'
     # Run analysis on data
 
     files = analysis_3.Data(csv_file, bp_file)
@@ -106,3 +108,13 @@ def from_download(land_reg_file, bp_file):
     return data
 
 
+def from_update(update_file, bp_file, state_folder, avg_type='mean'):
+    """Applies a land registry monthly update file to the state saved in state_folder (see incremental.py) and runs
+    the analysis from the state, so pp-complete.csv isn't gone over again. Make the state once with
+    incremental.IncrementalState.build(analysis_3.Data(land_reg_file, bp_file), state_folder)"""
+    if os.path.exists(update_file) is False or os.path.exists(bp_file) is False:
+        raise FileNotFoundError('One of the inputted file paths is not correct. Please input full file path')
+
+    state = incremental.IncrementalState.load(analysis_3.Data(None, bp_file), state_folder)
+    state.apply(update_file)
+    return state.main(avg_type)
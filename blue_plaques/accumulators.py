@@ -0,0 +1,416 @@
+#! /usr/local/bin/python3.6
+
+"""
+Streaming accumulators for the analysis.
+
+AreaYearStats keeps the house_prices_stats numbers for every (area, year) as running totals so that the stats can be
+made chunk by chunk without holding every price in memory. Memory depends on the number of (area, year) groups
+(about 57k for the whole land registry file) and not on the number of sales.
+
+    count, sum, sum of squares      - added up
+    mean, 2nd and 3rd central moments - merged with the pairwise formulas of Chan et al. / Pebay so that sd and skew
+                                      don't suffer from the cancellation of taking them from raw power sums
+    median                          - from a log bucketed histogram of the prices (see below)
+
+The totals of prices that were added can also be taken back out (subtract), which is how sales that the land registry
+changes or deletes in its monthly updates are dropped from the stats (see incremental.py).
+
+The median sketch puts each price in bucket ceil(log(price) / log(gamma)) with gamma = (1 + alpha) / (1 - alpha), and
+keeps a count per (area, year, bucket). Counts just add up when chunks are merged and any value read back from a
+bucket is within alpha (relative) of every price in it, so the median is within alpha of the true median.
+
+ExactMedians is the exact option: a second pass over the sales that keeps only the prices in the buckets the sketch
+says the medians are in.
+
+SampleMoments does the same for the t-test samples: count, mean and M2 of the weighted prices, merged chunk by chunk
+and process by process, which is all the t-tests need. A Reservoir of the values can be kept with it for plotting.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class AreaYearStats:
+    """Mergeable running stats of prices per (Area, Year)"""
+
+    def __init__(self, alpha=0.005):
+        """
+        :param alpha: relative error bound of the median, 0.005 = half a percent
+        """
+        if not 0 < alpha < 1:
+            raise ValueError('alpha has to be between 0 and 1, not {}'.format(alpha))
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.moments = None  # DataFrame indexed by (Area, Year) - n, mean, M2, M3, sum_of_x, sum_of_x_sqr
+        self.sketch = None  # Series of counts indexed by (Area, Year, Bucket)
+
+    def bucket(self, prices):
+        """Sketch bucket of each price. Prices below 1 go in the bucket of 1."""
+        prices = np.maximum(np.asarray(prices, dtype=float), 1.0)
+        return np.ceil(np.log(prices) / np.log(self.gamma)).astype(np.int64)
+
+    def bucket_value(self, buckets):
+        """Value that is within alpha of everything in the bucket"""
+        return 2 * self.gamma ** np.asarray(buckets, dtype=float) / (self.gamma + 1)
+
+    def update(self, areas, years, prices):
+        """
+        Adds a chunk of sales
+        :param areas: area of each sale, see find_areas
+        :param years: year of each sale, see get_years
+        :param prices: price of each sale
+        :return: self
+        """
+        df = pd.DataFrame({'Area': np.asarray(areas), 'Year': np.asarray(years),
+                           'Price': np.asarray(prices, dtype=float)}).dropna()
+        if len(df) == 0:
+            return self
+        df['Year'] = df['Year'].astype(np.int64)
+        df['Bucket'] = self.bucket(df['Price'].values)
+
+        groups = df.groupby(['Area', 'Year'])['Price']
+        n = groups.size()
+        mean = groups.mean()
+        deviation = df['Price'] - groups.transform('mean')
+        keys = [df['Area'], df['Year']]
+        chunk = pd.DataFrame({'n': n.astype(float),
+                              'mean': mean,
+                              'M2': (deviation ** 2).groupby(keys).sum(),
+                              'M3': (deviation ** 3).groupby(keys).sum(),
+                              'sum_of_x': groups.sum(),
+                              'sum_of_x_sqr': (df['Price'] ** 2).groupby(keys).sum()},
+                             columns=['n', 'mean', 'M2', 'M3', 'sum_of_x', 'sum_of_x_sqr'])
+        sketch = df.groupby(['Area', 'Year', 'Bucket']).size()
+
+        other = AreaYearStats(self.alpha)
+        other.moments = chunk
+        other.sketch = sketch
+        return self.merge(other)
+
+    def merge(self, other):
+        """
+        Adds the totals of another AreaYearStats (e.g. from another chunk or process) to this one
+        :param other: AreaYearStats with the same alpha
+        :return: self
+        """
+        if other.alpha != self.alpha:
+            raise ValueError('Cannot merge sketches with different alpha ({} and {})'.format(self.alpha, other.alpha))
+        if other.moments is None:
+            return self
+        if self.moments is None:
+            self.moments = other.moments.copy()
+            self.sketch = other.sketch.copy()
+            return self
+
+        index = self.moments.index.union(other.moments.index)
+        a = self.moments.reindex(index, fill_value=0)
+        b = other.moments.reindex(index, fill_value=0)
+        n = a['n'] + b['n']
+        delta = b['mean'] - a['mean']
+        merged = pd.DataFrame(index=index)
+        merged['n'] = n
+        merged['mean'] = a['mean'] + delta * b['n'] / n
+        merged['M2'] = a['M2'] + b['M2'] + delta ** 2 * a['n'] * b['n'] / n
+        merged['M3'] = (a['M3'] + b['M3'] + delta ** 3 * a['n'] * b['n'] * (a['n'] - b['n']) / (n * n)
+                        + 3 * delta * (a['n'] * b['M2'] - b['n'] * a['M2']) / n)
+        merged['sum_of_x'] = a['sum_of_x'] + b['sum_of_x']
+        merged['sum_of_x_sqr'] = a['sum_of_x_sqr'] + b['sum_of_x_sqr']
+        self.moments = merged
+        self.sketch = self.sketch.add(other.sketch, fill_value=0)
+        return self
+
+    def subtract(self, other):
+        """
+        Takes the totals of another AreaYearStats back out of this one, e.g. the old prices of sales that have been
+        changed or deleted. other has to be made of prices that were added to this one. The moments are the merge
+        formulas solved for the first part; (area, year)s with no prices left are dropped.
+        :param other: AreaYearStats with the same alpha
+        :return: self
+        """
+        if other.alpha != self.alpha:
+            raise ValueError('Cannot subtract sketches with different alpha ({} and {})'.format(self.alpha,
+                                                                                                 other.alpha))
+        if other.moments is None:
+            return self
+        if self.moments is None or not other.moments.index.isin(self.moments.index).all():
+            raise ValueError('Cannot subtract prices of an area/year that has none')
+
+        m = self.moments
+        b = other.moments.reindex(m.index, fill_value=0)
+        n_a = m['n'] - b['n']
+        if (n_a < 0).any():
+            raise ValueError('Cannot subtract more prices than an area/year has')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_a = ((m['n'] * m['mean'] - b['n'] * b['mean']) / n_a).fillna(0)
+            delta = b['mean'] - mean_a
+            m2_a = (m['M2'] - b['M2'] - delta ** 2 * n_a * b['n'] / m['n']).clip(lower=0)
+            m3_a = (m['M3'] - b['M3'] - delta ** 3 * n_a * b['n'] * (n_a - b['n']) / (m['n'] * m['n'])
+                    - 3 * delta * (n_a * b['M2'] - b['n'] * m2_a) / m['n'])
+        left = pd.DataFrame(index=m.index)
+        left['n'] = n_a
+        left['mean'] = mean_a
+        left['M2'] = m2_a
+        left['M3'] = m3_a
+        left['sum_of_x'] = m['sum_of_x'] - b['sum_of_x']
+        left['sum_of_x_sqr'] = m['sum_of_x_sqr'] - b['sum_of_x_sqr']
+        self.moments = left[left['n'] > 0]
+
+        sketch = self.sketch.subtract(other.sketch, fill_value=0)
+        if (sketch < 0).any():
+            raise ValueError('Cannot subtract prices that were not added')
+        self.sketch = sketch[sketch > 0]
+        return self
+
+    def median_buckets(self):
+        """
+        Where the two middle prices of each (Area, Year) are in the sketch: the bucket each one is in and its rank
+        within that bucket (0 = smallest in the bucket). They are the same price when the count is odd.
+        :return: DataFrame indexed by (Area, Year) - low_bucket, low_rank, high_bucket, high_rank
+        """
+        sketch = self.sketch.sort_index()
+        groups = sketch.groupby(level=[0, 1])
+        upto = groups.cumsum()
+        below = upto - sketch
+        n = groups.transform('sum')
+        buckets = pd.Series(sketch.index.get_level_values(2), index=sketch.index)
+
+        found = {}
+        for name, rank in [('low', (n - 1) // 2), ('high', n // 2)]:
+            here = (below <= rank) & (rank < upto)
+            found[name + '_bucket'] = buckets[here].reset_index(level=2, drop=True)
+            found[name + '_rank'] = (rank - below)[here].reset_index(level=2, drop=True).astype(np.int64)
+        return pd.DataFrame(found, columns=['low_bucket', 'low_rank', 'high_bucket', 'high_rank'])
+
+    def medians(self):
+        """
+        Approximate median of each (Area, Year) from the sketch, within alpha of the true one. For an even number of
+        prices it is the average of the two middle ones, like pandas.
+        :return: Series indexed by (Area, Year)
+        """
+        middle = self.median_buckets()
+        return pd.Series((self.bucket_value(middle['low_bucket']) + self.bucket_value(middle['high_bucket'])) / 2,
+                         index=middle.index)
+
+    def nbytes(self):
+        """Memory held by the running totals and the sketch"""
+        if self.moments is None:
+            return 0
+        return int(self.moments.memory_usage(deep=True).sum() + self.sketch.memory_usage(deep=True))
+
+    def to_frame(self, medians=None):
+        """
+        Stats in the format of house_prices_stats
+        :param medians: Series of medians indexed by (Area, Year) to use instead of the sketch ones, e.g. from
+         ExactMedians
+        :return: DataFrame - ['median', 'mean', 'number', 'sd', 'skew', 'sum_of_x', 'sum_of_x_sqr', 'Area', 'Year']
+        """
+        columns = ['median', 'mean', 'number', 'sd', 'skew', 'sum_of_x', 'sum_of_x_sqr', 'Area', 'Year']
+        if self.moments is None:
+            return pd.DataFrame(columns=columns)
+        m = self.moments.sort_index()
+        n = m['n']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sd = np.sqrt(m['M2'] / (n - 1)).where(n > 1)
+            # Adjusted Fisher-Pearson coefficient, the one pandas skew gives
+            skew = (np.sqrt(n * (n - 1)) / (n - 2) * (m['M3'] / n) / (m['M2'] / n) ** 1.5).where(n > 2)
+        skew[(n > 2) & (m['M2'] == 0)] = 0.0
+        if medians is None:
+            medians = self.medians()
+        stats = pd.DataFrame({'median': medians, 'mean': m['mean'], 'number': n.astype(np.int64), 'sd': sd,
+                              'skew': skew, 'sum_of_x': m['sum_of_x'], 'sum_of_x_sqr': m['sum_of_x_sqr']},
+                             index=m.index)
+        stats = stats.reset_index()
+        return stats[columns]
+
+
+class ExactMedians:
+    """
+    Second pass over the sales that gets the exact median of every (Area, Year). The sketch of a finished
+    AreaYearStats says which bucket the middle prices are in and how far into that bucket they are, so only the
+    prices in those buckets are kept and sorted. Memory is the number of prices that share a bucket with a median,
+    a small part of each group.
+    """
+
+    def __init__(self, area_year_stats):
+        """
+        :param area_year_stats: AreaYearStats that has had every sale added to it
+        """
+        self.stats = area_year_stats
+        self.middle = area_year_stats.median_buckets()
+        low = self.middle['low_bucket'].reset_index()
+        high = self.middle['high_bucket'].reset_index()
+        low.columns = high.columns = ['Area', 'Year', 'Bucket']
+        self.wanted = pd.concat([low, high]).drop_duplicates()
+        self.found = []
+
+    def update(self, areas, years, prices):
+        """
+        Keeps the prices from a chunk that are in a median bucket
+        :return: self
+        """
+        df = pd.DataFrame({'Area': np.asarray(areas), 'Year': np.asarray(years),
+                           'Price': np.asarray(prices, dtype=float)}).dropna()
+        df['Year'] = df['Year'].astype(np.int64)
+        df['Bucket'] = self.stats.bucket(df['Price'].values)
+        self.found.append(pd.merge(df, self.wanted, on=['Area', 'Year', 'Bucket'], how='inner'))
+        return self
+
+    def nbytes(self):
+        """Memory held by the kept prices"""
+        return int(sum(df.memory_usage(deep=True).sum() for df in self.found))
+
+    def medians(self):
+        """
+        :return: Series of exact medians indexed by (Area, Year)
+        """
+        df = pd.concat(self.found).sort_values(['Area', 'Year', 'Bucket', 'Price'])
+        df['Rank'] = df.groupby(['Area', 'Year', 'Bucket']).cumcount()
+        df = df.set_index(['Area', 'Year', 'Bucket', 'Rank'])['Price']
+
+        middle = []
+        for name in ['low', 'high']:
+            at = pd.MultiIndex.from_arrays([self.middle.index.get_level_values(0),
+                                            self.middle.index.get_level_values(1),
+                                            self.middle[name + '_bucket'].values,
+                                            self.middle[name + '_rank'].values])
+            middle.append(df.reindex(at).values)
+        return pd.Series((middle[0] + middle[1]) / 2, index=self.middle.index)
+
+
+def median_accuracy(medians, exact_medians):
+    """
+    How far one set of medians is from the exact ones
+    :param medians: Series indexed by (Area, Year)
+    :param exact_medians: Series indexed by (Area, Year)
+    :return: dict - max and mean relative error and the number of groups compared
+    """
+    medians, exact_medians = medians.align(exact_medians, join='inner')
+    error = ((medians - exact_medians).abs() / exact_medians.abs()).dropna()
+    return {'max_relative_error': float(error.max()), 'mean_relative_error': float(error.mean()),
+            'groups': int(len(error))}
+
+
+class SampleMoments:
+    """
+    Mergeable count, mean and sum of squared deviations (M2) of one sample, e.g. the weighted prices of the single
+    sample t-test, so the sample doesn't have to be kept as a list. Chunks are added with the pairwise formulas of
+    Chan et al. (Welford's update a chunk at a time), so the sd doesn't suffer from the cancellation of raw sums.
+    """
+
+    def __init__(self, reservoir=0, seed=None):
+        """
+        :param reservoir: also keep a uniform random sample of up to this many of the values (see Reservoir), 0 for
+         none
+        :param seed: seed of the reservoir's random numbers
+        """
+        self.n = 0
+        self.mean = 0.0
+        self.M2 = 0.0
+        self.reservoir = Reservoir(reservoir, seed) if reservoir > 0 else None
+
+    def update(self, values):
+        """
+        Adds a chunk of values
+        :return: self
+        """
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return self
+        chunk = SampleMoments()
+        chunk.n = len(values)
+        chunk.mean = float(values.mean())
+        chunk.M2 = float(((values - chunk.mean) ** 2).sum())
+        SampleMoments.merge_moments(self, chunk)
+        if self.reservoir is not None:
+            self.reservoir.update(values)
+        return self
+
+    def merge(self, other):
+        """
+        Adds the values of another SampleMoments (e.g. from another chunk or process) to this one
+        :return: self
+        """
+        if self.reservoir is not None and other.n > 0:
+            if other.reservoir is None:
+                raise ValueError('Cannot merge moments without a reservoir into ones with a reservoir')
+            self.reservoir.merge(other.reservoir)
+        return SampleMoments.merge_moments(self, other)
+
+    def merge_moments(self, other):
+        if other.n == 0:
+            return self
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.M2 += other.M2 + delta ** 2 * self.n * other.n / n
+        self.n = n
+        return self
+
+    def add(self, sample):
+        """Adds a list or array of values, or merges a SampleMoments"""
+        if isinstance(sample, SampleMoments):
+            return SampleMoments.merge(self, sample)
+        return SampleMoments.update(self, sample)
+
+    def variance(self):
+        """(n - 1) variance, nan for fewer than 2 values"""
+        return self.M2 / (self.n - 1) if self.n > 1 else float('nan')
+
+    def sums(self):
+        """
+        :return: n, sum of x, sum of x squared
+        """
+        return self.n, self.n * self.mean, self.M2 + self.n * self.mean ** 2
+
+
+class Reservoir:
+    """
+    Uniform random sample of at most size of the values added (Vitter's algorithm R), for plotting a sample that is
+    only kept as SampleMoments. Two reservoirs of the same size merge into a uniform sample of both.
+    """
+
+    def __init__(self, size, seed=None):
+        self.size = size
+        self.seen = 0
+        self.values = np.zeros(0)
+        self.rng = np.random.RandomState(seed)
+
+    def update(self, values):
+        """
+        Adds a chunk of values
+        :return: self
+        """
+        values = np.asarray(values, dtype=float)
+        fill = min(self.size - len(self.values), len(values))
+        if fill > 0:
+            self.values = np.append(self.values, values[:fill])
+        rest = values[fill:]
+        if len(rest):
+            # The t-th value seen replaces a random one of the sample with chance size / t
+            t = self.seen + fill + np.arange(1, len(rest) + 1)
+            slots = np.floor(self.rng.random_sample(len(rest)) * t).astype(np.int64)
+            for i in np.flatnonzero(slots < self.size):
+                self.values[slots[i]] = rest[i]
+        self.seen += len(values)
+        return self
+
+    def merge(self, other):
+        """
+        Makes this the sample of the values of both reservoirs
+        :return: self
+        """
+        if other.size != self.size:
+            raise ValueError('Cannot merge reservoirs of size {} and {}'.format(self.size, other.size))
+        if other.seen == 0:
+            return self
+        size = min(self.size, self.seen + other.seen)
+        # How many of a uniform sample of both come from this one
+        take = self.rng.hypergeometric(self.seen, other.seen, size) if self.seen > 0 else 0
+        self.values = np.concatenate([self.rng.permutation(self.values)[:take],
+                                      self.rng.permutation(other.values)[:size - take]])
+        self.seen += other.seen
+        return self
+
+    def sample(self):
+        """The sampled values, in no order"""
+        return self.values.copy()
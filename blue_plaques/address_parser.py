@@ -0,0 +1,137 @@
+#! /usr/local/bin/python3.6
+
+"""
+Parser of addresses into PAON, street and postcode for NormaliseDF, made to go over the whole price paid data.
+
+NormaliseDF used to look for the postcode up to four times an address, run each of the PAON patterns one after the
+other and make a street type pattern for each street type, and each look up of the price paid data was a scan of all
+of it. Here the patterns are compiled once, the postcode is found once per address, the PAON patterns are one pattern
+whose first matching branch says which kind of PAON it is:
+    range        12-14 ...
+    number       12 ... or 12A ...
+    named        NAME, 12-14 ... or NAME, 12 ...
+and the street types are looked for in the runs of letters and spaces of the address, split out once. The price paid
+data is indexed by PAON and postcode the first time a look up is needed. The results are the same as the old ones.
+
+    parser = AddressParser(pp)
+    paon, street, postcode = parser.parse('12 Hopping Lane, Islington N1 2NU')
+"""
+
+import re
+
+
+POSTCODE = re.compile(r'[A-Z]{1,2}[0-9R][0-9A-Z]? [0-9][A-Z]{2}')
+PAON = re.compile(r'(?P<range>[0-9]+ ?- ?[0-9]+)|(?P<number>[0-9]+[A-Z]? )|'
+                  r'(?P<name>[A-Z ]+,) (?:(?P<named_range>[0-9]+ ?- ?[0-9]+)|(?P<named_number>[0-9]+) )')
+WORDS = re.compile(r'[A-Z ]+')
+STREET_TYPES = ['TERRACE', 'COURT', 'SQUARE', 'GATE', 'PLACE', 'ROAD', 'LANE', 'WALK', 'CRESCENT', 'AVENUE']
+
+
+def get_postcode(address):
+    """First postcode in an address, '' if there isn't one"""
+    pc = POSTCODE.search(address)
+    if pc is None:
+        return ''
+    return pc.group().strip()
+
+
+def number_range(text):
+    """'12 -14' -> '12 - 14'"""
+    a, b = text.split('-')
+    return '{} - {}'.format(a.strip(), b.strip())
+
+
+def street_type(address):
+    """
+    Name of the street with the first of STREET_TYPES in the address, e.g. 'HOPPING LANE'. Found the way
+    re.findall(r'[A-Z ]+ LANE', address)[0] would: the longest start of the first run of letters and spaces that has
+    ' LANE' after at least one character.
+    :return: str, or None if there are none
+    """
+    runs = WORDS.findall(address)
+    for name in STREET_TYPES:
+        name = ' ' + name
+        for run in runs:
+            end = run.rfind(name)
+            if end > 0:
+                return run[:end + len(name)]
+    return None
+
+
+class AddressParser:
+    """PAON, street and postcode of addresses, looking the streets up in the price paid data"""
+
+    def __init__(self, pp):
+        """
+        :param pp: price paid dataframe with PAON, Street and Postcode columns
+        """
+        self.pp = pp
+        self.index = {}  # column: {value: rows of pp}
+        self.found = {}  # (column, value): streets of the rows
+
+    def streets(self, column, value):
+        """
+        Different streets of the price paid rows with value in column, in the order list(set(streets)) gives them
+        """
+        key = (column, value)
+        if key not in self.found:
+            if column not in self.index:
+                self.index[column] = self.pp.groupby(column, sort=False).indices
+            rows = self.index[column].get(value)
+            streets = [] if rows is None else self.pp['Street'].values[rows].tolist()
+            self.found[key] = list(set(streets))
+        return self.found[key]
+
+    def get_paon(self, address, postcode=None):
+        """
+        :param address:
+        :param postcode: get_postcode(address) if it has already been found
+        :return: PAON, None if there isn't one
+        """
+        if postcode is None:
+            postcode = get_postcode(address)
+        address = address.upper().replace(postcode, ' ').strip()
+
+        paon = PAON.match(address)
+        if paon is not None:
+            kind = paon.lastgroup
+            if kind == 'range':
+                return number_range(paon.group(kind))
+            elif kind == 'number':
+                return paon.group(kind).strip()
+            elif kind == 'named_range':
+                return '{} {}'.format(paon.group('name'), number_range(paon.group(kind)))
+            return '{} {}'.format(paon.group('name'), paon.group(kind))
+
+        for paon in AddressParser.streets(self, 'PAON', get_postcode(address)):
+            if paon in address:
+                return paon
+        return None
+
+    def get_street(self, address, postcode=None):
+        """
+        :param address:
+        :param postcode: get_postcode(address) if it has already been found
+        :return: street, None if there isn't one
+        """
+        if postcode is None:
+            postcode = get_postcode(address)
+        address = address.upper().replace(postcode, '')
+
+        streets = [x for x in AddressParser.streets(self, 'Postcode', get_postcode(address)) if str(x) != 'nan']
+        if len(streets) == 1:
+            return streets[0]
+
+        for street in streets:
+            if street.replace("'", ' ') in address.replace("'", ' '):
+                return street
+        return street_type(address)
+
+    def parse(self, address):
+        """
+        :return: (paon, street, postcode)
+        """
+        postcode = get_postcode(address)
+        street = AddressParser.get_street(self, address, postcode)
+        paon = AddressParser.get_paon(self, address, postcode)
+        return paon, street, postcode
@@ -12,8 +12,10 @@ The main method runs the three t-tests
 
 """
 
+import collections
 import datetime
 import math
+import multiprocessing
 import os
 import re
 import statistics
@@ -24,12 +26,25 @@ import matplotlib.pyplot as plt
 from scipy import stats, integrate
 import seaborn as sns
 
+from blue_plaques.blue_plaques import accumulators
+from blue_plaques.blue_plaques import artifacts
+from blue_plaques.blue_plaques import price_store
+from blue_plaques.blue_plaques import store
 
 __version__ = 3
 
 dp = 2
 resources_file = '{}/Resources/'.format(os.path.dirname(os.getcwd()))
 
+price_paid_columns = ['ID', 'Price', 'Date_sold', 'Postcode', 'Property_type', 'New_build', 'Estate_Type', 'PAON',
+                      'SAON', 'Street', 'Locality', 'Town_City', 'District', 'County', 'PPD_Category', 'Record_Status']
+# Columns that come back as categoricals when read typed, see Data.read_csv
+category_columns = ['Postcode', 'County', 'Property_type']
+# Columns the price stats need
+price_columns = ['Price', 'Date_sold', 'Postcode']
+# Columns the save methods need to match and weight the bp houses
+match_columns = ['ID', 'Price', 'Date_sold', 'Postcode', 'PAON', 'Street', 'Locality', 'Town_City']
+
 
 def timer(func):
     def f(*args, **kwargs):
@@ -42,9 +57,10 @@ def timer(func):
     return f
 
 
-def distribution_plot(area, year):
+def distribution_plot(files, area, year):
     """
     Shows the distribution for an area and year
+    :param files: Data
     :param area:
     :param year:
     :return:
@@ -56,21 +72,24 @@ def distribution_plot(area, year):
     plt.show()
 
 
-def save_df(df, name):
+def save_df(files, df, name, **params):
     """
-    Saves the dataframe to Resources file to be used for repeated dataframe uses.
+    Saves the dataframe in the artifact cache of the csv (see Data.artifacts) to be used for repeated dataframe uses.
+    It is only used again for the same csv, code version, name and params.
+    :param: Data the dataframe was worked out from
     :param: Average prices dataframe
+    :param: name, e.g. house_prices_stats
+    :param: the parameters the dataframe was worked out with
     :return: None
     """
-    file_path = '{}{}.pkl'.format(resources_file, name)
-    file = open(file_path, 'w')
-    file.close()
-    df.to_pickle(file_path)
+    cache = Data.artifacts(files)
+    cache.put(cache.key(name, [files.csv_file], params), df, {'name': name, 'params': params,
+                                                              'inputs': [files.csv_file]})
 
 
 def get_year(date):
     """Only accepts string from dataframe with year at start and returns int
-    Takes 16 ish seconds per chunk (of 10**6 rows)"""
+    Takes 16 ish seconds per chunk (of 10**6 rows) - use get_years for whole columns"""
     dt = datetime.datetime.strptime(str(date), '%Y-%m-%d %H:%M').year
     return dt
 
@@ -78,6 +97,7 @@ def get_year(date):
 def find_area(postcode):
     """
     Don't change this because it won't change the dataframe splits that have been done so will probably break
+    Use find_areas for whole columns
     :param postcode: The postcode to be split
     :return: area
     """
@@ -87,6 +107,107 @@ def find_area(postcode):
         return postcode.split(' ')[0]
 
 
+def round_sig(values, figures):
+    """
+    Rounds an array to significant figures, giving the same floats as float(format(value, '.4g')) does for 4.
+    Values that land near a half way point once scaled are done with format to get its rounding exactly.
+    :param values: numpy array
+    :param figures: number of significant figures
+    :return: numpy array
+    """
+    values = np.asarray(values, dtype=float)
+    rounded = values.copy()
+    finite = np.isfinite(values) & (values != 0)
+    scale = 10.0 ** (figures - 1 - np.floor(np.log10(np.abs(values[finite]))))
+    scaled = values[finite] * scale
+    rounded[finite] = np.round(scaled) / scale
+    near_half = np.abs(np.abs(scaled - np.floor(scaled)) - 0.5) < 1e-6
+    fmt = '.{}g'.format(figures)
+    rounded[np.flatnonzero(finite)[near_half]] = [float(format(value, fmt)) for value in values[finite][near_half]]
+    return rounded
+
+
+def get_years(dates):
+    """
+    get_year for a whole column at once. Only the 'yyyy-mm-dd' at the start is parsed so the time of day on the end
+    of the land registry dates is not needed. A chunk only has a few thousand different days in it so each distinct
+    date string is parsed once and taken back onto the column.
+    :param dates: series of date strings (or datetimes)
+    :return: series of int years
+    """
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return dates.dt.year
+    codes, uniques = pd.factorize(dates)
+    years = pd.to_datetime(pd.Series(uniques).str[:10], format='%Y-%m-%d').dt.year.values
+    if (codes == -1).any():
+        # nan on the end so the -1 code of a nan date gives nan
+        years = np.append(years.astype(float), np.nan)
+    return pd.Series(years[codes], index=dates.index)
+
+
+def get_dates(dates):
+    """
+    Parses a column of 'yyyy-mm-dd hh:mm' dates to datetime64 days. Each distinct date is only parsed once.
+    :param dates: series of date strings
+    :return: series of datetime64, NaT where the date is nan
+    """
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return dates
+    codes, uniques = pd.factorize(dates)
+    days = pd.to_datetime(pd.Series(uniques).str[:10], format='%Y-%m-%d').values
+    # NaT on the end so the -1 code of a nan date gives NaT
+    days = np.append(days, np.datetime64('NaT', 'ns'))
+    return pd.Series(days[codes], index=dates.index)
+
+
+def find_areas(postcodes):
+    """
+    find_area for a whole column at once. Each distinct postcode is only split once and taken back onto the column.
+    :param postcodes: series of postcodes
+    :return: series of areas, nan where the postcode is nan
+    """
+    codes, uniques = pd.factorize(postcodes)
+    areas = pd.Series(uniques).str.split(' ').str[0].values
+    # nan on the end so the -1 code of a nan postcode gives nan
+    areas = np.append(areas, np.nan).astype(object)
+    return pd.Series(areas[codes], index=postcodes.index)
+
+
+def parse_bp(df):
+    """
+    Turns the scraped bp csv into the read_bp dataframe. The house number, postcode and year are taken from whole
+    columns at once; the address list is what is left of the address once they are taken out.
+    :param df: read bp csv - Address, Person, Wiki, Year
+    :return: DataFrame. Columns = ['Person', 'Wiki', 'Year', 'Number', 'Address_list', 'Postcode']
+    """
+    columns = ['Person', 'Wiki', 'Year', 'Number', 'Address_list', 'Postcode']
+    if len(df) == 0:
+        return pd.DataFrame(columns=columns)
+    address = df['Address'].fillna('').astype(str)
+    number = address.str.extract(r'(\d+)', expand=False)
+    postcode = address.str.extract(r'([A-Z]{1,2}[0-9R][0-9A-Z]? [0-9][A-Z]{2})', expand=False)
+
+    # Years that pd.to_datetime can't hold as a date are unknown, same as ones that aren't numbers
+    year = np.trunc(pd.to_numeric(df['Year'], errors='coerce'))
+    year = year.where((year >= pd.Timestamp.min.year + 1) & (year <= pd.Timestamp.max.year))
+    year = year.map(lambda y: str(int(y)), na_action='ignore')
+
+    address_list = []
+    for text, pc, no in zip(address.values, postcode.values, number.values):
+        if isinstance(pc, str):
+            text = text.replace(pc, ' ')
+        if isinstance(no, str):
+            text = text.replace(no, ' ')
+        address_list.append(text.replace(',', '').strip().split('\n'))
+
+    return pd.DataFrame({'Person': df['Person'].map(str, na_action='ignore'),
+                         'Wiki': df['Wiki'].astype(str),
+                         'Year': year.astype(object),
+                         'Number': number.fillna('nan').astype(object),
+                         'Address_list': address_list,
+                         'Postcode': postcode.fillna('nan').astype(object)}, columns=columns)
+
+
 def repeated_measures_catcher(chunk, person, matches, bp_year):
     """
     Designed to make sure there is the data available and I've not messed up
@@ -129,7 +250,7 @@ def population_variation(avg_prices_df):
     :return: pop var and pop mean
     """
 
-    sumX2 = avg_prices_df['sum_of_x_srq'].sum()
+    sumX2 = avg_prices_df['sum_of_x_sqr'].sum()
     sumX = avg_prices_df['sum_of_x'].sum()
     n = avg_prices_df['number'].sum()
 
@@ -139,22 +260,344 @@ def population_variation(avg_prices_df):
 
 
 def raw_for_area_year(files, area, year, short_cut=True):
-    """Gets the raw data for a certain area and year"""
-    name = '{}_{}'.format(area, year)
+    """Gets the raw data for a certain area and year
+    :param short_cut: True to slice them out of the price store (see Data.price_store), False to read them from
+     all_prices_df
+    :return: array of the prices, lowest first"""
     if short_cut is True:
-        df = pd.read_pickle(resources_file + 'all_prices_df.pkl')
-    else:
-        df = Data.all_prices_df(files)
+        return Data.price_store(files).get(area, year)
+
+    name = '{}_{}'.format(area, year)
+    df = Data.all_prices_df(files)
+    if name not in df.index:
+        return np.zeros(0, dtype=np.int64)
+    return np.sort(df.loc[name].dropna().values.astype(np.int64))
+
+
+class AveragePriceIndex:
+    """
+    Hash index of the house_prices_stats dataframe on (Area, Year) so that weighting a sale is a dict look up and
+    not a scan of the whole stats dataframe. Build it once after house_prices_stats and pass it around in place of
+    the dataframe - the save methods take either.
+    """
+
+    def __init__(self, avg_prices):
+        """
+        :param avg_prices: stats dataframe with Area and Year columns and the averages (mean, median, sd, number...)
+        """
+        df = avg_prices.copy()
+        df['Year'] = df['Year'].astype(int)
+        # The first row of an area/year is the one the old boolean mask look up used
+        df = df.drop_duplicates(['Area', 'Year']).set_index(['Area', 'Year'])
+        self.frame = df
+        self.lookup = dict(zip(df.index, df.to_dict('records')))
+
+    @staticmethod
+    def of(avg_prices):
+        """Returns avg_prices as an AveragePriceIndex, only building one if it is a dataframe"""
+        if isinstance(avg_prices, AveragePriceIndex):
+            return avg_prices
+        return AveragePriceIndex(avg_prices)
+
+    def get(self, area, year, avg_type):
+        """
+        :return: the avg_type average of the area in that year. KeyError if there isn't one.
+        """
+        return self.lookup[(area, int(year))][avg_type]
+
+    def averages(self, areas, years, avg_type):
+        """
+        Vectorised get for whole columns
+        :param areas: area of each sale
+        :param years: year of each sale
+        :return: numpy array of averages, nan where the area/year isn't in the stats
+        """
+        keys = pd.MultiIndex.from_arrays([np.asarray(areas), np.asarray(years)])
+        positions = self.frame.index.get_indexer(keys)
+        values = np.append(self.frame[avg_type].values.astype(float), np.nan)
+        return values[positions]
+
+    def weight(self, areas, years, prices, avg_type):
+        """Prices as a proportion of the average price of their area and year"""
+        return np.asarray(prices, dtype=float) / self.averages(areas, years, avg_type)
+
+
+class PlaqueMatcher:
+    """
+    Look up index of the plaques on (Postcode, PAON) for finding the houses they are on. Made once from read_bp, each
+    chunk is then matched with one hash join on the two columns, and the street check (any of the chunk's Street,
+    Locality or Town_City being a line of the plaque address) only runs over the few sales that join.
+    """
+
+    def __init__(self, bp):
+        """
+        :param bp: read_bp dataframe
+        """
+        self.bp = bp
+        # House numbers are matched as numbers so '02' and '2' are the same house, and PAONs like '2A' never match
+        index = pd.DataFrame({'Postcode': bp['Postcode'].values,
+                              'PAON': pd.to_numeric(bp['Number'], errors='coerce').values,
+                              'Person': bp['Person'].values,
+                              'Tokens': [frozenset(item.lower() for item in address_list)
+                                         for address_list in bp['Address_list']],
+                              'Plaque': np.arange(len(bp))},
+                             columns=['Postcode', 'PAON', 'Person', 'Tokens', 'Plaque'])
+        self.index = index.dropna(subset=['Postcode', 'PAON'])
+        self.postcodes = set(self.index['Postcode'])
+
+    @staticmethod
+    def of(bp):
+        """Returns bp as a PlaqueMatcher, only building one if it is a dataframe"""
+        if isinstance(bp, PlaqueMatcher):
+            return bp
+        return PlaqueMatcher(bp)
+
+    def match(self, chunk):
+        """
+        Finds the sales in a chunk that are of plaque houses
+        :param chunk: read_csv chunk
+        :return matches: dictionary - {Person: [ID, ID, ID], ..} in plaque then chunk order
+        """
+        chunk = chunk[chunk['Postcode'].isin(self.postcodes) & chunk['Street'].notnull()]
+        if len(chunk) == 0:
+            return {}
+        sales = pd.DataFrame({'Postcode': chunk['Postcode'].values,
+                              'PAON': pd.to_numeric(chunk['PAON'], errors='coerce').values,
+                              'ID': chunk['ID'].values,
+                              'Street': chunk['Street'].values,
+                              'Locality': chunk['Locality'].values,
+                              'Town_City': chunk['Town_City'].values,
+                              'Row': np.arange(len(chunk))}).dropna(subset=['PAON'])
+        candidates = pd.merge(self.index, sales, on=['Postcode', 'PAON'], how='inner').sort_values(['Plaque', 'Row'])
+
+        matches_dict = {}
+        for row in candidates.itertuples():
+            land_reg = set(item.lower() for item in [row.Street, row.Locality, row.Town_City] if isinstance(item, str))
+            if row.Tokens.isdisjoint(land_reg):
+                continue
+            if row.Person in matches_dict.keys():
+                matches_dict[row.Person].append(row.ID)
+            else:
+                matches_dict.update({row.Person: [row.ID]})
+        return matches_dict
+
+
+class RowFilter:
+    """
+    Rows of the price paid data to keep, e.g. RowFilter(county='GREATER LONDON') or RowFilter(areas={'N1', 'NW3'}).
+    Every condition given has to hold. Used by Data.read_csv and Data.ingest in two steps:
+        keep_lines - quick test of the raw csv lines so most of the rows that are not wanted are never parsed.
+                     It can let some through (the county is only looked for somewhere in the line)
+        mask       - exact test of the parsed chunk
+    """
 
-    df = df[df.index == name]
-    df = df.dropna(1)
-    ls = df.values.tolist()
-    return ls
+    def __init__(self, county=None, areas=None, start=None, stop=None):
+        """
+        :param county: County the house is in, e.g. 'GREATER LONDON'
+        :param areas: outward codes (see find_area) to keep
+        :param start: first sale date to keep, 'yyyy-mm-dd'
+        :param stop: sale date to stop before, 'yyyy-mm-dd'
+        """
+        self.county = county
+        self.areas = None if areas is None else frozenset(areas)
+        self.start = start
+        self.stop = stop
+
+    def describe(self):
+        """dict of the conditions, saved with an ingested cache to say what is in it"""
+        return {'county': self.county, 'areas': None if self.areas is None else sorted(self.areas),
+                'start': self.start, 'stop': self.stop}
+
+    def columns(self):
+        """Columns mask needs"""
+        needed = [('County', self.county), ('Postcode', self.areas), ('Date_sold', self.start or self.stop)]
+        return [column for column, condition in needed if condition is not None]
+
+    def keep_lines(self, lines):
+        """
+        Quick test of raw csv lines. The first three fields (ID, price, date) never have a comma in them so the date
+        and postcode are found by splitting off the first few fields.
+        :param lines: list of bytes lines
+        :return: list of the lines that may be wanted
+        """
+        if self.county is not None:
+            county = self.county.encode()
+            lines = [line for line in lines if county in line]
+        try:
+            return self.keep_fields(lines)
+        except IndexError:
+            # Lines without a postcode field can't be wanted
+            return self.keep_fields([line for line in lines if line.count(b',') >= 4])
+
+    def keep_fields(self, lines):
+        """Area and date part of keep_lines, IndexError if a line has less than four fields"""
+        if self.areas is not None:
+            areas = set(area.encode() for area in self.areas)
+            lines = [line for line in lines if line.split(b',', 4)[3].strip(b'"').split(b' ', 1)[0] in areas]
+        if self.start is not None or self.stop is not None:
+            start = (self.start or '0000-00-00').encode()
+            stop = (self.stop or '9999-99-99').encode()
+            lines = [line for line in lines if start <= line.split(b',', 3)[2].strip(b'"')[:10] < stop]
+        return lines
+
+    def mask(self, df):
+        """
+        Exact test of a parsed chunk
+        :param df: chunk with the columns of RowFilter.columns
+        :return: boolean series
+        """
+        keep = pd.Series(True, index=df.index)
+        if self.county is not None:
+            keep &= (df['County'] == self.county).values
+        if self.areas is not None:
+            keep &= find_areas(df['Postcode']).isin(self.areas).values
+        if self.start is not None or self.stop is not None:
+            dates = get_dates(df['Date_sold'])
+            if self.start is not None:
+                keep &= (dates >= pd.Timestamp(self.start)).values
+            if self.stop is not None:
+                keep &= (dates < pd.Timestamp(self.stop)).values
+        return keep
+
+
+class LineFilter:
+    """Read only file-like view of a csv that only gives the lines a RowFilter may want, so pandas never parses the
+    rest. The lines are read and tested a block at a time."""
+
+    def __init__(self, f, row_filter, block=2 ** 22):
+        """
+        :param f: open binary file (or ByteRange) positioned at the start of a line
+        :param row_filter: RowFilter
+        :param block: bytes read from f at a time
+        """
+        self.f = f
+        self.row_filter = row_filter
+        self.block = block
+        self.partial = b''
+        self.buffer = b''
+        self.position = 0
+        self.done = False
+
+    @property
+    def closed(self):
+        return self.f.closed
+
+    def readable(self):
+        return True
+
+    def fill(self):
+        """Tests the next block of lines, returns False at the end of the file"""
+        while self.position >= len(self.buffer):
+            if self.done is True:
+                return False
+            data = self.f.read(self.block)
+            if not data:
+                self.done = True
+                lines = [self.partial] if self.partial else []
+            else:
+                lines = (self.partial + data).split(b'\n')
+                self.partial = lines.pop()
+            lines = self.row_filter.keep_lines(lines)
+            self.buffer = b'\n'.join(lines) + b'\n' if lines else b''
+            self.position = 0
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            parts = []
+            while self.fill() is True:
+                parts.append(self.buffer[self.position:])
+                self.position = len(self.buffer)
+            return b''.join(parts)
+        if self.fill() is False:
+            return b''
+        data = self.buffer[self.position:self.position + size]
+        self.position += len(data)
+        return data
+
+    def readline(self, size=-1):
+        if self.fill() is False:
+            return b''
+        end = self.buffer.index(b'\n', self.position) + 1
+        line = self.buffer[self.position:end]
+        self.position = end
+        return line
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+
+def read_csv_arrow(source, chunksize, skip, columns):
+    """
+    Chunks of the price paid csv parsed by pyarrow's streaming csv reader, for Data.read_csv_text(engine='pyarrow').
+    The text columns are read as strings and Price as a float, then turned into a dataframe like pd.read_csv gives.
+    Chunks are about chunksize rows; pyarrow cuts the file by bytes, not rows.
+    :param source: open binary file or ByteRange
+    :param chunksize: rows per chunk wanted
+    :param skip: lines to skip at the start
+    :param columns: columns to read
+    :yield data frame
+    """
+    import pyarrow as pa
+    from pyarrow import csv
+
+    # About 150 bytes a line in the price paid data
+    read_options = csv.ReadOptions(column_names=price_paid_columns, skip_rows=skip, block_size=150 * chunksize)
+    column_types = {column: pa.float64() if column == 'Price' else pa.string() for column in columns}
+    convert_options = csv.ConvertOptions(include_columns=columns, column_types=column_types,
+                                         strings_can_be_null=True)
+    reader = csv.open_csv(source, read_options=read_options, convert_options=convert_options)
+    for batch in reader:
+        yield batch.to_pandas()
+
+
+class ByteRange:
+    """Read only file-like view of the next length bytes of an open file, so pandas can parse one part of a csv"""
+
+    def __init__(self, f, length):
+        self.f = f
+        self.remaining = length
+
+    @property
+    def closed(self):
+        return self.f.closed
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def readline(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        line = self.f.readline(size)
+        self.remaining -= len(line)
+        return line
 
 
 class Data:
     """Holds the misc methods that are needed to get the data ready for the analysis class"""
-    __slots__ = ['csv_file', 'bp_file']
+    __slots__ = ['csv_file', 'bp_file', 'bp_cache']
 
     def __init__(self, csv_file, bp_file):
         """
@@ -165,119 +608,268 @@ class Data:
         """
         self.csv_file = csv_file
         self.bp_file = bp_file
+        self.bp_cache = None  # (bp_file and its fingerprint, PlaqueMatcher of the parsed bp) - see bp_matcher
 
-    def read_csv(self, chunk_power):
+    def read_csv(self, chunk_power, partition=None, columns=None, typed=False, engine='c', where=None):
         """Reads the csv file in chunks
+        Reads from the columnar cache made by Data.ingest if it is there and the csv has not changed since.
         :param self
         :param chunk_power - 6 is recommended for best performance
+        :param partition - one of Data.partitions to only read part of the file, None for all of it
+        :param columns - only read these columns (e.g. price_columns), None for all of them
+        :param typed - True for Price as int64, Date_sold as datetime64 and category_columns as categoricals
+        :param engine - 'c', 'python' or 'pyarrow' (needs pyarrow) for parsing the text
+        :param where - RowFilter of the rows to keep, None for all of them
         :yield data frame"""
-        chunksize = 10 ** chunk_power
-        for chunk in pd.read_csv(self.csv_file, chunksize=chunksize):
+        if (partition is not None and partition[0] == 'rows') or (partition is None and Data.cached(self, where)):
+            start, stop = (0, None) if partition is None else partition[1:]
+            cache_where = Data.cache_where(self, where)
+            if cache_where is not None:
+                where = None  # Already only the rows wanted
+            read_columns = columns
+            if where is not None and columns is not None:
+                read_columns = columns + [c for c in where.columns() if c not in columns]
+            chunks = store.read_chunks(self.csv_file, 10 ** chunk_power, start, stop, read_columns,
+                                       category_columns if typed else (), typed, cache_where)
+        else:
+            for df in Data.read_csv_text(self, chunk_power, partition, columns, typed, engine, where):
+                yield df
+            return
+        for df in chunks:
             print('Chunk')
-            df = pd.DataFrame(chunk)
-            df.columns = ['ID', 'Price', 'Date_sold', 'Postcode', 'Property_type', 'New_build', 'Estate_Type', 'PAON',
-                          'SAON', 'Street', 'Locality', 'Town_City', 'District', 'County', 'PPD_Category',
-                          'Record_Status']
-            # Maybe put a check here? Make sure it's a legit file.
-            # Drop nan rows for price, postcode or date_sold
-            df = df.dropna(axis=0, subset=['Price', 'Date_sold', 'Postcode'], how='any')
-            # df = (df[df['County'] == 'GREATER LONDON'])     # Removes ones not in Greater London
+            if where is not None:
+                df = df[where.mask(df).values]
+                if columns is not None:
+                    df = df[[c for c in df.columns if c in columns]]
             yield df
 
+    def read_csv_text(self, chunk_power, partition=None, columns=None, typed=False, engine='c', where=None,
+                      header=True, source=None):
+        """Parses the csv file as text in chunks, ignoring any cache
+        :param self
+        :param chunk_power - 6 is recommended for best performance
+        :param partition - ('bytes', start, stop) from Data.partitions to only parse the lines in that byte range
+        :param columns - only parse these columns, None for all of them
+        :param typed - see read_csv
+        :param engine - 'c', 'python' or 'pyarrow'
+        :param where - RowFilter of the rows to keep. Lines it doesn't want are dropped before parsing.
+        :param header - False if the first line is a sale and not a heading (the land registry monthly update files)
+        :param source - file like object to read the csv text from rather than opening csv_file, e.g. a
+         download.Download of it. Not for use with partition.
+        :yield data frame"""
+        chunksize = 10 ** chunk_power
+        columns = price_paid_columns if columns is None else [c for c in price_paid_columns if c in columns]
+        # Price, Date_sold and Postcode are always read so that the same rows are dropped whatever the columns
+        needed = price_columns + ([] if where is None else where.columns())
+        read_columns = [c for c in price_paid_columns if c in columns or c in needed]
+        f = open(self.csv_file, 'rb') if source is None else source
+        if partition is None:
+            source = f
+            # The first line is used as the heading so it is skipped
+            skip = 1 if header is True else 0
+        else:
+            f.seek(partition[1])
+            source = ByteRange(f, partition[2] - partition[1])
+            # The first line is skipped when reading the whole file so it is here too
+            skip = 1 if partition[1] == 0 and header is True else 0
+        if where is not None:
+            for i in range(skip):
+                source.readline()
+            source = LineFilter(source, where)
+            skip = 0
+        try:
+            if engine == 'pyarrow':
+                reader = read_csv_arrow(source, chunksize, skip, read_columns)
+            else:
+                dtype = None
+                if typed is True:
+                    dtype = {column: 'category' if column in category_columns else object for column in read_columns}
+                    dtype['Price'] = np.float64  # int once the rows without a price are dropped
+                usecols = None if read_columns == price_paid_columns else read_columns
+                reader = pd.read_csv(source, chunksize=chunksize, header=None, names=price_paid_columns,
+                                     skiprows=skip, usecols=usecols, dtype=dtype, engine=engine)
+            for chunk in reader:
+                print('Chunk')
+                df = pd.DataFrame(chunk)[read_columns]
+                # Maybe put a check here? Make sure it's a legit file.
+                # Drop nan rows for price, postcode or date_sold
+                df = df.dropna(axis=0, subset=['Price', 'Date_sold', 'Postcode'], how='any')
+                if typed is True or engine == 'pyarrow':
+                    df['Price'] = df['Price'].astype(np.int64)
+                if typed is True:
+                    df['Date_sold'] = get_dates(df['Date_sold'])
+                    for column in category_columns:
+                        if column in read_columns:
+                            df[column] = df[column].astype('category')
+                if where is not None:
+                    df = df[where.mask(df).values]
+                yield df if read_columns == columns else df[columns]
+        finally:
+            f.close()
+
+    def artifacts(self):
+        """
+        ArtifactCache of the results worked out from the csv (see artifacts.py), saved next to it. Results are keyed
+        on the csv's fingerprint and __version__ so they are worked out again when either changes.
+        """
+        return artifacts.ArtifactCache(artifacts.cache_dir(self.csv_file), __version__)
+
+    def price_store(self):
+        """
+        PriceStore of every price of the csv by area and year (see price_store.py), built with a pass over the csv
+        if there isn't one for the csv as it is now
+        """
+        if price_store.is_current(self.csv_file) is False:
+            price_store.build(self.csv_file, Data.price_chunks(self, 6))
+        return price_store.PriceStore(self.csv_file)
+
+    def sales_table(self):
+        """
+        store.SalesTable of the csv, the columns as memory mapped arrays with an Area column of outward code ids.
+        Ingests the csv first if there isn't a cache of every row of it. That cache has a folder of its own, so caches of
+        filtered rows (see ingest) are left as they are.
+        """
+        if store.is_current(self.csv_file) is False:
+            Data.ingest(self)
+        table = store.SalesTable(self.csv_file)
+        if 'Area' not in table.columns():
+            table.derive('Area', 'Postcode', lambda postcodes: find_areas(pd.Series(postcodes)).values)
+        return table
+
+    def price_chunks(self, chunk_power, partition=None):
+        """
+        Area, year and price of every sale a chunk at a time, as AreaYearStats.update takes them. Taken from the
+        sales table if there is a cache of every row (see sales_table), otherwise from read_csv.
+        :param partition - one of Data.partitions to only read part of the file, None for all of it
+        :yield (areas, years, prices)
+        """
+        if (partition is not None and partition[0] == 'rows') or (partition is None and Data.cached(self)):
+            table = Data.sales_table(self)
+            start, stop = (0, None) if partition is None else partition[1:]
+            areas = table.categories('Area')
+            for block in table.blocks(['Area', 'Date_sold', 'Price'], 10 ** chunk_power, start, stop):
+                print('Chunk')
+                yield (pd.Categorical.from_codes(block['Area'], areas), store.years_of_days(block['Date_sold']),
+                       block['Price'].astype(np.int64))
+            return
+        for chunk in Data.read_csv(self, chunk_power, partition, price_columns, typed=True):
+            yield find_areas(chunk['Postcode']), get_years(chunk['Date_sold']), chunk['Price']
+
+    def cache_where(self, where=None):
+        """
+        Which columnar cache read_csv(where=where) reads: where.describe() if there is a current cache of only the rows
+        of this same filter, None for the cache of every row
+        """
+        if where is not None and store.is_current(self.csv_file, where.describe()):
+            return where.describe()
+        return None
+
+    def cached(self, where=None):
+        """
+        True if read_csv(where=where) reads from the columnar cache: there is a current cache of only the rows of this
+        same filter, or of every row
+        """
+        return store.is_current(self.csv_file, Data.cache_where(self, where))
+
+    def partitions(self, n, where=None):
+        """
+        Splits the csv into about n parts that can be read on their own with read_csv(partition=...), for handing out
+        to worker processes. Parts are row ranges of the columnar cache if it is current, otherwise byte ranges of the
+        csv that start and end on a line break.
+        :param n: number of parts wanted
+        :param where: RowFilter the parts will be read with
+        :return: list of ('rows' or 'bytes', start, stop) in file order
+        """
+        if Data.cached(self, where) is True:
+            rows = store.read_meta(self.csv_file, Data.cache_where(self, where))['rows']
+            bounds = sorted(set(rows * i // n for i in range(n + 1)))
+            kind = 'rows'
+        else:
+            size = os.path.getsize(self.csv_file)
+            bounds = [0]
+            with open(self.csv_file, 'rb') as f:
+                for i in range(1, n):
+                    f.seek(max(size * i // n - 1, 0))
+                    f.readline()
+                    bounds.append(min(f.tell(), size))
+            bounds = sorted(set(bounds + [size]))
+            kind = 'bytes'
+        return [(kind, start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    def map_partitions(self, func, workers, *args, where=None):
+        """
+        Runs func(self, *args, partition=part) for each of Data.partitions in a pool of worker processes
+        :param func: module level function or Data method (so it can be pickled)
+        :param workers: number of processes
+        :param where: RowFilter func reads the partitions with
+        :return: list of the results, in file order
+        """
+        parts = Data.partitions(self, workers, where)
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = [pool.apply_async(func, (self,) + args, {'partition': part}) for part in parts]
+            return [result.get() for result in results]
+        finally:
+            pool.close()
+            pool.join()
+
+    def ingest(self, chunk_power=6, where=None, source=None):
+        """
+        Parses the csv once and saves it as a typed columnar cache next to it (see store.py).
+        read_csv uses the cache from then on until the csv file changes.
+        :param where: RowFilter to only keep some of the rows, e.g. RowFilter(county='GREATER LONDON'). The cache is
+         then saved apart from the cache of every row and any other filter's, and only used by reads with the same
+         filter.
+        :param source: file like object giving the text of csv_file, e.g. download.Download(url, csv_file) to parse the
+         csv as it downloads. It has to have written csv_file by the time it has been read to the end.
+        :return: meta dict of the cache
+        """
+        return store.ingest(self.csv_file, Data.read_csv_text(self, chunk_power, where=where, source=source),
+                            None if where is None else where.describe())
+
+    def plaque_filter(self):
+        """RowFilter of the sales in the areas that have a plaque, the only ones the save methods use"""
+        postcodes = Data.read_bp(self)['Postcode']
+        return RowFilter(areas=find_areas(postcodes[postcodes != 'nan']).dropna())
+
     def read_bp(self):
         """Reads the bp data and makes it into a dataframe
-        Changes it by iterating over the read file and making a new data frame
+        Parsed once per Data and kept with its PlaqueMatcher, see bp_matcher.
         Drops rows that don't have a year for the plaque installation.
         :param: self and the read bp is: Index, address, person, wiki, year
         :return : DataFrame. Columns = ['Person', 'Wiki', 'Year', 'House number', 'Address list', 'Postcode']"""
-        df = pd.read_csv(self.bp_file)
+        return Data.bp_matcher(self).bp.copy()
 
-        new_df = pd.DataFrame(columns=['Person', 'Wiki', 'Year', 'Number', 'Address_list', 'Postcode'])
-        for row in df.itertuples():
-            if pd.isnull(row.Person) is False:
-                person = str(row.Person)
-            else:
-                person = np.nan
-            wiki = str(row.Wiki)
-            try:
-                year = str(pd.to_datetime(str(int(float(row.Year)))).year)
-            except ValueError:
-                year = np.nan
-
-            number = str(re.findall(r'\d+', row.Address)[0])
-            try:
-                postcode = str((re.findall(r'[A-Z]{1,2}[0-9R][0-9A-Z]? [0-9][A-Z]{2}', row.Address))[0])
-            except IndexError as lsere:
-                if str(lsere) == 'list index out of range':
-                    postcode = 'nan'
-
-            address_list = list(
-                row.Address.replace(postcode, ' ').replace(number, ' ').replace(',', '').strip().split('\n'))
-            tmp_df = pd.DataFrame([[person, wiki, year, number, address_list, postcode]],
-                                  columns=['Person', 'Wiki', 'Year', 'Number', 'Address_list', 'Postcode']
-                                  )
-            new_df = new_df.append(tmp_df, ignore_index=True)
-
-        return new_df
+    def bp_matcher(self):
+        """
+        PlaqueMatcher of the read_bp dataframe. Made once per Data and kept; made again if bp_file is changed to
+        another file or the file itself changes.
+        :return: PlaqueMatcher
+        """
+        key = (self.bp_file, store.fingerprint(self.bp_file))
+        if self.bp_cache is None or self.bp_cache[0] != key:
+            self.bp_cache = (key, PlaqueMatcher(parse_bp(pd.read_csv(self.bp_file))))
+        return self.bp_cache[1]
 
-    def exact_bp_matches(self, chunk):
+    def exact_bp_matches(self, chunk, bp=None):
         """
         Finds and returns the BP matches from a csv chunk. This is then used to look up the data
+        Matches on postcode and PAON/house number, then on any of Street, Locality or Town_City being in the address.
         :param chunk:
+        :param bp: read_bp dataframe or PlaqueMatcher, the kept one of bp_file if not given
         :return matches: dictionary - {Person: [ID, ID, ID], ..}
         """
-        # Needs to find rows that match on PAON, postcode and Street/locality/Town_City
-        # Group by postcode on both dataframes and see if there are any matches?
-        bp = Data.read_bp(self)
-        postcode_matches = pd.merge(bp, chunk, on=['Postcode'], how='inner')
-        # Make both PAON and Number to same format so they can be matched.
-        postcode_matches[['PAON', 'Number']] = postcode_matches[['PAON', 'Number']].apply(pd.to_numeric,
-                                                                                          errors='coerce')
-
-        # df is now all postcode matches
-        # See for common PAON/Number columns
-        df = postcode_matches[postcode_matches.PAON == postcode_matches.Number]
-        # If any of Street, Locality, Town_City, District or County is in the Address_list, it's a full match
-        indexes = []
-        for row in df.itertuples():
-            address_list = [item.lower() for item in row.Address_list]
-
-            land_reg_list = [row.Street, row.Locality, row.Town_City]
-            new_land_reg_list = []
-            for item in land_reg_list:
-                try:
-                    new_land_reg_list.append(item.lower())
-                except AttributeError as error:
-                    pass
-            if not any(x in new_land_reg_list for x in address_list):
-                indexes.append(row.Index)
-
-        df = df.drop(indexes)
-        df = df.dropna(subset=['Postcode', 'Street'])
-        matches = df.drop(['Address_list', 'Wiki', 'Number', 'Postcode', 'Property_type', 'Estate_Type', 'PAON', 'SAON',
-                           'Street', 'Locality', 'Town_City', 'District', 'County', 'PPD_Category', 'Record_Status',
-                           'New_build', 'Price', 'Date_sold', 'Year'], axis=1)
-        matches_dict = {}
-        for row in matches.itertuples():
-            if row.Person in matches_dict.keys():
-                matches_dict[row.Person].append(row.ID)
-            else:
-                matches_dict.update({row.Person: [row.ID]})
-
-        return matches_dict
+        matcher = Data.bp_matcher(self) if bp is None else PlaqueMatcher.of(bp)
+        return matcher.match(chunk)
 
     def all_prices_df(self):
         """Gets the price data of all area by year
         """
         median_dict = {}
-        for chunk in Data.read_csv(self, 6):
-            df = chunk.drop(['ID', 'Property_type', 'New_build', 'Estate_Type', 'PAON',
-                             'SAON', 'Street', 'Locality', 'Town_City', 'District', 'County', 'PPD_Category',
-                             'Record_Status'], 1)
-            areas = chunk['Postcode'].apply(find_area)
-            df['Postcode'] = areas
-
-            df['Date_sold'] = df['Date_sold'].apply(get_year)
+        for chunk in Data.read_csv(self, 6, columns=price_columns, typed=True):
+            df = chunk.copy()
+            df['Postcode'] = find_areas(chunk['Postcode'])
+            df['Date_sold'] = get_years(df['Date_sold'])
 
             df = df.groupby(['Postcode', 'Date_sold'])
 
@@ -291,17 +883,69 @@ class Data:
         df = pd.DataFrame.from_dict(median_dict, orient='index')
         return df
 
+    def area_year_stats(self, alpha=0.005, workers=1, partition=None):
+        """
+        Streams the csv through an AreaYearStats accumulator. Only the running totals of each area/year are held
+        so memory does not grow with the number of sales, unlike all_prices_df.
+        :param alpha: relative error bound of the medians
+        :param workers: number of processes to split the csv between
+        :param partition: only read this part of the csv (see Data.partitions)
+        :return: AreaYearStats
+        """
+        area_year = accumulators.AreaYearStats(alpha)
+        if workers > 1:
+            for part in Data.map_partitions(self, Data.area_year_stats, workers, alpha):
+                area_year.merge(part)
+            return area_year
+        for areas, years, prices in Data.price_chunks(self, 6, partition):
+            area_year.update(areas, years, prices)
+        return area_year
+
+    def exact_medians(self, area_year):
+        """
+        Second pass over the csv to get the exact median of every area/year (see accumulators.ExactMedians)
+        :param area_year: AreaYearStats from area_year_stats
+        :return: ExactMedians
+        """
+        exact = accumulators.ExactMedians(area_year)
+        for areas, years, prices in Data.price_chunks(self, 6):
+            exact.update(areas, years, prices)
+        return exact
+
     @timer
-    def house_prices_stats(self, short_cut=True):
+    def house_prices_stats(self, short_cut=True, streaming=True, median='exact', alpha=0.005, workers=1):
         """
         Gets a df that has stats for all the area/year prices. Will have the median, mean, number, sd,
         normal distribution.
-        :param short_cut: True for using the saved dataframe
+        :param short_cut: True for using the dataframe saved in the artifact cache for this csv and these parameters,
+         working it out and saving it if there isn't one
+        :param streaming: True to work the stats out from running totals (area_year_stats), False to hold every
+         price in all_prices_df and work them out from that
+        :param median: when streaming - 'exact' for a second pass over the csv that gets the exact medians, 'approx'
+         for medians from the sketch (within alpha) without the second pass
+        :param alpha: relative error bound of the approx medians
+        :param workers: number of processes for the streaming stats
         :return meadian: dataframe of stats per year/area
         """
+        if median != 'approx' and median != 'exact':
+            raise KeyError('{} not allowed. Try approx or exact'.format(median))
+
         if short_cut is True:
-            avg_prices = pd.read_pickle(resources_file + 'house_prices_stats.pkl')
-            return avg_prices
+            params = {'streaming': streaming}
+            if streaming is True:
+                params.update(median=median, alpha=alpha)
+            return Data.artifacts(self).get(
+                'house_prices_stats', lambda: Data.house_prices_stats(self, False, streaming, median, alpha, workers),
+                [self.csv_file], params)
+
+        elif streaming is True:
+            area_year = Data.area_year_stats(self, alpha, workers)
+            print('Median sketch memory {} bytes'.format(area_year.nbytes()))
+            if median == 'exact':
+                exact = Data.exact_medians(self, area_year)
+                print('Exact median memory {} bytes'.format(exact.nbytes()))
+                return area_year.to_frame(exact.medians())
+            return area_year.to_frame()
 
         else:
             df = Data.all_prices_df(self)
@@ -332,7 +976,7 @@ class Data:
     # Independent samples is two lists: BP house prices and NBP prices that are in a BP postcode
     independent_samples_data = ([], [])
 
-    def repeated_measures_save(self, chunk, avg_prices, avg_type):
+    def repeated_measures_save(self, chunk, avg_prices, avg_type, matches=None, bp=None):
         """
         Saves the data needed for a repreated measures t-test.
         Data needed is - Before and after house prices (weighted and averaged) for each BP house
@@ -343,15 +987,20 @@ class Data:
             Add weighted price to correct list
         :param: chunk
         :param: bp dtaframe
-        :param: avg prices dataframe
+        :param: avg prices dataframe or AveragePriceIndex
         :param: string of type of average you want to use: mean or median
+        :param: matches from exact_bp_matches, found from the chunk if not given
+        :param: read_bp dataframe, read from bp_file if not given
         :return: {'Person name: {'Before': [ls before prices], 'After': [ls after prices]}}
         """
         if avg_type != 'mean' and avg_type != 'median':
             raise KeyError('{} not allowed. Try mean or median'.format(avg_type))
 
-        all_matches = Data.exact_bp_matches(self, chunk)  # In dictionary form - {person: [ls of IDs]}
-        bps = Data.read_bp(self)
+        bps = Data.read_bp(self) if bp is None else bp
+        if matches is None:
+            matches = Data.exact_bp_matches(self, chunk, bp)
+        all_matches = matches  # In dictionary form - {person: [ls of IDs]}
+        avg_index = AveragePriceIndex.of(avg_prices)
         final = {}
         for key, matches in all_matches.items():
             final.update({key: {'Before': [], 'After': []}})
@@ -371,13 +1020,11 @@ class Data:
                 price = int(data.get_value(ID, 'Price'))
 
                 if year_sold < bp_year:  # Sold after bp installed
-                    avg = (price / avg_prices[(avg_prices['Area'] == area) & (avg_prices['Year'] == year_sold)].iloc[0][
-                        str(avg_type)])
+                    avg = price / avg_index.get(area, year_sold, str(avg_type))
 
                     final[key]['Before'].append(avg)
                 elif year_sold > bp_year:  # Sold before bp installed
-                    avg = (price / avg_prices[(avg_prices['Area'] == area) & (avg_prices['Year'] == year_sold)].iloc[0][
-                        str(avg_type)])
+                    avg = price / avg_index.get(area, year_sold, str(avg_type))
 
                     final[key]['After'].append(avg)
                 else:
@@ -385,17 +1032,21 @@ class Data:
 
         return final
 
-    def single_sample_save(self, chunk, avg_prices, avg_type):
+    def single_sample_save(self, chunk, avg_prices, avg_type, matches=None, bp=None):
         """
         Get all the london prices and all bp matches houses. Prices weighted by area
         pop var and pop mean have to be calculated separately and put into the equation.
         Skips houses where the blue plaque had yet to be installed
+        :param avg_prices: stats dataframe or AveragePriceIndex
+        :param matches: matches from exact_bp_matches, found from the chunk if not given
+        :param bp: read_bp dataframe, read from bp_file if not given
         :return: sample ls
         """
         if avg_type != 'mean' and avg_type != 'median':
             raise KeyError('{} not allowed. Try mean or median'.format(avg_type))
-        bps = Data.exact_bp_matches(self, chunk)
-        bp_data = Data.read_bp(self)
+        bp_data = Data.read_bp(self) if bp is None else bp
+        bps = Data.exact_bp_matches(self, chunk, bp) if matches is None else matches
+        avg_index = AveragePriceIndex.of(avg_prices)
         # Just want to find the matches and add the weighted prices
         sample = []
         for key, matches in bps.items():
@@ -406,60 +1057,72 @@ class Data:
                 area = find_area(row.get_value(ID, 'Postcode'))
                 bp_year = bp_data[(bp_data['Person'] == key)].iloc[0]['Year']
                 if int(bp_year) < int(year):  # Plaque installed before house sold    2015 < 2017 , 2015 > 2014
-                    weighted_price = price / \
-                                     avg_prices[(avg_prices['Area'] == area) & (avg_prices['Year'] == year)].iloc[0][
-                                         str(avg_type)]
+                    weighted_price = price / avg_index.get(area, year, str(avg_type))
                     sample.append(weighted_price)
                 else:
                     continue
         return sample
 
-    def independent_samples_save(self, chunk, avg_prices, avg_type):
+    def independent_samples_save(self, chunk, avg_prices, avg_type, matches=None, bp=None):
         """Two lists: exact bp prices and prices of houses within bp postcodes.
         Therefore, got to find all bp houses and then all houses that are in bp postcodes
         Skips houses where the blue plaque had yet to be installed
+        Done on whole columns: keep the sales in bp areas with isin, weight them with one look up into the average
+        prices index, then tag the bp houses by joining on an ID -> plaque year table made from the matches.
+        :param avg_prices: stats dataframe or AveragePriceIndex
+        :param matches: matches from exact_bp_matches, found from the chunk if not given
+        :param bp: read_bp dataframe, read from bp_file if not given
+        :return: ([bp house prices], [other house prices]) weighted and rounded to 4 significant figures, in chunk order
         """
         if avg_type != 'mean' and avg_type != 'median':
             raise KeyError('{} not allowed. Try mean or median'.format(avg_type))
-        bpmatches = Data.exact_bp_matches(self, chunk)
-        bp = Data.read_bp(self)
-        areas = []
-        data_set = ([], [])  # BP houses, other houses
-        # Get a list of areas to be looked at, make it a dataframe, then reduce the chunk to what I want, then iterate
-        for row in bp.itertuples():
-            area = find_area(row.Postcode)
-            areas.append(area)
-
-        for row in chunk.itertuples():
-            area = find_area(row.Postcode)
-            if area is None:
-                continue
-            else:
-                if area in areas and pd.isnull(row.Date_sold) is False and pd.isnull(row.Price) is False:
-
-                    price = float(
-                        format(row.Price /
-                               avg_prices[(avg_prices['Area'] == area) &
-                                          (avg_prices['Year'] == pd.to_datetime(row.Date_sold).year)].
-                               iloc[0][str(avg_type)],
-                               '.4g')
-                    )
-
-                    if row.ID in list(bpmatches.values())[0]:
-                        # Add to right list
-                        # Check year is after bp installation
-                        for keyperson, ids in bpmatches.items():
-                            if row.ID in ids:
-                                person = keyperson
-                                bp_year = bp[(bp['Person'] == person)].iloc[0]['Year']
-                                house_year = pd.to_datetime(row.Date_sold).year
-                                if int(bp_year) < int(house_year):  # 2015 < 2017 , 2015 > 2014
-                                    data_set[0].append(price)
-
-                    else:
-                        # Add to left list
-                        data_set[1].append(price)  # Year checking not needed as it's not a bp house.
-        return data_set
+        bpmatches = Data.exact_bp_matches(self, chunk, bp) if matches is None else matches
+        if bp is None:
+            bp = Data.read_bp(self)
+        avg_index = AveragePriceIndex.of(avg_prices)
+        areas = set(find_areas(bp['Postcode']).dropna())
+
+        chunk_areas = find_areas(chunk['Postcode'])
+        keep = chunk_areas.isin(areas) & chunk['Date_sold'].notnull() & chunk['Price'].notnull()
+        df = pd.DataFrame({'ID': chunk['ID'][keep], 'Area': chunk_areas[keep],
+                           'Year': get_years(chunk['Date_sold'][keep]), 'Price': chunk['Price'][keep]})
+        averages = avg_index.averages(df['Area'], df['Year'], str(avg_type))
+        if np.isnan(averages).any():
+            missing = df[np.isnan(averages)].iloc[0]
+            raise KeyError('No {} price for {} in {}'.format(avg_type, missing['Area'], missing['Year']))
+        df['Weighted'] = round_sig(df['Price'].values / averages, 4)
+
+        # ID -> plaque year of each person matched to it (an ID can be matched to more than one plaque)
+        plaques = pd.DataFrame([(ID, person) for person, ids in bpmatches.items() for ID in ids],
+                               columns=['ID', 'Person'])
+        plaque_years = bp.drop_duplicates('Person').set_index('Person')['Year']
+        plaques['BP_year'] = pd.to_numeric(plaques['Person'].map(plaque_years), errors='coerce')
+
+        is_bp = df['ID'].isin(plaques['ID'])
+        tagged = pd.merge(df[is_bp], plaques, on='ID', how='inner', sort=False)
+        # Only houses sold after the plaque went up. 2015 < 2017 , 2015 > 2014
+        bp_houses = tagged[tagged['BP_year'] < tagged['Year']]['Weighted']
+        other_houses = df[~is_bp]['Weighted']  # Year checking not needed as it's not a bp house.
+        return bp_houses.tolist(), other_houses.tolist()
+
+    def fused_save(self, chunk, avg_prices, avg_type, bp=None):
+        """
+        Runs the three 'save' methods on a chunk from a single scan. The chunk is matched against the bp data
+        once, then the matches are handed to each of the save methods.
+        :param chunk:
+        :param avg_prices: stats dataframe or AveragePriceIndex
+        :param avg_type: mean or median
+        :param bp: read_bp dataframe or PlaqueMatcher, the kept one of bp_file if not given
+        :return: repeated measures dict, single sample ls, independent samples tuple of ls
+        """
+        matcher = Data.bp_matcher(self) if bp is None else PlaqueMatcher.of(bp)
+        matches = matcher.match(chunk)
+        bp = matcher.bp
+        avg_prices = AveragePriceIndex.of(avg_prices)
+        repeated = Data.repeated_measures_save(self, chunk, avg_prices, avg_type, matches, bp)
+        single = Data.single_sample_save(self, chunk, avg_prices, avg_type, matches, bp)
+        independent = Data.independent_samples_save(self, chunk, avg_prices, avg_type, matches, bp)
+        return repeated, single, independent
 
     def getRepeatesMeasuresTable(self, short_cut):
         """
@@ -539,8 +1202,62 @@ class Data:
         return avg
 
 
+SampleSums = collections.namedtuple('SampleSums', ['n', 'sum_of_x', 'sum_of_x_sqr'])
+SampleSums.__doc__ = """Size, sum and sum of squares of a sample: all the t-tests need of it"""
+
+
+def sample_sums(sample):
+    """
+    SampleSums of a sample
+    :param sample: list or array of values, accumulators.SampleMoments, or a SampleSums that is given back as it is
+    :return: SampleSums
+    """
+    if isinstance(sample, SampleSums):
+        return sample
+    if isinstance(sample, accumulators.SampleMoments):
+        return SampleSums(*sample.sums())
+    values = np.asarray(sample, dtype=float)
+    return SampleSums(len(values), float(values.sum()), float(np.dot(values, values)))
+
+
+def t_sample(sample):
+    """A sample as the t-tests use it: an accumulators.SampleMoments as it is, anything else as its SampleSums"""
+    if isinstance(sample, accumulators.SampleMoments):
+        return sample
+    return sample_sums(sample)
+
+
+def sample_mean_sd(sample):
+    """
+    Mean and (n - 1) standard deviation. A SampleMoments gives its own mean and variance, so the sd has none of the
+    cancellation of working it out from the raw sums.
+    :param sample: SampleMoments, or anything sample_sums takes
+    :return: mean, sd
+    """
+    sample = t_sample(sample)
+    if sample.n < 2:
+        raise statistics.StatisticsError('variance requires at least two data points')
+    if isinstance(sample, accumulators.SampleMoments):
+        return sample.mean, math.sqrt(sample.variance())
+    mean = sample.sum_of_x / sample.n
+    return mean, math.sqrt(max(sample.sum_of_x_sqr - sample.sum_of_x * mean, 0.0) / (sample.n - 1))
+
+
+def sum_of_squares(sample):
+    """
+    ∑(x - mean)^2 of a sample, the M2 of a SampleMoments or ∑x^2 - (∑x)^2 / n of SampleSums
+    :param sample: SampleMoments, or anything sample_sums takes
+    """
+    sample = t_sample(sample)
+    if isinstance(sample, accumulators.SampleMoments):
+        return sample.M2
+    return sample.sum_of_x_sqr - ((sample.sum_of_x * sample.sum_of_x) / sample.n)
+
+
 class TTests:
-    """Holds the t-test methods"""
+    """Holds the t-test methods
+    Samples can be lists, NumPy arrays, SampleSums or accumulators.SampleMoments, so the samplers can hand over
+    running totals rather than every value."""
 
     # noinspection PyStatementEffect
     @staticmethod
@@ -548,16 +1265,14 @@ class TTests:
         """
         Repeated masures is a test of before and after a plaque is sold
         Therefore need - sample size, before mean, after mean and finally difference between before and after
-        :param: {'Person name: {'Before': [ls before prices], 'After': [ls after prices]}}
+        :param: {'Person name: {'Before': [ls before prices], 'After': [ls after prices]}}, the lists can be arrays or
+         SampleSums
         :return:t_obt and descriptive stats
         """
         # The plaque is raw so needs to reject unsuitable data points: ones with only a before/after data point
         # Data needed:
         avg_bf_ls = []  # ls of avg before scores
         avg_af_ls = []  # ls of avg after scores
-        diff_ls = []  # ls of difference in avg before after scores
-        diff_sqr_ls = []  # ls of diff scores squares
-        sample_size = 0  # sample size
         for person, bfr_aft in before_after.items():
             # bfr_aft = {'Before': [ls], 'After': [ls]}
             try:
@@ -566,25 +1281,20 @@ class TTests:
             except TypeError:
                 print('Type error, incorrect format for {} and {}'.format(person, bfr_aft))
                 continue
-            before_ls = bfr_aft['Before']
-            after_ls = bfr_aft['After']
-            if len(before_ls) != 0 and len(after_ls) != 0:
-                sample_size += 1
-                bf_avg = statistics.mean(before_ls)
-                af_avg = statistics.mean(after_ls)
-                avg_bf_ls.append(bf_avg)
-                avg_af_ls.append(af_avg)
-                diff_ls.append(bf_avg - af_avg)
-                diff_sqr_ls.append((bf_avg - af_avg) ** 2)
+            before = sample_sums(bfr_aft['Before'])
+            after = sample_sums(bfr_aft['After'])
+            if before.n != 0 and after.n != 0:
+                avg_bf_ls.append(before.sum_of_x / before.n)
+                avg_af_ls.append(after.sum_of_x / after.n)
 
+        sample_size = len(avg_bf_ls)  # sample size
         if sample_size < 2:
             return 'Error - sample size too small, only one participant'
-        before_mean = (statistics.mean(avg_bf_ls))
-        before_sd = statistics.stdev(avg_bf_ls)
-        after_mean = (statistics.mean(avg_af_ls))
-        after_sd = statistics.stdev(avg_af_ls)
-        sum_d_2 = (sum(diff_sqr_ls))  # ∑d^2
-        sum_d__2 = (sum(diff_ls) ** 2)  # (∑d)^2
+        before_mean, before_sd = sample_mean_sd(sample_sums(avg_bf_ls))
+        after_mean, after_sd = sample_mean_sd(sample_sums(avg_af_ls))
+        diff = np.array(avg_bf_ls) - np.array(avg_af_ls)  # difference in avg before after scores
+        sum_d_2 = np.dot(diff, diff)  # ∑d^2
+        sum_d__2 = diff.sum() ** 2  # (∑d)^2
         t_obt = ((before_mean - after_mean)
                  /
                  math.sqrt(
@@ -611,14 +1321,14 @@ class TTests:
     def single_sample(sample, pop_var=0.0, pop_mean=0.0):
         """
         Measures a sample against the population. The population here are the areas in which BPs exist.
-        :param sample: ls of sample instances
+        :param sample: ls, array or SampleSums of sample instances
         :param pop_var: given as raw value
         :param pop_mean: given as raw value
         :return: t_obt, df, sample_mean, pop_mean
         """
-        sample_mean = statistics.mean(sample)
-        s1 = statistics.stdev(sample)
-        sample_size = len(sample)
+        sample = t_sample(sample)
+        sample_mean, s1 = sample_mean_sd(sample)
+        sample_size = sample.n
 
         t_obt = (sample_mean - pop_mean) / math.sqrt(pop_var / sample_size)
 
@@ -639,25 +1349,20 @@ class TTests:
     def independent_samples(exp_ctr):
         """
         Measures BP properties againts other NBP properties in that postcode
-        :param exp_ctr: ([ls of experimental/exact bp values], [ls of control/area matches values])
+        :param exp_ctr: ([ls of experimental/exact bp values], [ls of control/area matches values]), each can be an
+         array or SampleSums
         :return: t-obt, df, experimental mean, control mean
         """
-        exp = exp_ctr[0]
-        ctr = exp_ctr[1]
-        xBar1 = statistics.mean(exp)
-        s1 = statistics.stdev(exp)
-        sumX1 = sum(exp)
-        sumX1sqr = sum(map(lambda x: x * x, exp))
-        n1 = len(exp)
+        exp = t_sample(exp_ctr[0])
+        ctr = t_sample(exp_ctr[1])
+        xBar1, s1 = sample_mean_sd(exp)
+        n1 = exp.n
 
-        xBar2 = statistics.mean(ctr)
-        s2 = statistics.stdev(ctr)
-        sumX2 = sum(ctr)
-        sumX2sqr = sum(map(lambda x: x * x, ctr))
-        n2 = len(ctr)
+        xBar2, s2 = sample_mean_sd(ctr)
+        n2 = ctr.n
 
         t_obt = (xBar1 - xBar2) / math.sqrt(
-            (((sumX1sqr - ((sumX1 * sumX1) / n1)) + (sumX2sqr - ((sumX2 * sumX2) / n2))) /
+            ((sum_of_squares(exp) + sum_of_squares(ctr)) /
              (n1 + n2 - 2)) * ((1 / n1) + 1 / n2)
         )
 
@@ -677,15 +1382,58 @@ class TTests:
         return round(t_obt, dp), df, round(exp_xBar, dp), round(ctr_xBar, dp)
 
 
-def runner(files, avg_prices, avg_type):
+def merge_repeated_measures(repeated_measures_data, new_data):
+    """
+    Adds the before and after lists of one chunk onto the running repeated measures dict
+    Just using update caused the keys to be replaced which is not good.
+    :param repeated_measures_data: {'Person name: {'Before': [ls], 'After': [ls]}} - added to in place
+    :param new_data: same format, from one chunk
+    :return: repeated_measures_data
+    """
+    for person, bf_af in new_data.items():
+        if person in repeated_measures_data.keys():
+            # Add the new data
+            repeated_measures_data[person]['Before'].extend(bf_af['Before'])
+            repeated_measures_data[person]['After'].extend(bf_af['After'])
+        else:
+            repeated_measures_data.update({person: bf_af})
+    return repeated_measures_data
+
+
+def runner(files, avg_prices, avg_type, fused=True, workers=1, accumulate=False, reservoir=0, partition=None):
     """
     Runs all the 'save' methods to output the three data sets
 
     :param files: Data(csv, bp)
-    :param avg_prices: stats dataframe
+    :param avg_prices: stats dataframe or AveragePriceIndex
     :param avg_type: type of average to use
+    :param fused: True to find the bp matches once per chunk and feed all three data sets from that one scan,
+     False to run each 'save' method on its own (each one re-reads the bp file and re-matches the chunk)
+    :param workers: number of processes to split the csv between. Each one returns the data sets of its part of the
+     csv and they are joined in file order.
+    :param accumulate: True for each sample as an accumulators.SampleMoments (see accumulate_data_sets) rather than
+     a list, so memory doesn't grow with the number of sales
+    :param reservoir: when accumulating, size of the random sample of each sample's values to keep for plotting
+    :param partition: only read this part of the csv (see Data.partitions)
     :return:
     """
+    avg_prices = AveragePriceIndex.of(avg_prices)
+    if workers > 1:
+        parts = Data.map_partitions(files, runner, workers, avg_prices, avg_type, fused, 1, accumulate, reservoir,
+                                    where=Data.plaque_filter(files))
+    else:
+        parts = runner_chunks(files, avg_prices, avg_type, fused, partition)
+    if accumulate is True:
+        return accumulate_data_sets(parts, reservoir)
+    return join_data_sets(parts)
+
+
+def join_data_sets(parts):
+    """
+    Joins the data sets of chunks or partitions, in order
+    :param parts: iterable of (repeated measures dict, single sample ls, independent samples tuple of ls)
+    :return: repeated measures dict, single sample ls, independent samples tuple of ls
+    """
     # Repeated is dict of before and after installation average prices of a BP house
     repeated_measures_data = {}
     # Single sample is one list: sample prices. Pop var and mean are calculated sepetately
@@ -693,41 +1441,89 @@ def runner(files, avg_prices, avg_type):
     # Independent samples is two lists: BP house prices and NBP prices that are in a BP postcode
     independent_samples_data = ([], [])
 
-    for chunk in Data.read_csv(files, 6):
-        single_sample_data.extend(Data.single_sample_save(files, chunk, avg_prices, avg_type))
+    for repeated, single, independent in parts:
+        single_sample_data.extend(single)
+        merge_repeated_measures(repeated_measures_data, repeated)
+        # Stuff for independent samples t-test - basically properly updating the data
+        independent_samples_data[0].extend(independent[0])
+        independent_samples_data[1].extend(independent[1])
 
-        for person, bf_af in Data.repeated_measures_save(files, chunk, avg_prices, avg_type).items():
-            # Just using update caused the keys to be replaced which is not good.
-            if person in Data.repeated_measures_data.keys():
-                # Add the new data
-                repeated_measures_data[person]['Before'].extend(bf_af['Before'])
-                repeated_measures_data[person]['After'].extend(bf_af['After'])
-            else:
-                repeated_measures_data.update({person: bf_af})
+    return repeated_measures_data, single_sample_data, independent_samples_data
 
-        # Stuff for independent samples t-test - basically properly updating the data
-        data = (Data.independent_samples_save(files, chunk, avg_prices, avg_type))
-        independent_samples_data[0].extend(data[0])
-        independent_samples_data[1].extend(data[1])
+
+def accumulate_data_sets(parts, reservoir=0):
+    """
+    join_data_sets with every sample added to an accumulators.SampleMoments instead of a list. The t-tests take
+    them as they are.
+    :param parts: iterable of data sets of chunks (lists) or of partitions (lists or SampleMoments)
+    :param reservoir: size of the random sample of each sample's values to keep (SampleMoments.reservoir), 0 for none
+    :return: repeated measures {'Person name: {'Before': SampleMoments, 'After': SampleMoments}}, single sample
+     SampleMoments, independent samples tuple of SampleMoments
+    """
+    repeated_measures_data = {}
+    single_sample_data = accumulators.SampleMoments(reservoir)
+    independent_samples_data = (accumulators.SampleMoments(reservoir), accumulators.SampleMoments(reservoir))
+
+    for repeated, single, independent in parts:
+        single_sample_data.add(single)
+        for person, bf_af in repeated.items():
+            if person not in repeated_measures_data:
+                repeated_measures_data[person] = {'Before': accumulators.SampleMoments(reservoir),
+                                                  'After': accumulators.SampleMoments(reservoir)}
+            repeated_measures_data[person]['Before'].add(bf_af['Before'])
+            repeated_measures_data[person]['After'].add(bf_af['After'])
+        independent_samples_data[0].add(independent[0])
+        independent_samples_data[1].add(independent[1])
 
     return repeated_measures_data, single_sample_data, independent_samples_data
 
 
+def runner_chunks(files, avg_prices, avg_type, fused=True, partition=None, chunks=None):
+    """
+    Yields the three data sets of each chunk for runner. Only the sales in plaque areas are read.
+    :param chunks: chunks of sales to use instead of reading the csv (e.g. IncrementalState.plaque_sales)
+    :yield: repeated measures dict, single sample ls, independent samples tuple of ls
+    """
+    bp = Data.bp_matcher(files) if fused is True else None
+    if chunks is None:
+        chunks = Data.read_csv(files, 6, partition, match_columns, typed=True, where=Data.plaque_filter(files))
+    for chunk in chunks:
+        if fused is True:
+            yield Data.fused_save(files, chunk, avg_prices, avg_type, bp)
+        else:
+            single = Data.single_sample_save(files, chunk, avg_prices, avg_type)
+            repeated = Data.repeated_measures_save(files, chunk, avg_prices, avg_type)
+            independent = Data.independent_samples_save(files, chunk, avg_prices, avg_type)
+            yield repeated, single, independent
+
+
 @timer
-def main(files, avg_type, shortcut=False):
+def main(files, avg_type, shortcut=False, fused=True, workers=1, median='exact'):
     """
     Runs all t-tests
     :param files:
     :param shortcut:
     :param avg_type:
+    :param fused: use the single pass scan in runner (see runner)
+    :param workers: number of processes to run the analysis on
+    :param median: 'exact' or 'approx' medians of the area/year prices, see house_prices_stats
     :return: t-test results - printed out
     """
 
     print("""Beginning running of analysis...""")
-    avg_prices = Data.house_prices_stats(files, shortcut)
+    avg_prices = Data.house_prices_stats(files, shortcut, median=median, workers=workers)
+    avg_index = AveragePriceIndex(avg_prices)
 
-    r, s, i = runner(files, avg_prices, avg_type)
+    r, s, i = runner(files, avg_index, avg_type, fused, workers, accumulate=True)
+    return run_t_tests(avg_prices, r, s, i)
 
+
+def run_t_tests(avg_prices, r, s, i):
+    """
+    Runs the three t-tests on the data sets from runner
+    :param avg_prices: stats dataframe from house_prices_stats
+    :return: t-test results
+    """
     print('Calculating populations variance and mean')
     pop_var, pop_mean = population_variation(avg_prices)
 
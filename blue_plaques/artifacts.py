@@ -0,0 +1,200 @@
+#! /usr/local/bin/python3.6
+
+"""
+Cache of the results worked out from the price paid csv, e.g. the house_prices_stats dataframe.
+
+Each result is saved under a key made from its name, the fingerprints of the files it was worked out from (see
+store.fingerprint), the version of the code and the parameters it was worked out with, so a result is only used
+again for the same files, code and parameters. Asking for a result that isn't there works it out and saves it.
+
+Every result is a folder in the cache folder (pp-complete.csv -> pp-complete.csv.artifacts/) named
+name-key/ holding a meta.json and, for a dataframe, each column and the index as its own .npy file (strings as
+fixed width unicode) so loading is a read of the arrays. Anything else is pickled. When the cache is bigger than
+max_bytes the results used longest ago are deleted.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from blue_plaques.blue_plaques import store
+
+
+FORMAT_VERSION = 1
+MAX_BYTES = 2 ** 30
+
+
+def cache_dir(csv_file):
+    """Folder the results worked out from csv_file are saved in"""
+    return '{}.artifacts/'.format(csv_file)
+
+
+def folder_size(folder):
+    """Bytes of the files in folder"""
+    return sum(entry.stat().st_size for entry in os.scandir(folder) if entry.is_file())
+
+
+class ArtifactCache:
+    """
+    Results saved on disk by name, input files, code version and parameters
+    :param folder: folder to save the results in
+    :param version: version of the code working the results out, results of other versions are not used
+    :param max_bytes: size the cache is cut back to after a result is saved
+    """
+
+    def __init__(self, folder, version, max_bytes=MAX_BYTES):
+        if folder[-1:] != '/':
+            folder = folder + '/'
+        self.folder = folder
+        self.version = version
+        self.max_bytes = max_bytes
+
+    def key(self, name, inputs=(), params=None):
+        """
+        Key of a result
+        :param name: what the result is, e.g. 'house_prices_stats'
+        :param inputs: paths of the files it is worked out from
+        :param params: dict of the parameters it is worked out with, json types only
+        :return: str - name-hash
+        """
+        record = {'name': name, 'version': self.version, 'format': FORMAT_VERSION, 'params': params or {},
+                  'inputs': [[os.path.abspath(path), store.fingerprint(path)] for path in inputs]}
+        digest = hashlib.sha1(json.dumps(record, sort_keys=True).encode()).hexdigest()
+        return '{}-{}'.format(name, digest)
+
+    def get(self, name, build, inputs=(), params=None):
+        """
+        Returns the saved result, or works it out with build() and saves it if there isn't one
+        :param build: function with no arguments that works the result out
+        :return: the result
+        """
+        key = ArtifactCache.key(self, name, inputs, params)
+        found = ArtifactCache.load(self, key)
+        if found is not None:
+            return found[0]
+        value = build()
+        ArtifactCache.put(self, key, value, {'name': name, 'params': params or {}, 'inputs': list(inputs)})
+        return value
+
+    def load(self, key):
+        """
+        Loads a saved result and marks it as just used
+        :return: (result,) or None if there is no result saved under key
+        """
+        path = self.folder + key + '/'
+        try:
+            with open(path + 'meta.json') as f:
+                meta = json.load(f)
+        except (IOError, ValueError):
+            return None
+        os.utime(path + 'meta.json')
+        if meta['kind'] == 'pickle':
+            return pd.read_pickle(path + 'value.pkl'),
+        columns = [load_array(path, str(i), dtype) for i, dtype in enumerate(meta['dtypes'])]
+        if meta['index'] == 'range':
+            index = pd.RangeIndex(meta['rows'], name=meta['index_name'])
+        else:
+            index = pd.Index(load_array(path, 'index', meta['index']), name=meta['index_name'])
+        df = pd.DataFrame(dict(zip(range(len(columns)), columns)), index=index)
+        df.columns = meta['columns']
+        return df,
+
+    def put(self, key, value, info=None):
+        """
+        Saves value under key and cuts the cache back to max_bytes
+        :param info: dict saved in the meta.json to say where the result came from
+        """
+        path = self.folder + key + '/'
+        tmp = self.folder + key + '.tmp/'
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+        meta = {'key': key, 'version': self.version, 'info': info or {}}
+        if is_plain_frame(value):
+            meta['kind'] = 'frame'
+            meta['columns'] = [column.item() if isinstance(column, np.generic) else column for column in value.columns]
+            meta['dtypes'] = [save_array(tmp, str(i), value.iloc[:, i]) for i in range(value.shape[1])]
+            meta['index_name'] = value.index.name
+            meta['rows'] = len(value)
+            if isinstance(value.index, pd.RangeIndex) and value.index.equals(pd.RangeIndex(len(value))):
+                meta['index'] = 'range'
+            else:
+                meta['index'] = save_array(tmp, 'index', value.index)
+        else:
+            meta['kind'] = 'pickle'
+            pd.to_pickle(value, tmp + 'value.pkl')
+        with open(tmp + 'meta.json', 'w') as f:
+            json.dump(meta, f)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(tmp, path)
+        ArtifactCache.evict(self, keep=key)
+
+    def entries(self):
+        """
+        Saved results, used longest ago first
+        :return: list of (key, last used time, bytes)
+        """
+        if os.path.exists(self.folder) is False:
+            return []
+        found = []
+        for entry in os.scandir(self.folder):
+            meta = entry.path + '/meta.json'
+            if entry.is_dir() and os.path.exists(meta):
+                found.append((entry.name, os.stat(meta).st_mtime, folder_size(entry.path)))
+        return sorted(found, key=lambda e: e[1])
+
+    def evict(self, keep=None):
+        """Deletes the results used longest ago until the cache is no bigger than max_bytes, never deleting keep"""
+        found = ArtifactCache.entries(self)
+        total = sum(e[2] for e in found)
+        for key, used, size in found:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self.folder + key)
+            total -= size
+
+    def clear(self):
+        """Deletes every saved result"""
+        if os.path.exists(self.folder):
+            shutil.rmtree(self.folder)
+
+
+def is_plain_frame(value):
+    """True if value is a dataframe that can be saved as arrays: flat columns and index of numbers, dates or strings"""
+    if isinstance(value, pd.DataFrame) is False or isinstance(value.columns, pd.MultiIndex):
+        return False
+    if isinstance(value.index, pd.MultiIndex) or value.columns.is_unique is False:
+        return False
+    for column in value.columns:
+        if isinstance(column, (str, int, np.integer)) is False:
+            return False
+    arrays = [value.iloc[:, i] for i in range(value.shape[1])] + [value.index]
+    for array in arrays:
+        if array.dtype == object:
+            if pd.api.types.infer_dtype(array, skipna=False) not in ('string', 'empty'):
+                return False
+        elif isinstance(array.dtype, np.dtype) is False or array.dtype.kind not in 'biufM':
+            return False
+    return True
+
+
+def save_array(folder, name, values):
+    """Saves the values of a column or index as name.npy and returns the dtype to load them back as"""
+    values = np.asarray(values)
+    if values.dtype == object:
+        np.save('{}{}.npy'.format(folder, name), values.astype(str))
+        return 'object'
+    np.save('{}{}.npy'.format(folder, name), values)
+    return str(values.dtype)
+
+
+def load_array(folder, name, dtype):
+    values = np.load('{}{}.npy'.format(folder, name))
+    return values.astype(object) if dtype == 'object' else values
@@ -10,12 +10,15 @@ Normaliser takes wiki_bp_data.csv to make normalised_bp_data.csv with PAON, Stre
 """
 
 import os
-import re
 import ssl
 import urllib.request
 
+from blue_plaques import address_parser
+from blue_plaques import crawler
+from blue_plaques import http_cache
+from blue_plaques import plaque_refresh
 from blue_plaques import tools
-from utils.web import get_soup as soups
+from blue_plaques import wiki_tables
 import pandas as pd
 import logging
 
@@ -32,11 +35,20 @@ file_handler.setLevel(logging.DEBUG)
 
 resources_file = '{}/Resources/'.format(os.path.dirname(os.path.dirname(__file__)))
 
+plaque_urls = ['https://en.wikipedia.org/wiki/List_of_blue_plaques',  # The non london plaques
+               'https://en.wikipedia.org/wiki/List_of_English_Heritage_blue_plaques_in_London',
+               'https://en.wikipedia.org/wiki/List_of_English_Heritage_blue_plaques_in_the_Royal_Borough_of_Kensington_and_Chelsea',
+               'https://en.wikipedia.org/wiki/List_of_English_Heritage_blue_plaques_in_the_London_Borough_of_Camden',
+               'https://en.wikipedia.org/wiki/List_of_English_Heritage_blue_plaques_in_the_City_of_Westminster'
+               ]
+wiki_cache_dir = '{}wiki_cache/'.format(resources_file)
+plaque_state_file = '{}plaque_state.json'.format(resources_file)
+
 
 class PlaqueScrape:
     """Class for scraping BP data from wikipedia
     Gives person, year, address, person_year, wiki columns.
-    Uses cached wiki files.
+    Uses cached wiki files, see http_cache. offline=True only uses the cached files.
     'https://en.wikipedia.org/wiki/List_of_blue_plaques',  # The non london plaques
     'https://en.wikipedia.org/wiki/List_of_English_Heritage_blue_plaques_in_London',
     'https://en.wikipedia.org/wiki/List_of_English_Heritage_blue_plaques_in_the_Royal_Borough_of_Kensington_and_Chelsea',
@@ -44,111 +56,32 @@ class PlaqueScrape:
     'https://en.wikipedia.org/wiki/List_of_English_Heritage_blue_plaques_in_the_City_of_Westminster'
     """
 
-    def __init__(self):
+    def __init__(self, offline=False):
         self.savefile = '{}wiki_bp_data.csv'.format(resources_file)
+        self.cache = http_cache.ResponseCache(wiki_cache_dir, offline)
 
-    @staticmethod
-    def string_clean(string, person):
-        """Removes all crap in brackets and other clutter"""
-        string = string.strip()
-        string = string.replace('–', '-')
-        regex = re.compile(r'\(\w+\)')
-        result = re.findall(regex, string)
-        for item in result:
-            string = string.replace(item, ' ')
-
-        stuff_to_remove = ['\n', '\xa0', '(', ')']
-        for item in stuff_to_remove:
-            string = string.replace(item, ' ')
-
-        if person is True:
-            # Remove yyyy-yyyy dates
-            regex = re.compile(r'\d\d\d\d-\d\d\d\d')
-            result = re.findall(regex, string)
-            for item in result:
-                string = string.replace(item, ' ')
-        return string
-
-    @staticmethod
-    def table_scrape(table):
-        """
-        Function takes in wiki table and outputs list of dictionaries
-        :param table: wiki table
-        :return: [{person, wiki, address, year}, ]
-        """
-        data_list = []  # list of dictionaries [{person, wiki, address, year}, ]
-        wiki_head = 'https://en.wikipedia.org'
-        head = table.find_all('tr', {'class': 'vevent'})
-        if head != []:
-            # Then it's a sortable table
-            rows = table.find_all('tr', {'class': 'vevent'})
-            for row in rows:  # No need to skip as vevent missed the heading
-                columns = row.find_all(['th', 'td'])
-                person = columns[0].text  # The person's name is the first column
-                try:
-                    persons_wiki = wiki_head + columns[0].find('a').get('href')
-                except:
-                    persons_wiki = None
-
-                address = columns[2].text  # Third column is the address
-                year = columns[3].text  # 4th column is the year
-
-                if columns[2].find_all('span', {'class': 'plainlinks nourlexpansion'}) != []:
-                    coord = columns[2].find_all('span', {'class': 'plainlinks nourlexpansion'})
-                    address = address.replace(coord[0].text, '')
-                person = PlaqueScrape.string_clean(person, True)
-                year = PlaqueScrape.string_clean(year, False)
-                data_list.append({'person': person, 'wiki': persons_wiki, 'address': address, 'year': year})
-
-        else:
-            # It's a normal table
-            # Headings should always be Person, Inscription, Location, Year, Photo, Sometimes other stuff.
-            rows = table.find_all('tr')
-            heading = rows[0]
-            for row in rows[1:]:  # First row is the heading
-                columns = row.find_all('td')
-                person = columns[0].text
-                try:
-                    persons_wiki = wiki_head + columns[0].find('a').get('href')
-                except AttributeError:
-                    persons_wiki = None
-                if len(columns) == 1:
-                    address = None
-                    year = None
-                else:
-                    address = columns[2].text
-                    year = columns[3].text
-                    year = PlaqueScrape.string_clean(year, False)
-                person = PlaqueScrape.string_clean(person, True)
-                data_list.append({'person': person, 'wiki': persons_wiki, 'address': address, 'year': year})
-        return data_list
+    # The parsing of the pages is in wiki_tables, with a bs4 and a fast backend
+    string_clean = staticmethod(wiki_tables.string_clean)
+    table_scrape = staticmethod(wiki_tables.table_scrape)
+    page_rows = staticmethod(wiki_tables.page_rows)
+    page_links = staticmethod(wiki_tables.page_links)
 
     @staticmethod
-    def plaque_scrape(wiki_url):
+    def plaque_scrape(wiki_url, cache=None, backend='fast'):
         """
         Takes wikipedia url and returns list of dicts
         :param wiki_url:
+        :param cache: http_cache.ResponseCache the pages are fetched through, the one in wiki_cache_dir if not given
+        :param backend: parser of the pages, see wiki_tables.parse_page
         :return:
         """
-        wiki_head = 'https://en.wikipedia.org'
-        soup = soups(wiki_url)
-
-        data = []  # [{person, wiki, address, year}, ]
-        # Find all tables in this main page
-        tables = soup.find_all('table', {'class': 'wikitable'})
-        # First column is always the person it's for.
-        # Location is always 3rd column and year is always 4th
-        for table in tables:
-            data.extend(PlaqueScrape.table_scrape(table))
+        if cache is None:
+            cache = http_cache.ResponseCache(wiki_cache_dir)
+        data, links = wiki_tables.parse_page(cache.get(wiki_url), backend)  # [{person, wiki, address, year}, ]
 
         # Done with this page. Now going onto the other pages.
-        other_links = soup.find_all('div', {'class': 'hatnote navigation-not-searchable'})
-        for link in other_links:
-            url = wiki_head + (link.find('a').get('href'))
-            soup = soups(url)
-            tables = soup.find_all('table', {'class': 'wikitable'})
-            for table in tables:
-                data.extend(PlaqueScrape.table_scrape(table))
+        for url in links:
+            data.extend(wiki_tables.parse_page(cache.get(url), backend)[0])
 
         return data
 
@@ -156,19 +89,25 @@ class PlaqueScrape:
     def person_year(row):
         return '{}_{}'.format(row['person'], row['year'].year)
 
-    def main(self):
+    def main(self, concurrency=1, backend='fast'):
         """Scrapes and saves the data from url to defined folder
-        :param: list of urls to scrape
+        :param concurrency: pages fetched at once. More than 1 crawls the pages with crawler.crawl_pages, the rows
+         are the same as fetching them one at a time.
+        :param backend: parser of the pages, 'fast' or 'bs4', both give the same rows
         :param: where to store the dataframe """
-        urls = ['https://en.wikipedia.org/wiki/List_of_blue_plaques',  # The non london plaques
-                'https://en.wikipedia.org/wiki/List_of_English_Heritage_blue_plaques_in_London',
-                'https://en.wikipedia.org/wiki/List_of_English_Heritage_blue_plaques_in_the_Royal_Borough_of_Kensington_and_Chelsea',
-                'https://en.wikipedia.org/wiki/List_of_English_Heritage_blue_plaques_in_the_London_Borough_of_Camden',
-                'https://en.wikipedia.org/wiki/List_of_English_Heritage_blue_plaques_in_the_City_of_Westminster'
-                ]
-        data = []  # [{person, ...}]
-        for url in urls:
-            data.extend(PlaqueScrape.plaque_scrape(url))
+        if concurrency > 1:
+            data = crawler.crawl_pages(plaque_urls, wiki_tables.BACKENDS[backend], concurrency, cache=self.cache)
+        else:
+            data = []  # [{person, ...}]
+            for url in plaque_urls:
+                data.extend(PlaqueScrape.plaque_scrape(url, self.cache, backend))
+        df = PlaqueScrape.to_df(data)
+        df.to_csv(self.savefile)
+        return df
+
+    @staticmethod
+    def to_df(data):
+        """Dataframe of the scraped rows, as saved in wiki_bp_data.csv"""
         df = pd.DataFrame(data)
         df['year'] = pd.to_datetime(df['year'], errors='coerce', format='%Y')
         df = df.drop_duplicates()
@@ -177,9 +116,27 @@ class PlaqueScrape:
 
         # Make a new column that is person_year that can allow for dealing with legit duplicates
         # df['person_year'] = df.apply(PlaqueScrape.person_year, axis=1)
+        return df
 
+    def refresh(self, backend='fast', files=None):
+        """Scrapes again parsing only the pages that changed since the last refresh, see plaque_refresh
+        :param backend: parser of the pages, 'fast' or 'bs4'
+        :param files: analysis_3.Data to match the added plaques against its sales, None not to match them
+        :return: (dataframe as main, plaques added, plaques removed)"""
+        state = plaque_refresh.PlaqueState.load(plaque_state_file)
+        data, changed = state.refresh(plaque_urls, self.cache.get, backend)
+        logger.info(f'{len(changed)} pages changed: {changed}')
+        df = PlaqueScrape.to_df(data)
+        if os.path.exists(self.savefile):
+            old = pd.read_csv(self.savefile, index_col=0)
+        else:
+            old = pd.DataFrame(columns=df.columns)
+        added, removed = plaque_refresh.diff_rows(old, df)
+        if files is not None:
+            state.update_matches(files, df, added, removed)
         df.to_csv(self.savefile)
-        return df
+        state.save()
+        return df, added, removed
 
 
 class NormaliseDF:
@@ -193,14 +150,10 @@ class NormaliseDF:
         if addresses_column_name not in df.columns:
             raise TypeError('Incorrect Column Name')
         self.pp = tools.read_pp()
+        self.parser = address_parser.AddressParser(self.pp)
 
-    @staticmethod
-    def get_postcode(address):
-        pc = re.findall(r'[A-Z]{1,2}[0-9R][0-9A-Z]? [0-9][A-Z]{2}', address)
-        if len(pc) == 0:
-            return ''
-        else:
-            return pc[0].strip()
+    # The parsing of the addresses is in address_parser, each address is parsed in one go
+    get_postcode = staticmethod(address_parser.get_postcode)
 
     def get_paon(self, address):
         """
@@ -208,57 +161,17 @@ class NormaliseDF:
         :param address:
         :return:
         """
-        postcode = self.get_postcode(address)
-        address = address.upper().replace(postcode, ' ').strip()
-
-        if re.match(r'[0-9]+ ?- ?[0-9]+', address):  # num - num
-            a, b = re.match(r'[0-9]+ ?- ?[0-9]+', address)[0].split('-')
-            return f'{a.strip()} - {b.strip()}'.strip()
-
-        elif re.match(r'[0-9]+[A-Z]? ', address):  # num or num letter
-            return re.match(r'[0-9]+[A-Z]? ', address)[0].strip()
-
-        elif re.match(r'[A-Z ]+, [0-9]+ ?- ?[0-9]+', address):  # name, num/num-num
-            a, b = re.search(r'[0-9]+ ?- ?[0-9]+', address)[0].split('-')
-            return f'{re.match(r"[A-Z ]+,", address)[0]} {a.strip()} - {b.strip()}'
-
-        elif re.match(r'[A-Z ]+, [0-9]+ ', address):  # name, num/num-num
-            return f'{re.match(r"[A-Z ]+, [0-9]+ ", address)[0]}'.strip()
-
-        else:
-            paons = list(set(self.pp.loc[self.pp['PAON'] == self.get_postcode(address)]['Street'].tolist()))
-            for paon in paons:
-                if paon in address:
-                    return paon
-        return None
+        return self.parser.get_paon(address)
 
     def get_street(self, address):
-        address = address.upper().replace(self.get_postcode(address), '')
-
-        streets = list(set(self.pp.loc[self.pp['Postcode'] == self.get_postcode(address)]['Street'].tolist()))
-        streets = [x for x in streets if str(x) != 'nan']
-        if len(streets) == 1:
-            return streets[0]
-
-        for street in streets:
-            if street.replace("'", ' ') in address.replace("'", ' '):
-                return street
-        street_names = ['TERRACE', 'COURT', 'SQUARE', 'GATE', 'PLACE', 'ROAD', 'LANE', 'WALK', 'CRESCENT', 'AVENUE']
-        for s in street_names:
-            if len(re.findall(r'[A-Z ]+ {}'.format(s), address)) > 0:
-                return re.findall(r'[A-Z ]+ {}'.format(s), address)[0]
-        return None
+        return self.parser.get_street(address)
 
     def parse_address(self, address):
         """
         Gets the paon, street and postcode from an address
         :return:
         """
-        postcode = self.get_postcode(address)
-        street = self.get_street(address)
-        paon = self.get_paon(address)
-
-        return paon, street, postcode
+        return self.parser.parse(address)
 
     def add_paon_street_pc_to_df(self, addresses):
         bp = self.df
@@ -289,6 +202,20 @@ class NormaliseDF:
         self.df.to_csv(f'{resources_file}/normalised_bp_data.csv')
         return self.df
 
+    def refresh(self, removed):
+        """
+        Normalises only the plaques in self.df, the added ones from PlaqueScrape.refresh, and puts them into
+        normalised_bp_data.csv in place of the removed ones
+        :param removed: plaques removed, from PlaqueScrape.refresh
+        :return: the whole normalised dataframe
+        """
+        normalised = pd.read_csv(f'{resources_file}/normalised_bp_data.csv')
+        normalised = normalised.drop(columns=[c for c in normalised.columns if c.startswith('Unnamed')])
+        if len(self.df) > 0:
+            self.df = self.add_paon_street_pc_to_df(self.df[self.address_column].tolist())
+        normalised = plaque_refresh.update_normalised(normalised, self.df, removed)
+        normalised.to_csv(f'{resources_file}/normalised_bp_data.csv')
+        return normalised
 
 if __name__ == '__main__':
     pd.set_option('display.max_columns', 100)
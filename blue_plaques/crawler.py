@@ -0,0 +1,170 @@
+#! /usr/local/bin/python3.6
+
+"""
+Concurrent crawl of the wikipedia plaque lists.
+
+The serial scrape fetches each list page, then each page it links to, one at a time on a new connection. Crawler
+fetches up to concurrency pages at once from a pool of threads sharing one requests session, so connections to a
+host are kept alive and used again. Each page is parsed as soon as it comes in while the others are still being
+fetched. Requests to a host are spaced at least 1 / rate seconds apart so the crawl is polite to wikipedia, and a
+failed request (dropped connection, 429 or 5xx) is tried again after a wait that doubles each time. Given an
+http_cache.ResponseCache the pages are saved to and checked against it, and an offline cache makes no requests.
+
+    data = crawl_pages(urls, wiki_tables.fast_page)
+"""
+
+import asyncio
+import concurrent.futures
+import time
+import urllib.parse
+
+import requests
+
+from blue_plaques.blue_plaques import http_cache
+
+
+CONCURRENCY = 8
+RATE = 5.0  # requests per second per host
+RETRIES = 3
+BACKOFF = 0.5  # seconds before the first retry
+MAX_WAIT = 30.0
+TIMEOUT = 60
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class Crawler:
+    """
+    Fetches pages concurrently, to be used from a running event loop
+    :param concurrency: most requests open at once, also the number of threads and of kept alive connections per host
+    :param rate: most requests started per second to each host
+    :param retries: times a failed request is tried again
+    :param backoff: wait before the first retry, doubled for each one after
+    :param session: requests session to use, a new one if not given
+    :param cache: http_cache.ResponseCache to save the pages in, None to not save them
+    """
+
+    def __init__(self, concurrency=CONCURRENCY, rate=RATE, retries=RETRIES, backoff=BACKOFF, session=None,
+                 cache=None):
+        self.concurrency = concurrency
+        self.interval = 1 / rate if rate else 0.0
+        self.retries = retries
+        self.backoff = backoff
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update(http_cache.HEADERS)
+        self.session = session
+        self.cache = cache
+        self.executor = concurrent.futures.ThreadPoolExecutor(concurrency)
+        self.slots = None
+        self.hosts = {}  # host: [lock, time the next request to it can start]
+        self.requests = 0
+
+    async def wait_turn(self, url):
+        """Waits until a request to the host of url is allowed by the rate"""
+        host = urllib.parse.urlsplit(url).netloc
+        if host not in self.hosts:
+            self.hosts[host] = [asyncio.Lock(), 0.0]
+        lock_next = self.hosts[host]
+        async with lock_next[0]:
+            wait = lock_next[1] - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            lock_next[1] = time.monotonic() + self.interval
+
+    async def fetch(self, url):
+        """
+        Gets url, trying again after a wait if it fails
+        :return: text of the page
+        """
+        headers = {}
+        if self.cache is not None:
+            text = http_cache.ResponseCache.fresh(self.cache, url)
+            if text is not None:
+                return text
+            headers = http_cache.ResponseCache.conditional_headers(self.cache, url)
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.concurrency)
+        loop = asyncio.get_event_loop()
+        attempt = 0
+        while True:
+            wait = self.backoff * 2 ** attempt
+            async with self.slots:
+                await Crawler.wait_turn(self, url)
+                self.requests += 1
+                try:
+                    response = await loop.run_in_executor(self.executor, lambda: self.session.get(
+                        url, headers=headers, timeout=TIMEOUT))
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    response, error = None, e
+                else:
+                    error = None
+                    if response.status_code in RETRY_STATUS:
+                        error = requests.exceptions.HTTPError('{} from {}'.format(response.status_code, url))
+                        retry_after = response.headers.get('Retry-After', '')
+                        if retry_after.isdigit():
+                            wait = max(wait, int(retry_after))
+                    elif self.cache is not None:
+                        return http_cache.ResponseCache.store(self.cache, url, response)
+                    else:
+                        response.raise_for_status()
+                        return response.text
+            attempt += 1
+            if attempt > self.retries:
+                raise IOError('Gave up on {} after {} tries: {}'.format(url, attempt, error))
+            await asyncio.sleep(min(wait, MAX_WAIT))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+
+async def crawl(crawler, urls, parse_page):
+    """
+    Parses each url and the pages it links to, fetching every page at most once
+    :param crawler: Crawler
+    :param urls: list of start pages
+    :param parse_page: function taking the html of a page and returning (list of rows, urls of the pages it links to),
+     like wiki_tables.fast_page. Links are only followed from the start pages.
+    :return: list of rows, in the order a serial scrape of urls gives: the rows of each start page then the rows of
+     the pages it links to
+    """
+    visits = {}
+
+    async def visit(url):
+        return parse_page(await Crawler.fetch(crawler, url))
+
+    def task(url):
+        # Each page is fetched once, even if it is a start page and linked to from another
+        if url not in visits:
+            visits[url] = asyncio.ensure_future(visit(url))
+        return visits[url]
+
+    async def crawl_start(url):
+        rows, follow = await task(url)
+        rows = list(rows)
+        for linked_rows, _ in await asyncio.gather(*[task(link) for link in follow]):
+            rows.extend(linked_rows)
+        return rows
+
+    data = []
+    for rows in await asyncio.gather(*[crawl_start(url) for url in urls]):
+        data.extend(rows)
+    return data
+
+
+def crawl_pages(urls, parse_page, concurrency=CONCURRENCY, rate=RATE, retries=RETRIES, backoff=BACKOFF,
+                session=None, cache=None):
+    """
+    Runs crawl in a new event loop, see crawl and Crawler
+    :return: list of rows
+    """
+    crawler = Crawler(concurrency, rate, retries, backoff, session, cache)
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(crawl(crawler, urls, parse_page))
+    finally:
+        loop.close()
+        crawler.close()
@@ -0,0 +1,183 @@
+#! /usr/local/bin/python3.6
+
+"""
+Streaming download of the land registry price paid csv.
+
+pp-complete.csv is several GB so it is never held in memory: it is written to csv_file + '.part' a block at a time
+and renamed to csv_file once every byte is there. If the connection drops the download carries on from the bytes it
+has with an HTTP Range request, and a .part file left by an earlier run is carried on from the same way. The size is
+checked against the one the server gave before the file is renamed.
+
+Download is also a file like object, so the csv can be parsed while it comes in:
+    Data.ingest(files, source=Download(csv_url, files.csv_file))
+"""
+
+import io
+import os
+import re
+
+import requests
+
+
+BLOCK = 2 ** 20
+RETRIES = 5
+TIMEOUT = 60
+
+
+class Download(io.RawIOBase):
+    """
+    Reads url, writing what is read to path as it goes. Reading it to the end finishes the download.
+    :param url:
+    :param path: file to save to
+    :param block: bytes asked for from the connection at a time, so at most this is held in memory
+    :param retries: times to reconnect after the connection drops without any bytes coming in between
+    :param session: requests session to use, a new one if not given
+    """
+
+    def __init__(self, url, path, block=BLOCK, retries=RETRIES, session=None):
+        super().__init__()
+        self.url = url
+        self.path = path
+        self.part = path + '.part'
+        self.block = block
+        self.retries = retries
+        self.session = requests.Session() if session is None else session
+        # Carry on from a .part file left by an earlier run
+        self.file = open(self.part, 'ab')
+        self.done = self.file.tell()
+        self.resumed = self.done
+        self.sent = 0  # Bytes handed to the reader
+        self.pending = b''  # Block fetched but not all handed to the reader yet
+        self.offset = 0
+        self.skip = 0
+        self.size = None
+        self.validator = None
+        self.response = None
+        self.stream = None
+        self.requests = 0
+
+    def readable(self):
+        return True
+
+    def connect(self):
+        """Opens a response from self.done on and checks it is the same file as the earlier responses"""
+        if self.response is not None:
+            self.response.close()
+        headers = {'Range': 'bytes={}-'.format(self.done)} if self.done > 0 else {}
+        self.requests += 1
+        self.response = self.session.get(self.url, headers=headers, stream=True, timeout=TIMEOUT)
+        content_range = self.response.headers.get('Content-Range', '')
+        if self.response.status_code == 416 and content_range == 'bytes */{}'.format(self.done):
+            # The .part file is already the whole file
+            self.size = self.done
+            self.stream = iter(())
+            return
+        self.response.raise_for_status()
+
+        validator = self.response.headers.get('ETag') or self.response.headers.get('Last-Modified')
+        if self.response.status_code == 206:
+            match = re.match(r'bytes (\d+)-\d+/(\d+|\*)', content_range)
+            if match is None or int(match.group(1)) != self.done:
+                raise IOError('Server did not send the range asked for from {}'.format(self.url))
+            size = None if match.group(2) == '*' else int(match.group(2))
+            self.skip = 0
+        else:
+            length = self.response.headers.get('Content-Length')
+            size = None if length is None else int(length)
+            # No Range support, so the bytes already there are skipped over
+            self.skip = self.done
+        if self.size is not None and (size != self.size or validator != self.validator):
+            raise IOError('{} changed on the server part way through the download'.format(self.url))
+        self.size, self.validator = size, validator
+        self.stream = self.response.iter_content(self.block)
+
+    def fetch(self):
+        """Next block from the connection, reconnecting if it drops. b'' at the end of the file"""
+        failures = 0
+        while True:
+            if self.size is not None and self.done >= self.size:
+                return b''
+            error = None
+            try:
+                if self.stream is None:
+                    self.connect()
+                data = next(self.stream, b'')
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout) as e:
+                data = b''
+                error = e
+            if self.skip > 0 and len(data) > 0:
+                skipped = min(self.skip, len(data))
+                self.skip -= skipped
+                data = data[skipped:]
+                if len(data) == 0:
+                    continue
+            if len(data) > 0:
+                return data
+            if self.size is None and error is None:
+                # No size to check against so the end of the response is taken as the end of the file
+                return b''
+            # The connection dropped or ended short of the size
+            self.stream = None
+            failures += 1
+            if failures > self.retries:
+                raise IOError('Download of {} stopped at {} of {} bytes: {}'.format(self.url, self.done, self.size,
+                                                                                   error))
+
+    def pull(self):
+        """Fetches the next block and writes it to the .part file, finishing the download at the end
+        :return: the block, b'' at the end"""
+        if self.file.closed:
+            return b''
+        data = self.fetch()
+        self.file.write(data)
+        self.done += len(data)
+        if len(data) == 0:
+            self.finish()
+        return data
+
+    def readinto(self, buffer):
+        if self.sent < self.resumed:
+            # Bytes in the .part file from an earlier run
+            with open(self.part, 'rb') as f:
+                f.seek(self.sent)
+                data = f.read(min(len(buffer), self.resumed - self.sent))
+        else:
+            if self.offset == len(self.pending):
+                self.pending, self.offset = self.pull(), 0
+            data = self.pending[self.offset:self.offset + len(buffer)]
+            self.offset += len(data)
+        buffer[:len(data)] = data
+        self.sent += len(data)
+        return len(data)
+
+    def finish(self):
+        """Checks the size and moves the .part file to path"""
+        if self.file.closed:
+            return
+        self.file.close()
+        if self.response is not None:
+            self.response.close()
+        if self.size is not None and self.done != self.size:
+            raise IOError('Downloaded {} bytes of {} but the server said it is {}'.format(self.done, self.url,
+                                                                                         self.size))
+        os.replace(self.part, self.path)
+
+    def close(self):
+        if self.file.closed is False:
+            # Stopped part way, the .part file is kept to carry on from next time
+            self.file.close()
+        if self.response is not None:
+            self.response.close()
+        super().close()
+
+
+def download(url, path, block=BLOCK, retries=RETRIES, session=None):
+    """
+    Saves url to path without holding it in memory, see Download
+    :return: size of the file in bytes
+    """
+    with Download(url, path, block, retries, session) as stream:
+        while len(stream.pull()) > 0:
+            pass
+    return os.path.getsize(path)
@@ -0,0 +1,245 @@
+#! /usr/local/bin/python3.6
+
+"""
+The fast backend of wiki_tables: one pass over a plaque list page with the standard library's html.parser, keeping only
+the text, first link and coordinate span of each table cell and the link of each hatnote, so no tree is built and
+nothing is searched.
+
+It follows the rules beautifulsoup4 4.6.0 (the version in requirements.txt) uses with html.parser for opening and
+closing tags, turning character and entity references into text, collapsing whitespace and which strings are text, so
+every row is the same as the bs4 backend's down to the character with that version. Nothing of bs4 is used, so it
+works whatever bs4 is installed, but other bs4 versions changed some of those rules and can give different rows for
+odd pages.
+
+    rows, links = fast_page(html)
+"""
+
+import collections
+import html.entities
+import html.parser
+
+from blue_plaques.blue_plaques import wiki_tables
+
+# The rules are those of beautifulsoup4==4.6.0, keep them in step with the bs4 pin in requirements.txt
+# bs4 4.6.0's HTMLTreeBuilder.empty_element_tags and preserve_whitespace_tags
+EMPTY_ELEMENT_TAGS = frozenset(['area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link',
+                                'menuitem', 'meta', 'param', 'source', 'track', 'wbr', 'spacer', 'frame'])
+PRESERVE_WHITESPACE_TAGS = frozenset(['pre', 'textarea'])
+# bs4 4.6.0's EntitySubstitution.HTML_ENTITY_TO_CHARACTER
+ENTITIES = {name: chr(codepoint) for codepoint, name in html.entities.codepoint2name.items()}
+
+
+class Element:
+    """What the fast backend keeps of a table, row, cell, coordinate span or hatnote"""
+
+    def __init__(self, name, vevent=False):
+        self.name = name
+        self.vevent = vevent
+        self.parts = []  # Text
+        self.a = None  # attrs of the first link in it
+        self.children = []  # Rows of a table, cells of a row, coordinate spans of a cell
+
+    @property
+    def text(self):
+        return ''.join(self.parts)
+
+    def find(self, name):
+        return self.a
+
+
+def class_matches(classes, value):
+    """bs4's match of {'class': value}: one of the classes or all of them"""
+    return value in classes or ' '.join(classes) == value
+
+
+class TableParser(html.parser.HTMLParser):
+    """
+    Tokenises a page and keeps the wiki tables and hatnotes, the way BeautifulSoup 4.6.0 with html.parser would build
+    them: the handle_ methods are those of its BeautifulSoupHTMLParser, and open_tag, close_tag, pop and end_data
+    those of the BeautifulSoup object it builds the tree in
+    """
+
+    def __init__(self):
+        html.parser.HTMLParser.__init__(self, convert_charrefs=False)
+        self.stack = [(None, None)]  # (name, Element or None) of the open tags, the first is the document
+        self.tables = []
+        self.hatnotes = []
+        self.open_tables = []
+        self.open_rows = []
+        self.open_cells = []
+        self.open_text = []  # cells and coordinate spans
+        self.open_link = []  # cells and hatnotes without their first link yet
+        self.preserve = []
+        self.current_data = []
+        # Empty element tags closed at their start tag, so an end tag for one later on is passed over
+        self.closed_empty = collections.Counter()
+
+    def handle_startendtag(self, name, attrs):
+        TableParser.handle_starttag(self, name, attrs, handle_empty_element=False)
+        TableParser.handle_endtag(self, name)
+
+    def handle_starttag(self, name, attrs, handle_empty_element=True):
+        attr_dict = {}
+        for key, value in attrs:
+            attr_dict[key] = '' if value is None else value
+        TableParser.open_tag(self, name, attr_dict)
+        if name in EMPTY_ELEMENT_TAGS and handle_empty_element:
+            TableParser.close_tag(self, name)
+            self.closed_empty[name] += 1
+
+    def handle_endtag(self, name, check_already_closed=True):
+        if check_already_closed and self.closed_empty[name] > 0:
+            self.closed_empty[name] -= 1
+        else:
+            TableParser.close_tag(self, name)
+
+    def handle_data(self, data):
+        self.current_data.append(data)
+
+    def handle_charref(self, name):
+        if name.startswith('x'):
+            real_name = int(name.lstrip('x'), 16)
+        elif name.startswith('X'):
+            real_name = int(name.lstrip('X'), 16)
+        else:
+            real_name = int(name)
+        try:
+            data = chr(real_name)
+        except (ValueError, OverflowError):
+            data = '\N{REPLACEMENT CHARACTER}'
+        self.current_data.append(data)
+
+    def handle_entityref(self, name):
+        self.current_data.append(ENTITIES.get(name, '&%s;' % name))
+
+    def handle_comment(self, data):
+        TableParser.not_text(self, data)
+
+    def handle_decl(self, data):
+        TableParser.not_text(self, data)
+
+    def unknown_decl(self, data):
+        if data.upper().startswith('CDATA['):
+            TableParser.end_data(self)
+            self.current_data.append(data[len('CDATA['):])
+            TableParser.end_data(self)
+        else:
+            TableParser.not_text(self, data)
+
+    def handle_pi(self, data):
+        TableParser.not_text(self, data)
+
+    def not_text(self, data):
+        """Comments, doctypes, declarations and processing instructions, which end the text before them"""
+        TableParser.end_data(self)
+        self.current_data.append(data)
+        TableParser.end_data(self, text=False)
+
+    def open_tag(self, name, attrs):
+        TableParser.end_data(self)
+        element = None
+        if name == 'a' and self.open_link:
+            for waiting in self.open_link:
+                waiting.a = attrs
+            self.open_link = []
+        elif name == 'tr':
+            element = Element(name, class_matches(attrs.get('class', '').split(), 'vevent'))
+            for table in self.open_tables:
+                table.children.append(element)
+            self.open_rows.append(element)
+        elif name == 'td' or name == 'th':
+            element = Element(name)
+            for row in self.open_rows:
+                row.children.append(element)
+            self.open_cells.append(element)
+            self.open_text.append(element)
+            self.open_link.append(element)
+        elif name == 'table' and class_matches(attrs.get('class', '').split(), 'wikitable'):
+            element = Element(name)
+            self.tables.append(element)
+            self.open_tables.append(element)
+        elif name == 'span' and self.open_cells and \
+                class_matches(attrs.get('class', '').split(), wiki_tables.COORD_CLASS):
+            element = Element(name)
+            for cell in self.open_cells:
+                cell.children.append(element)
+            self.open_text.append(element)
+        elif name == 'div' and class_matches(attrs.get('class', '').split(), wiki_tables.HATNOTE_CLASS):
+            element = Element(name)
+            self.hatnotes.append(element)
+            self.open_link.append(element)
+        self.stack.append((name, element))
+        if name in PRESERVE_WHITESPACE_TAGS:
+            self.preserve.append(len(self.stack) - 1)
+
+    def close_tag(self, name):
+        TableParser.end_data(self)
+        # Like BeautifulSoup._popToTag, every tag is closed back to the most recent name tag, or all of them if
+        # there isn't one
+        for i in range(len(self.stack) - 1, 0, -1):
+            found = self.stack[i][0] == name
+            TableParser.pop(self)
+            if found:
+                break
+
+    def pop(self):
+        name, element = self.stack.pop()
+        if self.preserve and self.preserve[-1] == len(self.stack):
+            self.preserve.pop()
+        if element is None:
+            return
+        for open_list in [self.open_tables, self.open_rows, self.open_cells, self.open_text, self.open_link]:
+            if open_list and open_list[-1] is element:
+                open_list.pop()
+            elif element in open_list:
+                open_list.remove(element)
+
+    def end_data(self, text=True):
+        if self.current_data:
+            current_data = ''.join(self.current_data)
+            self.current_data = []
+            if not self.preserve and current_data.strip(' \n\t\x0c\r') == '':
+                current_data = '\n' if '\n' in current_data else ' '
+            if text is True:
+                for element in self.open_text:
+                    element.parts.append(current_data)
+
+    def finish(self):
+        """Ends the text and closes the tags still open at the end of the page"""
+        TableParser.end_data(self)
+        while len(self.stack) > 1:
+            TableParser.pop(self)
+
+
+def fast_page(html):
+    """(rows, links) of a page"""
+    parser = TableParser()
+    parser.feed(html)
+    TableParser.finish(parser)
+
+    data = []
+    for table in parser.tables:
+        head = [row for row in table.children if row.vevent is True]
+        if head != []:
+            for row in head:
+                columns = row.children
+                person = columns[0].text
+                try:
+                    persons_wiki = wiki_tables.WIKI_HEAD + columns[0].find('a').get('href')
+                except:
+                    persons_wiki = None
+                address = columns[2].text
+                year = columns[3].text
+                coord = columns[2].children
+                if coord != []:
+                    address = address.replace(coord[0].text, '')
+                person = wiki_tables.string_clean(person, True)
+                year = wiki_tables.string_clean(year, False)
+                data.append({'person': person, 'wiki': persons_wiki, 'address': address, 'year': year})
+        else:
+            rows = table.children
+            heading = rows[0]
+            for row in rows[1:]:
+                data.append(wiki_tables.normal_row([cell for cell in row.children if cell.name == 'td']))
+    links = [wiki_tables.WIKI_HEAD + (link.find('a').get('href')) for link in parser.hatnotes]
+    return data, links
@@ -0,0 +1,137 @@
+#! /usr/local/bin/python3.6
+
+"""
+On disk cache of the wikipedia pages the plaques are scraped from.
+
+Each page is saved by url as gzipped html with a .json of its ETag, Last-Modified and the time it was fetched. Asking
+for a saved page sends the ETag and Last-Modified back to the server, which answers 304 Not Modified without the page
+if it hasn't changed, so only changed pages are downloaded again. A page fetched less than max_age seconds ago is used
+without asking the server at all, and offline mode only ever uses the saved pages, so a scrape can be run again
+without the network and gives the same rows each time.
+
+    cache = ResponseCache(resources_file + 'wiki_cache/')
+    soup = cache.soup('https://en.wikipedia.org/wiki/List_of_blue_plaques')
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import time
+
+import bs4
+import requests
+
+
+TIMEOUT = 60
+HEADERS = {'User-Agent': 'blue_plaques plaque scraper (python requests)'}
+
+
+class ResponseCache:
+    """
+    Pages saved on disk by url
+    :param folder: folder to save the pages in
+    :param offline: only use saved pages, asking for one that isn't saved raises IOError
+    :param max_age: seconds a saved page is used for without checking it with the server, None to always check
+    :param session: requests session to fetch with, a new one if not given
+    """
+
+    def __init__(self, folder, offline=False, max_age=None, session=None):
+        if folder[-1:] != '/':
+            folder = folder + '/'
+        self.folder = folder
+        self.offline = offline
+        self.max_age = max_age
+        self.session = session
+        self.requests = 0
+
+    def path(self, url):
+        """Path of the saved page of url, without the extension"""
+        return self.folder + hashlib.sha1(url.encode()).hexdigest()
+
+    def meta(self, url):
+        """The .json of a saved page, or None if url isn't saved"""
+        try:
+            with open(ResponseCache.path(self, url) + '.json') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def text(self, url):
+        """The saved page of url"""
+        with gzip.open(ResponseCache.path(self, url) + '.html.gz', 'rb') as f:
+            return f.read().decode('utf-8')
+
+    def fresh(self, url):
+        """
+        The saved page of url if it can be used without asking the server: in offline mode or younger than max_age
+        :return: str, or None if the server needs asking
+        """
+        meta = ResponseCache.meta(self, url)
+        if self.offline is True:
+            if meta is None:
+                raise IOError('{} is not in the cache at {} and the cache is offline'.format(url, self.folder))
+            return ResponseCache.text(self, url)
+        if meta is not None and self.max_age is not None and time.time() - meta['fetched'] < self.max_age:
+            return ResponseCache.text(self, url)
+        return None
+
+    def conditional_headers(self, url):
+        """Headers that ask the server for the page only if it changed since it was saved"""
+        meta = ResponseCache.meta(self, url)
+        headers = {}
+        if meta is not None:
+            if meta['etag'] is not None:
+                headers['If-None-Match'] = meta['etag']
+            if meta['last_modified'] is not None:
+                headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def store(self, url, response):
+        """
+        Saves the page of a response to a request with conditional_headers, or marks the saved page as checked if the
+        response is 304
+        :return: text of the page
+        """
+        meta = ResponseCache.meta(self, url)
+        if response.status_code == 304:
+            if meta is None:
+                raise IOError('{} answered 304 for a page that is not in the cache'.format(url))
+            meta['fetched'] = time.time()
+            ResponseCache.write_meta(self, url, meta)
+            return ResponseCache.text(self, url)
+        response.raise_for_status()
+        text = response.text
+        os.makedirs(self.folder, exist_ok=True)
+        path = ResponseCache.path(self, url)
+        with gzip.open(path + '.html.gz.tmp', 'wb') as f:
+            f.write(text.encode('utf-8'))
+        os.replace(path + '.html.gz.tmp', path + '.html.gz')
+        ResponseCache.write_meta(self, url, {'url': url, 'etag': response.headers.get('ETag'),
+                                             'last_modified': response.headers.get('Last-Modified'),
+                                             'fetched': time.time()})
+        return text
+
+    def write_meta(self, url, meta):
+        path = ResponseCache.path(self, url)
+        with open(path + '.json.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(path + '.json.tmp', path + '.json')
+
+    def get(self, url):
+        """
+        Text of url, from the cache if it is saved and hasn't changed
+        """
+        text = ResponseCache.fresh(self, url)
+        if text is not None:
+            return text
+        if self.session is None:
+            self.session = requests.Session()
+            self.session.headers.update(HEADERS)
+        self.requests += 1
+        response = self.session.get(url, headers=ResponseCache.conditional_headers(self, url), timeout=TIMEOUT)
+        return ResponseCache.store(self, url, response)
+
+    def soup(self, url):
+        """bs4 soup of url, see get"""
+        return bs4.BeautifulSoup(ResponseCache.get(self, url), 'html.parser')
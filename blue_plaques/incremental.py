@@ -0,0 +1,299 @@
+#! /usr/local/bin/python3.6
+
+"""
+Monthly updates of the analysis without going over pp-complete.csv again.
+
+The land registry publishes a monthly update file (pp-monthly-update-new-version.csv, no heading line) of the sales
+added, changed or deleted that month, marked A, C or D in the Record_Status column. IncrementalState keeps everything
+the analysis needs from pp-complete.csv in a folder:
+    stats           AreaYearStats of every sale - the house_prices_stats numbers
+    ledger          area, year and price of every sale sorted on ID, to find the old values of changed and deleted
+                    sales so they can be taken back out of the stats
+    plaque sales    the sales in the plaque areas (Data.plaque_filter), the only ones the save methods use
+Applying an update takes the old values of every sale in it out of all three and puts the new values of the added and
+changed ones in, so only the update file is read. The medians are the sketch ones as the exact medians need a pass
+over every sale.
+
+    state = IncrementalState.build(Data(csv_file, bp_file), folder)      # one pass over pp-complete.csv
+    state.apply('pp-monthly-update-new-version.csv')                     # each month
+    state.main('mean')
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from blue_plaques.blue_plaques import accumulators
+from blue_plaques.blue_plaques import store
+from blue_plaques.blue_plaques.analysis_3 import Data, RowFilter, AveragePriceIndex, find_areas, get_years, \
+    match_columns, price_paid_columns, runner_chunks, join_data_sets, accumulate_data_sets, run_t_tests
+
+STATE_VERSION = 1
+
+
+class SalesLedger:
+    """Area, year and price of every sale in numpy arrays sorted on ID, so sales are found with a binary search"""
+
+    def __init__(self, ids, codes, areas, years, prices):
+        """
+        :param ids: sorted array of IDs as bytes (store.ID_WIDTH)
+        :param codes: int32 position of each sale's area in areas
+        :param areas: list of areas
+        :param years: int16 year each sale was made
+        :param prices: int64
+        """
+        self.ids = ids
+        self.codes = codes
+        self.areas = list(areas)
+        self.area_codes = {area: code for code, area in enumerate(self.areas)}
+        self.years = years
+        self.prices = prices
+
+    @staticmethod
+    def empty():
+        return SalesLedger(np.array([], dtype='S{}'.format(store.ID_WIDTH)), np.array([], dtype=np.int32), [],
+                           np.array([], dtype=np.int16), np.array([], dtype=np.int64))
+
+    def code(self, areas):
+        """Area codes of areas, adding any new ones"""
+        for area in pd.unique(areas):
+            if area not in self.area_codes:
+                self.area_codes[area] = len(self.areas)
+                self.areas.append(area)
+        return pd.Series(areas).map(self.area_codes).values.astype(np.int32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def find(self, ids):
+        """
+        :param ids: array of IDs as bytes
+        :return: position of each ID in the ledger, -1 if it isn't there
+        """
+        positions = np.searchsorted(self.ids, ids)
+        found = positions < len(self.ids)
+        found[found] = self.ids[positions[found]] == ids[found]
+        return np.where(found, positions, -1)
+
+    def sales(self, positions):
+        """
+        :return: DataFrame of the Area, Year and Price of the sales at positions
+        """
+        return pd.DataFrame({'Area': np.array(self.areas, dtype=object)[self.codes[positions]],
+                             'Year': self.years[positions], 'Price': self.prices[positions]},
+                            columns=['Area', 'Year', 'Price'])
+
+    def remove(self, positions):
+        self.ids = np.delete(self.ids, positions)
+        self.codes = np.delete(self.codes, positions)
+        self.years = np.delete(self.years, positions)
+        self.prices = np.delete(self.prices, positions)
+
+    def add(self, ids, areas, years, prices):
+        """
+        Adds sales that are not in the ledger yet, keeping it sorted
+        :param ids: array of IDs as bytes
+        """
+        order = np.argsort(ids, kind='mergesort')
+        ids = np.asarray(ids)[order]
+        if len(ids) > 1 and (ids[1:] == ids[:-1]).any():
+            raise ValueError('Sales can only be added once')
+        if (self.find(ids) >= 0).any():
+            raise ValueError('Sales already in the ledger have to be removed before they are added again')
+        # np.insert puts each value before the position it is given in the old array, so sorted ids stay sorted
+        at = np.searchsorted(self.ids, ids)
+        self.ids = np.insert(self.ids, at, ids)
+        self.codes = np.insert(self.codes, at, self.code(np.asarray(areas)[order]))
+        self.years = np.insert(self.years, at, np.asarray(years)[order].astype(np.int16))
+        self.prices = np.insert(self.prices, at, np.asarray(prices)[order].astype(np.int64))
+
+    def save(self, folder):
+        for name in ['ids', 'codes', 'years', 'prices']:
+            np.save('{}ledger_{}.npy'.format(folder, name), getattr(self, name))
+        np.save(folder + 'ledger_areas.npy', np.array(self.areas, dtype=str))
+
+    @staticmethod
+    def load(folder):
+        arrays = [np.load('{}ledger_{}.npy'.format(folder, name)) for name in ['ids', 'codes']]
+        areas = np.load(folder + 'ledger_areas.npy').astype(object).tolist()
+        return SalesLedger(arrays[0], arrays[1], areas, np.load(folder + 'ledger_years.npy'),
+                           np.load(folder + 'ledger_prices.npy'))
+
+
+def id_bytes(ids):
+    """IDs as the fixed width bytes the ledger keeps"""
+    return np.asarray(ids).astype(str).astype('S{}'.format(store.ID_WIDTH))
+
+
+class IncrementalState:
+    """Stats, ledger and plaque sales of the land registry data kept in a folder, updated month by month"""
+
+    def __init__(self, files, folder, stats, ledger, plaque_sales, meta):
+        """
+        Use IncrementalState.build or IncrementalState.load
+        :param files: Data - only the bp_file is used
+        :param folder: folder the state is saved in
+        """
+        self.files = files
+        self.folder = folder if folder[-1:] == '/' else folder + '/'
+        self.stats = stats
+        self.ledger = ledger
+        self.plaque_sales = plaque_sales
+        self.meta = meta
+
+    @staticmethod
+    def build(files, folder, alpha=0.005):
+        """
+        Makes the state from one pass over the whole csv and saves it
+        :param files: Data(pp-complete.csv, bp file)
+        :param folder: folder to save the state in
+        :param alpha: relative error bound of the medians
+        :return: IncrementalState
+        """
+        where = Data.plaque_filter(files)
+        stats = accumulators.AreaYearStats(alpha)
+        ledger = SalesLedger.empty()
+        sales = []
+        plaque_sales = []
+        for chunk in Data.read_csv(files, 6, columns=match_columns, typed=True):
+            areas = find_areas(chunk['Postcode'])
+            years = get_years(chunk['Date_sold'])
+            stats.update(areas, years, chunk['Price'])
+            sales.append((id_bytes(chunk['ID']), ledger.code(areas.values), years.values.astype(np.int16),
+                          chunk['Price'].values))
+            plaque_sales.append(chunk[where.mask(chunk).values])
+
+        if sales:
+            ids, codes, years, prices = [np.concatenate(column) for column in zip(*sales)]
+            order = np.argsort(ids, kind='mergesort')
+            ledger = SalesLedger(ids[order], codes[order], ledger.areas, years[order], prices[order])
+        plaque_sales = pd.concat(plaque_sales, ignore_index=True) if plaque_sales else pd.DataFrame(
+            columns=match_columns)
+        meta = {'version': STATE_VERSION, 'alpha': alpha, 'source': files.csv_file,
+                'plaque_areas': sorted(where.areas), 'updates': []}
+        state = IncrementalState(files, folder, stats, ledger, plaque_sales, meta)
+        state.save()
+        return state
+
+    @staticmethod
+    def load(files, folder):
+        """
+        :param files: Data - only the bp_file is used
+        :param folder: folder the state was saved in by build
+        :return: IncrementalState
+        """
+        folder = folder if folder[-1:] == '/' else folder + '/'
+        with open(folder + 'meta.json') as f:
+            meta = json.load(f)
+        if meta.get('version') != STATE_VERSION:
+            raise ValueError('State in {} is from another version, build it again'.format(folder))
+        stats = accumulators.AreaYearStats(meta['alpha'])
+        stats.moments = pd.read_pickle(folder + 'moments.pkl')
+        stats.sketch = pd.read_pickle(folder + 'sketch.pkl')
+        if len(stats.moments) == 0:
+            stats.moments = stats.sketch = None
+        return IncrementalState(files, folder, stats, SalesLedger.load(folder),
+                                pd.read_pickle(folder + 'plaque_sales.pkl'), meta)
+
+    def save(self):
+        """Writes the state to a new folder and then swaps it for the old one, so a failed save leaves the old one"""
+        tmp = self.folder[:-1] + '.tmp/'
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+        moments, sketch = self.stats.moments, self.stats.sketch
+        if moments is None:
+            moments, sketch = pd.DataFrame(), pd.Series()
+        moments.to_pickle(tmp + 'moments.pkl')
+        sketch.to_pickle(tmp + 'sketch.pkl')
+        self.ledger.save(tmp)
+        self.plaque_sales.to_pickle(tmp + 'plaque_sales.pkl')
+        self.meta['sales'] = len(self.ledger)
+        with open(tmp + 'meta.json', 'w') as f:
+            json.dump(self.meta, f)
+        if os.path.exists(self.folder):
+            old = self.folder[:-1] + '.old/'
+            os.rename(self.folder, old)
+            os.rename(tmp, self.folder)
+            shutil.rmtree(old)
+        else:
+            os.rename(tmp, self.folder)
+
+    def apply(self, update_file):
+        """
+        Applies a monthly update file to the state and saves it. A file that has already been applied is skipped.
+        Sales in the file that are already in the state (changed ones, deleted ones, or ones added again) have their
+        old values taken out; then the added and changed ones are put in with their new values. A sale changed to
+        have no price, date or postcode is taken out and not put back, like a deleted one.
+        :param update_file: land registry monthly update csv
+        :return: dict of the number of sales added, changed and deleted
+        """
+        source = store.fingerprint(update_file)
+        if source['hash'] in [update['hash'] for update in self.meta['updates']]:
+            print('{} has already been applied'.format(update_file))
+            return None
+
+        if os.path.getsize(update_file) == 0:
+            return {'added': 0, 'changed': 0, 'deleted': 0}
+        # Every line counts for taking old sales out, including ones read_csv_text drops for having no price, date or
+        # postcode: a sale changed to have none of one of those has to go. Only the last line of a sale counts if it
+        # is in the file more than once.
+        lines = pd.read_csv(update_file, header=None, names=price_paid_columns, usecols=['ID', 'Record_Status'],
+                            dtype=object)
+        lines = lines.drop_duplicates('ID', keep='last')
+        ids = id_bytes(lines['ID'])
+
+        positions = self.ledger.find(ids)
+        old = positions[positions >= 0]
+        old_sales = self.ledger.sales(old)
+        self.stats.subtract(accumulators.AreaYearStats(self.stats.alpha).update(
+            old_sales['Area'], old_sales['Year'], old_sales['Price']))
+        self.ledger.remove(old)
+        self.plaque_sales = self.plaque_sales[~self.plaque_sales['ID'].isin(lines['ID'])]
+
+        # The rows to put in are the last lines of the sales that read_csv_text keeps, the chunks keep the line numbers
+        update = Data(update_file, self.files.bp_file)
+        chunks = list(Data.read_csv_text(update, 6, columns=match_columns + ['Record_Status'], typed=True,
+                                         header=False))
+        sales = pd.concat(chunks) if chunks else pd.DataFrame(columns=match_columns + ['Record_Status'])
+        sales = sales[sales.index.isin(lines.index) & (sales['Record_Status'] != 'D').values]
+        new = lines.index.isin(sales.index)
+        areas = find_areas(sales['Postcode'])
+        years = get_years(sales['Date_sold'])
+        self.stats.update(areas, years, sales['Price'])
+        self.ledger.add(id_bytes(sales['ID']), areas.values, years.values, sales['Price'].values)
+        where = RowFilter(areas=self.meta['plaque_areas'])
+        self.plaque_sales = pd.concat([self.plaque_sales, sales[where.mask(sales).values][match_columns]],
+                                      ignore_index=True)
+
+        counts = {'added': int((new & (positions < 0)).sum()), 'changed': int((new & (positions >= 0)).sum()),
+                  'deleted': int((~new & (positions >= 0)).sum())}
+        source.update(counts, file=update_file)
+        self.meta['updates'].append(source)
+        self.save()
+        return counts
+
+    def house_prices_stats(self):
+        """Stats per area/year in the format of Data.house_prices_stats"""
+        return self.stats.to_frame()
+
+    def runner(self, avg_prices, avg_type, fused=True, accumulate=False):
+        """
+        runner over the kept plaque sales instead of the csv
+        :param accumulate: see analysis_3.runner
+        :return: repeated measures dict, single sample ls, independent samples tuple of ls
+        """
+        if not set(Data.plaque_filter(self.files).areas) <= set(self.meta['plaque_areas']):
+            raise ValueError('There are plaques in areas the state was not built with, build it again')
+        chunks = (self.plaque_sales[start:start + 10 ** 6] for start in range(0, len(self.plaque_sales), 10 ** 6))
+        parts = runner_chunks(self.files, AveragePriceIndex.of(avg_prices), avg_type, fused, chunks=chunks)
+        return accumulate_data_sets(parts) if accumulate is True else join_data_sets(parts)
+
+    def main(self, avg_type, fused=True):
+        """analysis_3.main from the state"""
+        avg_prices = self.house_prices_stats()
+        r, s, i = IncrementalState.runner(self, avg_prices, avg_type, fused, accumulate=True)
+        return run_t_tests(avg_prices, r, s, i)
@@ -0,0 +1,229 @@
+#! /usr/local/bin/python3.6
+
+"""
+Refresh of the plaque data that only parses the wikipedia list pages that changed since the last scrape.
+
+PlaqueState keeps, in a json file, the revision id each list page was parsed at with its rows and links, and the sales
+matched to each person. A refresh asks the wikipedia API for the revision ids of all the pages (50 titles a request),
+fetches and parses only the pages whose revision changed or that are new, and reuses the saved rows of the rest, so the
+rows come out the same as a scrape from scratch. The rows are then compared with the old ones on (person, address,
+year), and only the plaques added need normalising and matching against the sales:
+
+    state = PlaqueState.load(state_file)
+    data, changed = PlaqueState.refresh(state, plaque_urls, cache.get)
+    added, removed = diff_rows(old_df, new_df)
+    PlaqueState.update_matches(state, Data(csv_file, bp_file), new_df, added, removed)
+    PlaqueState.save(state)
+"""
+
+import json
+import os
+import re
+import urllib.parse
+
+import pandas as pd
+import requests
+
+from blue_plaques.blue_plaques import http_cache
+from blue_plaques.blue_plaques import wiki_tables
+from blue_plaques.blue_plaques.analysis_3 import Data, RowFilter, PlaqueMatcher, find_areas, match_columns, \
+    parse_bp
+
+API = 'https://en.wikipedia.org/w/api.php'
+TITLES_PER_REQUEST = 50  # Most titles the API takes in one query
+STATE_VERSION = 1
+KEY_COLUMNS = ['person', 'address', 'year']
+YEAR = re.compile(r'(\d{4})')
+
+
+def page_title(url):
+    """Title of a wikipedia page from its url, 'https://en.wikipedia.org/wiki/List_of_blue_plaques' -> 'List of blue
+    plaques'"""
+    return urllib.parse.unquote(url.split('/wiki/', 1)[1]).replace('_', ' ')
+
+
+def revision_ids(urls, session=None, api=API):
+    """
+    Current revision ids of wikipedia pages, from one API query per 50 pages
+    :param urls: page urls
+    :param session: requests session to ask with
+    :param api: url of the api.php
+    :return: {url: revision id, None for a page that doesn't exist}
+    """
+    if session is None:
+        session = requests.Session()
+        session.headers.update(http_cache.HEADERS)
+    urls = list(urls)
+    revisions = {}
+    for start in range(0, len(urls), TITLES_PER_REQUEST):
+        batch = urls[start:start + TITLES_PER_REQUEST]
+        titles = [page_title(url) for url in batch]
+        response = session.get(api, params={'action': 'query', 'prop': 'info', 'titles': '|'.join(titles),
+                                            'format': 'json', 'formatversion': '2'}, timeout=http_cache.TIMEOUT)
+        response.raise_for_status()
+        query = response.json()['query']
+        # The API gives the pages back under their normalised titles
+        normalised = {item['from']: item['to'] for item in query.get('normalized', [])}
+        pages = {page['title']: page.get('lastrevid') for page in query['pages']}
+        for url, title in zip(batch, titles):
+            revisions[url] = pages.get(normalised.get(title, title))
+    return revisions
+
+
+def row_keys(df):
+    """
+    (person, address, year) key of each plaque row as one string, the same for a row of wiki_bp_data.csv and
+    normalised_bp_data.csv: the whitespace and case of the text don't count and the year is just the 4 digits
+    :param df: DataFrame with person, address and year columns
+    :return: Series of str
+    """
+    if len(df) == 0:
+        return pd.Series([], index=df.index, dtype=object)
+    text = [df[column].fillna('').astype(str).str.split().str.join(' ').str.upper() for column in KEY_COLUMNS[:2]]
+    year = df['year'].astype(str).str.extract(YEAR, expand=False).fillna('')
+    return text[0] + '\x00' + text[1] + '\x00' + year
+
+
+def diff_rows(old, new):
+    """
+    Plaques added and removed between two scrapes, compared on person, address and year. A plaque that changed is
+    removed with its old values and added with its new ones.
+    :param old: DataFrame of the old scrape, wiki_bp_data.csv
+    :param new: DataFrame of the new scrape
+    :return: (added rows of new, removed rows of old)
+    """
+    old_keys, new_keys = row_keys(old), row_keys(new)
+    return new[~new_keys.isin(set(old_keys)).values], old[~old_keys.isin(set(new_keys)).values]
+
+
+def update_normalised(normalised, added, removed):
+    """
+    normalised_bp_data.csv with the removed plaques taken out and the added ones put on the end
+    :param normalised: DataFrame of normalised_bp_data.csv
+    :param added: the added plaques normalised, see NormaliseDF
+    :param removed: the removed plaques, from diff_rows
+    :return: DataFrame
+    """
+    kept = normalised[~row_keys(normalised).isin(set(row_keys(removed))).values]
+    return pd.concat([kept, added], ignore_index=True, sort=False)
+
+
+def bp_rows(df):
+    """Rows of wiki_bp_data.csv in the layout of the bp csv parse_bp reads, Address, Person, Wiki, Year"""
+    return pd.DataFrame({'Address': df['address'].values, 'Person': df['person'].values, 'Wiki': df['wiki'].values,
+                         'Year': df['year'].astype(str).str.extract(YEAR, expand=False).values},
+                        columns=['Address', 'Person', 'Wiki', 'Year'])
+
+
+def match_sales(files, plaques, chunk_power=6):
+    """
+    Sales of the houses of some plaques, reading only the sales in their areas
+    :param files: Data of the price paid csv, its bp_file isn't used
+    :param plaques: DataFrame of wiki_bp_data.csv rows
+    :param chunk_power: see Data.read_csv
+    :return: {Person: [ID, ID, ID], ..}
+    """
+    bp = parse_bp(bp_rows(plaques))
+    postcodes = bp['Postcode'][bp['Postcode'] != 'nan']
+    matches = {}
+    if len(postcodes) == 0:
+        return matches
+    matcher = PlaqueMatcher(bp)
+    where = RowFilter(areas=find_areas(postcodes).dropna())
+    for chunk in Data.read_csv(files, chunk_power, columns=match_columns, where=where):
+        for person, ids in matcher.match(chunk).items():
+            matches.setdefault(person, []).extend(ids)
+    return matches
+
+
+class PlaqueState:
+    """Revision, rows and links of each plaque list page parsed, and the sales matched to each person"""
+
+    def __init__(self, path, pages, matches):
+        """
+        Use PlaqueState.load
+        :param path: json file the state is saved in
+        :param pages: {url: {'revision': id, 'rows': [{person, wiki, address, year}, ], 'links': [urls]}}
+        :param matches: {Person: [ID, ID, ID], ..}
+        """
+        self.path = path
+        self.pages = pages
+        self.matches = matches
+
+    @staticmethod
+    def load(path):
+        """
+        :param path: json file saved by PlaqueState.save
+        :return: PlaqueState, an empty one if there is no file
+        """
+        if not os.path.exists(path):
+            return PlaqueState(path, {}, {})
+        with open(path) as f:
+            saved = json.load(f)
+        if saved.get('version') != STATE_VERSION:
+            raise ValueError('Plaque state in {} is from another version, remove it to scrape again'.format(path))
+        return PlaqueState(path, saved['pages'], saved['matches'])
+
+    def save(self):
+        """Writes the state to a new file and swaps it for the old one"""
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump({'version': STATE_VERSION, 'pages': self.pages, 'matches': self.matches}, f)
+        os.replace(self.path + '.tmp', self.path)
+
+    def refresh(self, urls, get_page, backend='fast', session=None, api=API):
+        """
+        Rows of the plaque lists, parsing only the pages whose revision changed. Pages no longer linked to are
+        dropped from the state.
+        :param urls: the start pages, see collection.plaque_urls
+        :param get_page: url -> html of the page, e.g. ResponseCache.get. It should check the page with the server
+         (no max_age) or the rows can be older than the revision saved with them
+        :param backend: parser of the pages, see wiki_tables.parse_page
+        :param session: requests session to ask the API with
+        :param api: url of the api.php
+        :return: ([{person, wiki, address, year}, ] in the order a scrape from scratch gives them, [urls parsed])
+        """
+        known = list(urls) + [link for url in urls if url in self.pages for link in self.pages[url]['links']]
+        revisions = revision_ids(list(dict.fromkeys(known)), session, api)
+        pages = {}
+        changed = []
+
+        def page(url):
+            if url in pages:
+                return pages[url]
+            if url not in revisions:
+                revisions.update(revision_ids([url], session, api))
+            saved = self.pages.get(url)
+            if saved is None or revisions[url] is None or saved['revision'] != revisions[url]:
+                rows, links = wiki_tables.parse_page(get_page(url), backend)
+                saved = {'revision': revisions[url], 'rows': rows, 'links': links}
+                changed.append(url)
+            pages[url] = saved
+            return saved
+
+        data = []
+        for url in urls:
+            start = page(url)
+            data.extend(start['rows'])
+            for link in start['links']:
+                data.extend(page(link)['rows'])
+        self.pages = pages
+        return data, changed
+
+    def update_matches(self, files, plaques, added, removed, chunk_power=6):
+        """
+        Matches the plaques of the people with a plaque added or removed against the sales again, keeping the
+        matches of everyone else
+        :param files: Data of the price paid csv
+        :param plaques: all the plaque rows of the new scrape
+        :param added: added plaque rows, from diff_rows
+        :param removed: removed plaque rows, from diff_rows
+        :param chunk_power: see Data.read_csv
+        :return: {Person: [ID, ID, ID], ..} of those people
+        """
+        people = set(parse_bp(bp_rows(pd.concat([added, removed])))['Person'])
+        for person in people:
+            self.matches.pop(person, None)
+        person = parse_bp(bp_rows(plaques))['Person']
+        new = match_sales(files, plaques[person.isin(people).values], chunk_power)
+        self.matches.update(new)
+        return new
@@ -1,36 +1,19 @@
 #! /usr/local/bin/python3.6
 
 """Module to scrape the wiki for the blue plaques stuff
-dict format - {Person: [persons wiki page, address, year issued], ...}"""
+dict format - {Person: [persons wiki page, address, year issued], ...}
+The pages are fetched through an http_cache.ResponseCache in the folder, so a page is only downloaded again if it
+changed and offline=True scrapes from the saved pages alone."""
 
-# import json
-# import re
-# import ssl
-# import urllib.request
-#
-# import bs4
-# import pandas as pd
+import json
+import re
 
-# todo - add https://en.wikipedia.org/wiki/List_of_blue_plaques to plaques
-# todo - add tests and docs and look
+import pandas as pd
 
+from blue_plaques.blue_plaques import http_cache
 
-def soups(url):
-    """Get bs4 soup from url"""
-    req = urllib.request.Request(
-        url,
-        data=None,
-        headers={
-            'User-Agent':
-                'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_3)'
-                'AppleWebKit/537.36 (KHTML, like Gecko)'
-                'Chrome/35.0.1916.47 Safari/537.36'}
-    )
-    # noinspection PyProtectedMember
-    context = ssl._create_unverified_context()
-    web_page = urllib.request.urlopen(req, context=context)
-    soup = bs4.BeautifulSoup(web_page, 'html.parser')
-    return soup
+# todo - add https://en.wikipedia.org/wiki/List_of_blue_plaques to plaques
+# todo - add tests and docs and look
 
 
 def string_clean(string, person):
@@ -98,12 +81,13 @@ def table_scrape(table):
     return temp_dict
 
 
-def plaque_scrape(wiki_url):
+def plaque_scrape(wiki_url, cache):
     """The page has tables and links to other tables that can be used.
     args - the main wiki url: https://en.wikipedia.org/wiki/List_of_English_Heritage_blue_plaques_in_London
+           the http_cache.ResponseCache the pages are fetched through
     returns - dict {Person: [persons wiki page, address, year issued], ...} saved to ./blue_plaques.txt"""
     wiki_head = 'https://en.wikipedia.org'
-    soup = soups(wiki_url)
+    soup = cache.soup(wiki_url)
 
     plaque_dict = []
     # Find all tables in this main page
@@ -117,7 +101,7 @@ def plaque_scrape(wiki_url):
     other_links = soup.find_all('div', {'class': 'hatnote navigation-not-searchable'})
     for link in other_links:
         url = wiki_head + (link.find('a').get('href'))
-        soup = soups(url)
+        soup = cache.soup(url)
         tables = soup.find_all('table', {'class': 'wikitable'})
         for table in tables:
             plaque_dict.extend(table_scrape(table))
@@ -134,12 +118,13 @@ def dict_to_df(dict_file, folder):
     df.to_csv(folder + 'bp_csv.csv', index=False)
 
 
-def main(url, folder):
+def main(url, folder, offline=False):
     """Scrapes and saves the data from url to defined folder
     url - 'https://en.wikipedia.org/wiki/List_of_English_Heritage_blue_plaques_in_London'
-    folder - /Users/Matt/pyprojects/blue_plaques/"""
+    folder - /Users/Matt/pyprojects/blue_plaques/, the pages are cached in its wiki_cache/
+    offline - True to only use the cached pages"""
 
-    dict = plaque_scrape(url)
+    dict = plaque_scrape(url, http_cache.ResponseCache(folder + 'wiki_cache/', offline))
 
     with open(folder + 'bp_info.txt', 'w') as infile:
         json.dump(dict, infile, sort_keys=True, indent=4)
@@ -0,0 +1,164 @@
+#! /usr/local/bin/python3.6
+
+"""
+On disk store of every price by (area, year), for looking at the prices of one area/year without loading the rest.
+
+The prices of each area/year are one sorted run of a single prices.npy, in order of the 'N1_2014' style keys, with
+offsets.npy saying where each run starts and ends. prices.npy is memory mapped, so the prices of an area/year are a
+slice of it and only those pages are read from disk.
+
+Building it is one pass over the sales that writes each one's group and price to a raw file, then a pass over
+those files in blocks that puts each price in its group's run, so memory is a block and not every price. It is
+saved in a folder next to the csv (pp-complete.csv -> pp-complete.csv.prices/) with the fingerprint of the csv, and
+is not used once the csv changes.
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from blue_plaques.blue_plaques import store
+
+
+STORE_VERSION = 1
+BLOCK = 2 ** 22
+
+
+def store_dir(csv_file):
+    """Folder the prices of csv_file are saved in"""
+    return '{}.prices/'.format(csv_file)
+
+
+def read_meta(csv_file):
+    """Returns the meta.json of the store or None if there isn't one"""
+    try:
+        with open(store_dir(csv_file) + 'meta.json') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def is_current(csv_file):
+    """True if there is a store for csv_file that was made from the file as it is now"""
+    meta = read_meta(csv_file)
+    if meta is None or meta.get('version') != STORE_VERSION or os.path.exists(csv_file) is False:
+        return False
+    return meta['fingerprint'] == store.fingerprint(csv_file)
+
+
+def group_key(area, year):
+    return '{}_{}'.format(area, year)
+
+
+def build(csv_file, chunks, block=BLOCK):
+    """
+    Saves the prices as the store of csv_file, replacing any store already there
+    :param csv_file: csv the prices came from, used to name the folder and fingerprint the store
+    :param chunks: iterable of (areas, years, prices), like AreaYearStats.update takes. Sales without an area are
+     left out.
+    :param block: rows put in place at a time in the second pass
+    :return: PriceStore
+    """
+    folder = store_dir(csv_file)
+    tmp = folder[:-1] + '.tmp/'
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+
+    # First pass, the group of each sale as a number in the order the groups are first seen
+    codes = {}
+    counts = np.zeros(0, dtype=np.int64)
+    with open(tmp + 'groups.raw', 'wb') as groups_file, open(tmp + 'prices.raw', 'wb') as prices_file:
+        for areas, years, prices in chunks:
+            areas = pd.Series(np.asarray(areas, dtype=object))
+            prices = np.asarray(prices, dtype=np.int64)
+            keep = areas.notnull().values
+            keys = (areas[keep].astype(str).values + '_' +
+                    pd.Series(np.asarray(years)[keep]).astype(int).astype(str).values)
+            labels, uniques = pd.factorize(keys)
+            for key in uniques:
+                if key not in codes:
+                    codes[key] = len(codes)
+            groups = np.array([codes[key] for key in uniques], dtype=np.int32)[labels]
+            prices = prices[keep]
+            if len(prices) and (prices.max() > np.iinfo(np.int32).max or prices.min() < 0):
+                raise ValueError('Price out of int32 range, cannot store the prices of {}'.format(csv_file))
+            groups.tofile(groups_file)
+            prices.astype(np.int32).tofile(prices_file)
+            counts = np.append(counts, np.zeros(len(codes) - len(counts), dtype=np.int64))
+            counts += np.bincount(groups, minlength=len(codes))
+
+    # Runs in key order
+    keys = sorted(codes)
+    rank = np.empty(len(keys), dtype=np.int64)
+    rank[[codes[key] for key in keys]] = np.arange(len(keys))
+    sorted_counts = np.zeros(len(keys), dtype=np.int64)
+    sorted_counts[rank] = counts
+    offsets = np.append(0, np.cumsum(sorted_counts))
+
+    # Second pass, each price to the next free place in its group's run
+    if offsets[-1] == 0:
+        np.save(tmp + 'prices.npy', np.zeros(0, dtype=np.int32))
+    else:
+        groups = np.memmap(tmp + 'groups.raw', dtype=np.int32, mode='r')
+        prices = np.memmap(tmp + 'prices.raw', dtype=np.int32, mode='r')
+        out = np.lib.format.open_memmap(tmp + 'prices.npy', mode='w+', dtype=np.int32, shape=(int(offsets[-1]),))
+        cursor = offsets[:-1].copy()
+        for first in range(0, len(groups), block):
+            ranks = rank[np.asarray(groups[first:first + block])]
+            order = np.argsort(ranks, kind='mergesort')
+            ranks = ranks[order]
+            # Place in the block's part of the group's run, after the part the earlier blocks filled
+            starts = np.searchsorted(ranks, ranks, side='left')
+            out[cursor[ranks] + np.arange(len(ranks)) - starts] = np.asarray(prices[first:first + block])[order]
+            cursor += np.bincount(ranks, minlength=len(keys))
+        for start, stop in zip(offsets[:-1], offsets[1:]):
+            out[start:stop].sort()
+        out.flush()
+        del out, groups, prices
+    os.remove(tmp + 'groups.raw')
+    os.remove(tmp + 'prices.raw')
+
+    np.save(tmp + 'keys.npy', np.array(keys, dtype=str))
+    np.save(tmp + 'offsets.npy', offsets)
+    meta = {'version': STORE_VERSION, 'fingerprint': store.fingerprint(csv_file), 'rows': int(offsets[-1]),
+            'groups': len(keys)}
+    with open(tmp + 'meta.json', 'w') as f:
+        json.dump(meta, f)
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.rename(tmp, folder)
+    return PriceStore(csv_file)
+
+
+class PriceStore:
+    """
+    The saved prices of csv_file, memory mapped
+    :param csv_file: csv the store was built from, see build
+    """
+
+    def __init__(self, csv_file):
+        folder = store_dir(csv_file)
+        self.meta = read_meta(csv_file)
+        self.keys = np.load(folder + 'keys.npy')
+        self.offsets = np.load(folder + 'offsets.npy')
+        self.index = dict(zip(self.keys.tolist(), range(len(self.keys))))
+        self.prices = np.load(folder + 'prices.npy', mmap_mode='r') if self.meta['rows'] > 0 else \
+            np.zeros(0, dtype=np.int32)
+
+    def get(self, area, year):
+        """
+        Prices of an area and year, lowest first
+        :return: read only int32 array, empty if there were no sales
+        """
+        i = self.index.get(group_key(area, year))
+        if i is None:
+            return self.prices[:0]
+        return self.prices[self.offsets[i]:self.offsets[i + 1]]
+
+    def groups(self):
+        """(area, year) of every group, in the order of their runs"""
+        return [(key.rsplit('_', 1)[0], int(key.rsplit('_', 1)[1])) for key in self.keys.tolist()]
@@ -0,0 +1,236 @@
+#! /usr/local/bin/python3.6
+
+"""
+Bootstrap confidence intervals and permutation tests for the three plaque tests, as a check on the t-tests (TTests in
+analysis_3.py) that doesn't assume the weighted prices are normal. They are skewed (see the skew column of
+house_prices_stats).
+
+    repeated measures   - mean of the before - after differences of each person's average weighted prices.
+                          Bootstrap of the people; sign flip permutation test (before and after swapped per person).
+    single sample       - mean of the sample. Bootstrap of the sample; the test is the bootstrap of the sample
+                          shifted to the population mean.
+    independent samples - bp mean - control mean. Bootstrap of each group; permutation test of the group labels.
+
+Resamples are made in blocks of BLOCK, block b with np.random.RandomState([seed, b]), so the results only depend on
+the seed and not on the number of worker processes the blocks are shared between. A sample with few distinct values
+for its size (the weighted prices are rounded to 4 significant figures, so the 1.68M controls have about 20k) is
+bootstrapped by drawing how many times each distinct value is picked from a multinomial, which costs the number of
+distinct values rather than the number of values.
+"""
+
+import collections
+import multiprocessing
+
+import numpy as np
+
+from blue_plaques.blue_plaques import accumulators
+
+BLOCK = 100  # resamples per RandomState stream
+BATCH_VALUES = 2 ** 22  # values drawn at a time
+
+ResamplingResult = collections.namedtuple('ResamplingResult', ['statistic', 'ci_low', 'ci_high', 'p_value',
+                                                               'resamples'])
+ResamplingResult.__doc__ = """Observed statistic, bootstrap percentile confidence interval and two sided p value"""
+
+# Samples of the test being run, set in each worker process by the pool initializer
+data = {}
+
+
+def as_values(sample):
+    """Sample as a float array. Resampling needs every value so accumulated samples can't be used."""
+    if isinstance(sample, accumulators.SampleMoments):
+        raise ValueError('Resampling needs the values of the sample, run runner with accumulate=False')
+    return np.asarray(sample, dtype=float)
+
+
+class Sample:
+    """A sample ready for drawing bootstrap means from"""
+
+    def __init__(self, values):
+        self.values = values
+        self.n = len(values)
+        distinct, counts = np.unique(values, return_counts=True)
+        self.distinct = distinct if len(distinct) * 4 < self.n else None
+        self.p = counts / self.n
+
+    def bootstrap_means(self, rng, count):
+        """Means of count bootstrap resamples"""
+        means = np.empty(count)
+        if self.distinct is not None:
+            for i in range(count):
+                means[i] = rng.multinomial(self.n, self.p).dot(self.distinct) / self.n
+            return means
+        batch = max(1, BATCH_VALUES // max(self.n, 1))
+        for first in range(0, count, batch):
+            rows = min(batch, count - first)
+            picks = rng.randint(0, self.n, (rows, self.n))
+            means[first:first + rows] = self.values[picks].mean(1)
+        return means
+
+
+def distinct_picks(rng, rows, size, n):
+    """rows sets of size different indices below n"""
+    if size * size > n:
+        # Copied out of each permutation so only one n long array is alive at a time
+        picks = np.empty((rows, size), dtype=np.int64)
+        for row in picks:
+            row[:] = rng.permutation(n)[:size]
+        return picks
+    picks = rng.randint(0, n, (rows, size))
+    while True:
+        ordered = np.sort(picks, 1)
+        repeats = (ordered[:, 1:] == ordered[:, :-1]).any(1)
+        if not repeats.any():
+            return picks
+        picks[repeats] = rng.randint(0, n, (int(repeats.sum()), size))
+
+
+def block_statistics(task):
+    """
+    Resampled statistics of one block, run in a worker process or in this one
+    :param task: (test name, seed, block number, resamples in the block)
+    :return: (bootstrap statistics, null statistics) arrays
+    """
+    test, seed, block, count = task
+    rng = np.random.RandomState([seed, block])
+    if test == 'repeated_measures':
+        diff = data['diff']
+        boot = np.empty(count)
+        flips = np.empty(count)
+        batch = max(1, BATCH_VALUES // len(diff))
+        for first in range(0, count, batch):
+            rows = min(batch, count - first)
+            boot[first:first + rows] = diff[rng.randint(0, len(diff), (rows, len(diff)))].mean(1)
+            signs = rng.randint(0, 2, (rows, len(diff))) * 2 - 1
+            flips[first:first + rows] = (signs * diff).mean(1)
+        return boot, flips
+    if test == 'single_sample':
+        boot = data['sample'].bootstrap_means(rng, count)
+        # Bootstrap of the sample shifted to the population mean
+        return boot, boot - data['sample'].values.mean() + data['pop_mean']
+    if test == 'independent_samples':
+        exp, ctr, pooled = data['exp'], data['ctr'], data['pooled']
+        boot = exp.bootstrap_means(rng, count) - ctr.bootstrap_means(rng, count)
+        total = pooled.sum()
+        null = np.empty(count)
+        batch = max(1, BATCH_VALUES // max(exp.n, 1))
+        for first in range(0, count, batch):
+            rows = min(batch, count - first)
+            picked = pooled[distinct_picks(rng, rows, exp.n, len(pooled))].sum(1)
+            null[first:first + rows] = picked / exp.n - (total - picked) / ctr.n
+        return boot, null
+    raise KeyError('{} not allowed. Try repeated_measures, single_sample or independent_samples'.format(test))
+
+
+def set_data(new_data):
+    data.clear()
+    data.update(new_data)
+
+
+def resample(test, test_data, resamples, seed, workers):
+    """
+    Bootstrap and null statistics of a test, in blocks shared between workers processes
+    :return: (bootstrap statistics, null statistics) arrays of length resamples
+    """
+    tasks = [(test, seed, block, min(BLOCK, resamples - first))
+             for block, first in enumerate(range(0, resamples, BLOCK))]
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=set_data, initargs=(test_data,))
+        try:
+            results = pool.map(block_statistics, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        set_data(test_data)
+        results = [block_statistics(task) for task in tasks]
+    return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+
+def summarise(statistic, boot, null, centre, confidence):
+    """
+    Percentile interval of the bootstrap statistics and the share of null statistics at least as far from centre as
+    the observed one (with the observed one counted, so p is never 0)
+    """
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(boot, [tail, 100 - tail])
+    extreme = np.abs(null - centre) >= abs(statistic - centre) - 1e-12 * max(abs(statistic), 1)
+    p_value = (extreme.sum() + 1) / (len(null) + 1)
+    return ResamplingResult(statistic, low, high, p_value, len(boot))
+
+
+class ResamplingTests:
+    """Holds the resampling versions of the t-tests"""
+
+    @staticmethod
+    def repeated_measures(before_after, resamples=10000, seed=0, workers=1, confidence=0.95):
+        """
+        Bootstrap interval and sign flip permutation test of the mean before - after difference per person
+        :param before_after: {'Person name: {'Before': [ls before prices], 'After': [ls after prices]}}
+        :param resamples: number of bootstrap resamples and of permutations
+        :param seed: seed of the random number streams
+        :param workers: number of processes
+        :param confidence: of the interval
+        :return: ResamplingResult
+        """
+        diff = []
+        for person, bf_af in before_after.items():
+            before, after = as_values(bf_af['Before']), as_values(bf_af['After'])
+            if len(before) != 0 and len(after) != 0:
+                diff.append(before.mean() - after.mean())
+        if len(diff) < 2:
+            raise ValueError('Sample size too small, {} people with prices before and after'.format(len(diff)))
+        diff = np.array(diff)
+        boot, null = resample('repeated_measures', {'diff': diff}, resamples, seed, workers)
+        result = summarise(diff.mean(), boot, null, 0.0, confidence)
+        print_result('Repeated measures (mean before - after difference)', result, confidence)
+        return result
+
+    @staticmethod
+    def single_sample(sample, pop_mean=0.0, resamples=10000, seed=0, workers=1, confidence=0.95):
+        """
+        Bootstrap interval of the sample mean and bootstrap test of it against the population mean
+        :return: ResamplingResult
+        """
+        values = as_values(sample)
+        if len(values) < 2:
+            raise ValueError('Sample size too small, {} values'.format(len(values)))
+        boot, null = resample('single_sample', {'sample': Sample(values), 'pop_mean': pop_mean}, resamples, seed,
+                              workers)
+        result = summarise(values.mean(), boot, null, pop_mean, confidence)
+        print_result('Single sample (sample mean, population mean {})'.format(round(pop_mean, 2)), result,
+                     confidence)
+        return result
+
+    @staticmethod
+    def independent_samples(exp_ctr, resamples=10000, seed=0, workers=1, confidence=0.95):
+        """
+        Bootstrap interval of bp mean - control mean and permutation test of the bp/control labels
+        :param exp_ctr: ([ls of experimental/exact bp values], [ls of control/area matches values])
+        :return: ResamplingResult
+        """
+        exp, ctr = as_values(exp_ctr[0]), as_values(exp_ctr[1])
+        if len(exp) == 0 or len(ctr) == 0:
+            raise ValueError('Both samples need values, sizes are {} and {}'.format(len(exp), len(ctr)))
+        test_data = {'exp': Sample(exp), 'ctr': Sample(ctr), 'pooled': np.concatenate([exp, ctr])}
+        boot, null = resample('independent_samples', test_data, resamples, seed, workers)
+        result = summarise(exp.mean() - ctr.mean(), boot, null, 0.0, confidence)
+        print_result('Independent samples (bp mean - control mean)', result, confidence)
+        return result
+
+    @staticmethod
+    def run_all(r, s, i, pop_mean, resamples=10000, seed=0, workers=1):
+        """The three tests on the data sets from analysis_3.runner"""
+        return (ResamplingTests.repeated_measures(r, resamples, seed, workers),
+                ResamplingTests.single_sample(s, pop_mean, resamples, seed, workers),
+                ResamplingTests.independent_samples(i, resamples, seed, workers))
+
+
+def print_result(name, result, confidence):
+    print("""
+        {} - {} resamples, values rounded to 2 d.p.:
+        Statistic = {}
+        {}% confidence interval = {} to {}
+        p = {}
+        """.format(name, result.resamples, round(result.statistic, 2), round(confidence * 100),
+                   round(result.ci_low, 2), round(result.ci_high, 2), round(result.p_value, 4)))
@@ -0,0 +1,347 @@
+#! /usr/local/bin/python3.6
+
+"""
+Columnar on disk cache of the land registry price paid csv.
+
+Parsing pp-complete.csv as text takes tens of minutes per pass and the analysis passes over it several times. The
+ingest step here parses it once, in the same chunks Data.read_csv gives, and saves each column as its own .npy file
+in a folder next to the csv (pp-complete.csv -> pp-complete.csv.cache/):
+    Price       int32
+    Date_sold   int32 days since 1970-01-01
+    ID          fixed width bytes
+    the rest    int32 category codes (-1 for nan) and a categories file per column
+
+The folder holds a meta.json with the size, mtime and hash of the csv it was made from. If the csv changes the cache
+is no longer used and the csv is read as text again until it is re-ingested. If only some rows were ingested (see
+RowFilter in analysis_3.py) the cache goes in a folder of its own named after a hash of the filter
+(pp-complete.csv.cache-<hash>/) and the meta says which rows, so the cache of every row and the cache of each filter
+are kept side by side and each is only used for the reads it has the rows of.
+
+read_chunks gives the cache back as dataframes like Data.read_csv; SalesTable gives the columns as the memory mapped
+arrays themselves for passes that don't need dataframes.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+
+STORE_VERSION = 1
+ID_WIDTH = 38  # '{F887F88E-7D15-4415-804E-52EAC2F10958}'
+HASH_BLOCK = 2 ** 20
+
+
+def cache_dir(csv_file, where=None):
+    """
+    Folder the columns of csv_file are saved in
+    :param where: description of the filter the rows were read with (RowFilter.describe), None for every row
+    """
+    if where is None:
+        return '{}.cache/'.format(csv_file)
+    key = hashlib.sha1(json.dumps(where, sort_keys=True).encode()).hexdigest()[:12]
+    return '{}.cache-{}/'.format(csv_file, key)
+
+
+def fingerprint(csv_file):
+    """
+    Size, mtime and hash of a file. Only the first and last MB are hashed so that checking the cache of a multi GB
+    file stays quick; together with the size and mtime that is enough to see the file has been replaced.
+    :param csv_file:
+    :return: dict - {'size': int, 'mtime': float, 'hash': str}
+    """
+    stat = os.stat(csv_file)
+    sha = hashlib.sha1()
+    with open(csv_file, 'rb') as f:
+        sha.update(f.read(HASH_BLOCK))
+        if stat.st_size > HASH_BLOCK:
+            f.seek(max(HASH_BLOCK, stat.st_size - HASH_BLOCK))
+            sha.update(f.read(HASH_BLOCK))
+    return {'size': stat.st_size, 'mtime': stat.st_mtime, 'hash': sha.hexdigest()}
+
+
+def read_meta(csv_file, where=None):
+    """Returns the meta.json of the cache of the where rows (see cache_dir) or None if there is no cache"""
+    try:
+        with open(cache_dir(csv_file, where) + 'meta.json') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def is_current(csv_file, where=None):
+    """True if there is a cache of the where rows of csv_file (see cache_dir) made from the file as it is now"""
+    meta = read_meta(csv_file, where)
+    if meta is None or meta.get('version') != STORE_VERSION or os.path.exists(csv_file) is False:
+        return False
+    return meta['fingerprint'] == fingerprint(csv_file)
+
+
+class ColumnWriter:
+    """Appends one column chunk by chunk to a raw file, coding strings to category numbers as it goes"""
+
+    def __init__(self, folder, name, kind):
+        self.folder = folder
+        self.name = name
+        self.kind = kind
+        self.codes = {}
+        self.file = open('{}{}.raw'.format(folder, name), 'wb')
+        self.dtype = {'price': np.int32, 'date': np.int32, 'id': 'S{}'.format(ID_WIDTH), 'category': np.int32}[kind]
+
+    def append(self, series):
+        if self.kind == 'price':
+            values = series.values.astype(np.int64)
+            if len(values) and (values.max() > np.iinfo(np.int32).max or values.min() < 0):
+                raise ValueError('Price out of int32 range, cannot cache {}'.format(self.name))
+            values = values.astype(np.int32)
+        elif self.kind == 'date':
+            values = (pd.to_datetime(series.str[:10], format='%Y-%m-%d').values.astype('datetime64[D]')
+                      .astype(np.int64).astype(np.int32))
+        elif self.kind == 'id':
+            strings = series.astype(str)
+            if len(strings) and strings.str.len().max() > ID_WIDTH:
+                raise ValueError('ID longer than {} characters, cannot cache'.format(ID_WIDTH))
+            values = strings.values.astype(self.dtype)
+        else:
+            notnull = series.notnull().values
+            strings = series[notnull].astype(str)
+            for value in pd.unique(strings.values):
+                if value not in self.codes:
+                    self.codes[value] = len(self.codes)
+            values = np.full(len(series), -1, dtype=np.int32)
+            values[notnull] = strings.map(self.codes).values
+        values.tofile(self.file)
+
+    def close(self):
+        """Turns the raw file into a .npy file and saves the categories"""
+        self.file.close()
+        raw = '{}{}.raw'.format(self.folder, self.name)
+        data = np.fromfile(raw, dtype=self.dtype)
+        np.save('{}{}.npy'.format(self.folder, self.name), data)
+        os.remove(raw)
+        if self.kind == 'category':
+            categories = sorted(self.codes, key=self.codes.get)
+            np.save('{}{}_categories.npy'.format(self.folder, self.name), np.array(categories, dtype=str))
+
+
+def ingest(csv_file, chunks, where=None):
+    """
+    Saves the chunks as the columnar cache of csv_file, replacing any cache of the same rows already there
+    :param csv_file: csv the chunks came from, used to name the folder and fingerprint the cache
+    :param chunks: iterable of dataframes, as given by Data.read_csv
+    :param where: description of the filter the chunks were read with (RowFilter.describe), None for every row
+    :return: meta dict
+    """
+    folder = cache_dir(csv_file, where)
+    tmp = folder[:-1] + '.tmp/'
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+
+    writers = None
+    kinds = {}
+    date_suffix = None
+    rows = 0
+    for chunk in chunks:
+        if writers is None:
+            for column in chunk.columns:
+                if column == 'Price':
+                    kinds[column] = 'price'
+                elif column == 'Date_sold':
+                    kinds[column] = 'date'
+                elif column == 'ID':
+                    kinds[column] = 'id'
+                else:
+                    kinds[column] = 'category'
+            writers = [ColumnWriter(tmp, column, kinds[column]) for column in chunk.columns]
+            columns = list(chunk.columns)
+        if len(chunk) == 0:
+            continue
+        # The dates are all 'yyyy-mm-dd 00:00' in the price paid data so only the day is kept
+        suffixes = chunk['Date_sold'].str[10:].unique()
+        if date_suffix is None:
+            date_suffix = suffixes[0]
+        if len(suffixes) != 1 or suffixes[0] != date_suffix:
+            shutil.rmtree(tmp)
+            raise ValueError('Dates have a time of day, cannot cache {}'.format(csv_file))
+        for writer in writers:
+            writer.append(chunk[writer.name])
+        rows += len(chunk)
+
+    for writer in writers or []:
+        writer.close()
+    # Fingerprinted once the chunks are read, as a csv being downloaded while it is parsed is only there at the end
+    source = fingerprint(csv_file)
+    meta = {'version': STORE_VERSION, 'fingerprint': source, 'rows': rows, 'columns': columns if writers else [],
+            'kinds': kinds, 'date_suffix': date_suffix or '', 'where': where}
+    with open(tmp + 'meta.json', 'w') as f:
+        json.dump(meta, f)
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.rename(tmp, folder)
+    return meta
+
+
+def read_chunks(csv_file, chunksize, start=0, stop=None, columns=None, categorical=(), parse_dates=False, where=None):
+    """
+    Reads the cache of csv_file back in chunks that look like the ones Data.read_csv makes from the text
+    Text columns come back as strings (numbers in text columns are not turned back into numbers).
+    :param csv_file:
+    :param chunksize: rows per chunk
+    :param start: first row to read
+    :param stop: row to stop before, None for the end
+    :param columns: only load and return these columns, None for all of them
+    :param categorical: columns to return as pandas categoricals, made straight from the saved codes
+    :param parse_dates: True to return Date_sold as datetime64 days rather than strings
+    :param where: description of the filter of the cache to read (see cache_dir), None for the cache of every row
+    :yield data frame
+    """
+    folder = cache_dir(csv_file, where)
+    meta = read_meta(csv_file, where)
+    columns = meta['columns'] if columns is None else [column for column in columns if column in meta['columns']]
+    data_columns = {}
+    categories = {}
+    for column in columns:
+        data_columns[column] = np.load('{}{}.npy'.format(folder, column), mmap_mode='r')
+        if meta['kinds'][column] == 'category':
+            saved = np.load('{}{}_categories.npy'.format(folder, column)).astype(object)
+            if column in categorical:
+                # One Index for every chunk so its uniqueness is only checked once
+                categories[column] = pd.Index(saved)
+            else:
+                # Add nan on the end so -1 codes look up nan
+                categories[column] = np.append(saved, np.nan)
+
+    if meta['rows'] == 0:
+        return
+    if 'Date_sold' in data_columns and parse_dates is False:
+        days = data_columns['Date_sold']
+        first_day = int(days.min())
+        day_strings = np.arange(first_day, int(days.max()) + 1).astype('datetime64[D]').astype(str).astype(object)
+        day_strings = day_strings + meta['date_suffix']
+
+    stop = meta['rows'] if stop is None else min(stop, meta['rows'])
+    for first in range(start, stop, chunksize):
+        last = min(first + chunksize, stop)
+        data = {}
+        for column in columns:
+            values = np.asarray(data_columns[column][first:last])
+            kind = meta['kinds'][column]
+            if kind == 'price':
+                data[column] = values.astype(np.int64)
+            elif kind == 'date' and parse_dates is True:
+                data[column] = values.astype('datetime64[D]').astype('datetime64[ns]')
+            elif kind == 'date':
+                data[column] = day_strings[values - first_day]
+            elif kind == 'id':
+                data[column] = values.astype('U{}'.format(ID_WIDTH)).astype(object)
+            elif column in categorical:
+                data[column] = pd.Categorical.from_codes(values, categories[column])
+            else:
+                data[column] = categories[column][values]
+        yield pd.DataFrame(data, columns=columns, index=pd.RangeIndex(first, last))
+
+
+def years_of_days(days):
+    """Year of each int day since 1970-01-01, by a look up table over the days' range"""
+    days = np.asarray(days)
+    if len(days) == 0:
+        return np.zeros(0, dtype=np.int64)
+    first = int(days.min())
+    table = np.arange(first, int(days.max()) + 1).astype('datetime64[D]').astype('datetime64[Y]').astype(np.int64)
+    return table[days - first] + 1970
+
+
+class SalesTable:
+    """
+    The cache of csv_file as memory mapped arrays, one per column: Price int32, Date_sold int32 days, ID bytes and
+    the text columns as int32 codes into their categories. Nothing is turned into pandas objects, so a pass over the
+    whole table is a read of the few arrays it needs, and processes reading the same table share the pages.
+    Columns worked out from a text column, e.g. Area from Postcode, are saved next to the others with derive.
+    :param csv_file: csv with a current cache, see ingest
+    :param where: description of the filter of the cache (see cache_dir), None for the cache of every row
+    """
+
+    def __init__(self, csv_file, where=None):
+        if is_current(csv_file, where) is False:
+            raise ValueError('No current cache of {}, ingest it first'.format(csv_file))
+        self.csv_file = csv_file
+        self.folder = cache_dir(csv_file, where)
+        self.meta = read_meta(csv_file, where)
+        self.rows = self.meta['rows']
+        self.arrays = {}
+        self.category_arrays = {}
+
+    def columns(self):
+        """Columns of the csv and derived columns in the table"""
+        return self.meta['columns'] + self.meta.get('derived', [])
+
+    def column(self, name):
+        """Memory mapped array of a column, codes for the text columns"""
+        if name not in self.arrays:
+            if name not in SalesTable.columns(self):
+                raise KeyError('{} not in the sales table. Columns are {}'.format(name, SalesTable.columns(self)))
+            self.arrays[name] = np.load('{}{}.npy'.format(self.folder, name), mmap_mode='r')
+        return self.arrays[name]
+
+    def categories(self, name):
+        """Strings the codes of a text column are the place of, -1 codes are nan"""
+        if name not in self.category_arrays:
+            self.category_arrays[name] = np.load('{}{}_categories.npy'.format(self.folder, name)).astype(object)
+        return self.category_arrays[name]
+
+    def blocks(self, columns, chunksize, start=0, stop=None):
+        """
+        Runs of rows of some columns
+        :param columns: column names
+        :param chunksize: rows per block
+        :param start: first row
+        :param stop: row to stop before, None for the end
+        :yield dict of column name to array, read into memory
+        """
+        arrays = [SalesTable.column(self, name) for name in columns]
+        stop = self.rows if stop is None else min(stop, self.rows)
+        for first in range(start, stop, chunksize):
+            last = min(first + chunksize, stop)
+            yield dict(zip(columns, [np.asarray(array[first:last]) for array in arrays]))
+
+    def derive(self, name, source, func, chunksize=2 ** 22):
+        """
+        Saves a text column worked out from the categories of another, e.g. Area from Postcode, so it is only worked
+        out once per category rather than once per row
+        :param name: name of the new column
+        :param source: text column it is worked out from
+        :param func: takes an array of the source categories and gives an array of the new column's value for each,
+         nan for none
+        """
+        values = pd.Series(np.asarray(func(SalesTable.categories(self, source)), dtype=object))
+        # The -1 code of a nan source gives the -1 code of nan
+        codes, categories = pd.factorize(values)
+        codes = np.append(codes, -1).astype(np.int32)
+        tmp = '{}{}.tmp.npy'.format(self.folder, name)
+        source_codes = SalesTable.column(self, source)
+        out = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.int32, shape=(self.rows,)) if self.rows else None
+        for first in range(0, self.rows, chunksize):
+            out[first:first + chunksize] = codes[np.asarray(source_codes[first:first + chunksize])]
+        if out is None:
+            np.save(tmp, np.zeros(0, dtype=np.int32))
+        else:
+            out.flush()
+            del out
+        np.save('{}{}_categories.npy'.format(self.folder, name), np.array(categories, dtype=str))
+        os.replace(tmp, '{}{}.npy'.format(self.folder, name))
+        self.meta['derived'] = [c for c in self.meta.get('derived', []) if c != name] + [name]
+        self.meta['kinds'][name] = 'category'
+        with open(self.folder + 'meta.json.tmp', 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(self.folder + 'meta.json.tmp', self.folder + 'meta.json')
+        self.arrays.pop(name, None)
+        self.category_arrays.pop(name, None)
+
+    def nbytes(self, columns=None):
+        """Bytes on disk of some columns, all of them if not given"""
+        columns = SalesTable.columns(self) if columns is None else columns
+        return sum(os.path.getsize('{}{}.npy'.format(self.folder, name)) for name in columns)
@@ -0,0 +1,150 @@
+#! /usr/local/bin/python3.6
+
+"""
+Parsers of the wikipedia plaque list pages, giving the rows of their wiki tables and the links to the other lists.
+
+Two backends give the same rows:
+    bs4  - BeautifulSoup tree of the page, searched with find_all (PlaqueScrape.table_scrape)
+    fast - one pass over the page with html.parser keeping only what the rows need, see fast_tables. It follows
+           the rules of beautifulsoup4 4.6.0, the version pinned in requirements.txt, so with that version every row
+           is the same as the bs4 one down to the character. It is imported the first time it is used.
+
+    rows, links = parse_page(html, backend='fast')
+"""
+
+import re
+
+import bs4
+
+
+WIKI_HEAD = 'https://en.wikipedia.org'
+BRACKETED = re.compile(r'\(\w+\)')
+LIFESPAN = re.compile(r'\d\d\d\d-\d\d\d\d')
+CLUTTER = ['\n', '\xa0', '(', ')']
+COORD_CLASS = 'plainlinks nourlexpansion'
+HATNOTE_CLASS = 'hatnote navigation-not-searchable'
+
+
+def string_clean(string, person):
+    """Removes all crap in brackets and other clutter"""
+    string = string.strip()
+    string = string.replace('–', '-')
+    result = BRACKETED.findall(string)
+    for item in result:
+        string = string.replace(item, ' ')
+
+    for item in CLUTTER:
+        string = string.replace(item, ' ')
+
+    if person is True:
+        # Remove yyyy-yyyy dates
+        result = LIFESPAN.findall(string)
+        for item in result:
+            string = string.replace(item, ' ')
+    return string
+
+
+def table_scrape(table):
+    """
+    Function takes in wiki table and outputs list of dictionaries
+    :param table: bs4 wiki table
+    :return: [{person, wiki, address, year}, ]
+    """
+    data_list = []  # list of dictionaries [{person, wiki, address, year}, ]
+    head = table.find_all('tr', {'class': 'vevent'})
+    if head != []:
+        # Then it's a sortable table
+        for row in head:  # No need to skip as vevent missed the heading
+            columns = row.find_all(['th', 'td'])
+            person = columns[0].text  # The person's name is the first column
+            try:
+                persons_wiki = WIKI_HEAD + columns[0].find('a').get('href')
+            except:
+                persons_wiki = None
+
+            address = columns[2].text  # Third column is the address
+            year = columns[3].text  # 4th column is the year
+
+            coord = columns[2].find_all('span', {'class': COORD_CLASS})
+            if coord != []:
+                address = address.replace(coord[0].text, '')
+            person = string_clean(person, True)
+            year = string_clean(year, False)
+            data_list.append({'person': person, 'wiki': persons_wiki, 'address': address, 'year': year})
+
+    else:
+        # It's a normal table
+        # Headings should always be Person, Inscription, Location, Year, Photo, Sometimes other stuff.
+        rows = table.find_all('tr')
+        heading = rows[0]
+        for row in rows[1:]:  # First row is the heading
+            columns = row.find_all('td')
+            data_list.append(normal_row(columns))
+    return data_list
+
+
+def normal_row(columns):
+    """Row of a table without vevent rows, columns are its td cells"""
+    person = columns[0].text
+    try:
+        persons_wiki = WIKI_HEAD + columns[0].find('a').get('href')
+    except AttributeError:
+        persons_wiki = None
+    if len(columns) == 1:
+        address = None
+        year = None
+    else:
+        address = columns[2].text
+        year = columns[3].text
+        year = string_clean(year, False)
+    person = string_clean(person, True)
+    return {'person': person, 'wiki': persons_wiki, 'address': address, 'year': year}
+
+
+def page_rows(soup):
+    """
+    Rows of every wiki table in a page
+    :param soup: bs4 soup of the page
+    :return: [{person, wiki, address, year}, ]
+    """
+    data = []
+    # First column is always the person it's for.
+    # Location is always 3rd column and year is always 4th
+    for table in soup.find_all('table', {'class': 'wikitable'}):
+        data.extend(table_scrape(table))
+    return data
+
+
+def page_links(soup):
+    """Urls of the other plaque list pages a page links to"""
+    other_links = soup.find_all('div', {'class': HATNOTE_CLASS})
+    return [WIKI_HEAD + (link.find('a').get('href')) for link in other_links]
+
+
+def bs4_page(html):
+    """(rows, links) of a page with the bs4 backend"""
+    soup = bs4.BeautifulSoup(html, 'html.parser')
+    return page_rows(soup), page_links(soup)
+
+
+def fast_page(html):
+    """(rows, links) of a page with the fast backend"""
+    from blue_plaques.blue_plaques import fast_tables
+    return fast_tables.fast_page(html)
+
+
+BACKENDS = {'bs4': bs4_page, 'fast': fast_page}
+
+
+def parse_page(html, backend='fast'):
+    """
+    Rows of the wiki tables of a page and the links to the other plaque lists
+    :param html: str of the page
+    :param backend: 'fast' or 'bs4'
+    :return: ([{person, wiki, address, year}, ], [urls])
+    """
+    try:
+        parse = BACKENDS[backend]
+    except KeyError:
+        raise KeyError('{} not allowed. Try fast or bs4'.format(backend))
+    return parse(html)
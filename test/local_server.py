@@ -0,0 +1,56 @@
+#! /usr/local/bin/python3.6
+
+"""
+Local HTTP server for the tests of the code that fetches pages and files. Each test file keeps only its handler.
+
+    class Handler(local_server.QuietHandler):
+        def do_GET(self):
+            ...self.server.pages...
+
+    self.server = local_server.serve(self, Handler, pages={...})    # in setUp, stopped when the test ends
+    requests.get(self.server.url + '/wiki/London')
+"""
+
+import http.server
+import socketserver
+import threading
+
+
+class QuietHandler(http.server.BaseHTTPRequestHandler):
+    """Request handler that doesn't log each request"""
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """
+    Server on a free local port, answering in threads
+    :param handler: request handler class, it finds what to serve as attributes of self.server
+    :param state: attributes set on the server for the handler
+    """
+    daemon_threads = True
+
+    def __init__(self, handler, **state):
+        http.server.HTTPServer.__init__(self, ('127.0.0.1', 0), handler)
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.url = 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def serve(test, handler, **state):
+    """
+    Starts a LocalServer for a unittest.TestCase, stopped when the test is over
+    :return: LocalServer
+    """
+    server = LocalServer(handler, **state).start()
+    test.addCleanup(server.stop)
+    return server
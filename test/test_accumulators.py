@@ -0,0 +1,147 @@
+#! /usr/local/bin/python3.6
+
+import unittest
+import pandas as pd
+import numpy as np
+
+from blue_plaques.blue_plaques import accumulators
+
+
+class TestAreaYearStats(unittest.TestCase):
+    def setUp(self):
+        """Random lognormal prices over a few area/years, with one group of equal prices and one of a single price"""
+        rng = np.random.RandomState(1)
+        n = 5000
+        self.df = pd.DataFrame({'Area': rng.choice(['N1', 'N7', 'AL10'], n),
+                                'Year': rng.choice([1995, 2014, 2017], n),
+                                'Price': np.round(np.exp(rng.normal(12, 0.8, n)))})
+        self.df = pd.concat([self.df, pd.DataFrame({'Area': ['E13'] * 4 + ['W8'], 'Year': [2000] * 4 + [2001],
+                                                    'Price': [500.0] * 4 + [900.0]})], ignore_index=True)
+
+    def expected(self):
+        groups = self.df.groupby(['Area', 'Year'])['Price']
+        df = pd.DataFrame({'median': groups.median(), 'mean': groups.mean(), 'number': groups.count(),
+                           'sd': groups.std(), 'skew': groups.skew(), 'sum_of_x': groups.sum(),
+                           'sum_of_x_sqr': (self.df['Price'] ** 2).groupby([self.df['Area'], self.df['Year']]).sum()})
+        return df.reset_index()
+
+    def test_to_frame(self):
+        """Stats from one update match pandas, the median to within alpha"""
+        stats = accumulators.AreaYearStats(alpha=0.01).update(self.df['Area'], self.df['Year'], self.df['Price'])
+        stats = stats.to_frame()
+        expected = self.expected()
+        self.assertEqual(list(stats.columns),
+                         ['median', 'mean', 'number', 'sd', 'skew', 'sum_of_x', 'sum_of_x_sqr', 'Area', 'Year'])
+        self.assertEqual(stats['Area'].tolist(), expected['Area'].tolist())
+        self.assertEqual(stats['Year'].tolist(), expected['Year'].tolist())
+        self.assertEqual(stats['number'].tolist(), expected['number'].tolist())
+        for column in ['mean', 'sd', 'skew', 'sum_of_x', 'sum_of_x_sqr']:
+            np.testing.assert_allclose(stats[column].values, expected[column].values, rtol=1e-9, atol=1e-9)
+        self.assertTrue(((stats['median'] - expected['median']).abs() <= 0.01 * expected['median']).all())
+
+    def test_merge(self):
+        """Updating chunk by chunk gives the same stats as one update of everything"""
+        whole = accumulators.AreaYearStats().update(self.df['Area'], self.df['Year'], self.df['Price']).to_frame()
+        chunked = accumulators.AreaYearStats()
+        for start in range(0, len(self.df), 700):
+            chunk = self.df[start:start + 700]
+            chunked.merge(accumulators.AreaYearStats().update(chunk['Area'], chunk['Year'], chunk['Price']))
+        chunked = chunked.to_frame()
+        self.assertEqual(chunked['median'].tolist(), whole['median'].tolist())
+        for column in ['mean', 'number', 'sd', 'skew', 'sum_of_x', 'sum_of_x_sqr']:
+            np.testing.assert_allclose(chunked[column].values, whole[column].values, rtol=1e-9)
+
+    def test_exact_medians(self):
+        """Second pass gives the medians pandas does, and the sketch ones are within alpha of them"""
+        stats = accumulators.AreaYearStats(alpha=0.05)
+        for start in range(0, len(self.df), 700):
+            chunk = self.df[start:start + 700]
+            stats.update(chunk['Area'], chunk['Year'], chunk['Price'])
+        exact = accumulators.ExactMedians(stats)
+        for start in range(0, len(self.df), 900):
+            chunk = self.df[start:start + 900]
+            exact.update(chunk['Area'], chunk['Year'], chunk['Price'])
+        expected = self.df.groupby(['Area', 'Year'])['Price'].median()
+
+        medians = exact.medians()
+        self.assertEqual(medians.tolist(), expected.tolist())
+        self.assertLess(exact.nbytes(), self.df.memory_usage(deep=True).sum())
+        self.assertEqual(stats.to_frame(medians)['median'].tolist(), expected.tolist())
+
+        self.assertEqual(accumulators.median_accuracy(medians, expected)['max_relative_error'], 0)
+        accuracy = accumulators.median_accuracy(stats.medians(), medians)
+        self.assertEqual(accuracy['groups'], len(expected))
+        self.assertLessEqual(accuracy['max_relative_error'], 0.05)
+
+    def test_subtract(self):
+        """Taking a chunk back out gives the stats of the rest, and groups with nothing left are dropped"""
+        rest, chunk = self.df[:4000], self.df[4000:]
+        stats = accumulators.AreaYearStats().update(self.df['Area'], self.df['Year'], self.df['Price'])
+        stats.subtract(accumulators.AreaYearStats().update(chunk['Area'], chunk['Year'], chunk['Price']))
+        stats = stats.to_frame()
+        expected = accumulators.AreaYearStats().update(rest['Area'], rest['Year'], rest['Price']).to_frame()
+        self.assertEqual(stats['Area'].tolist(), expected['Area'].tolist())
+        self.assertEqual(stats['median'].tolist(), expected['median'].tolist())
+        for column in ['mean', 'number', 'sd', 'skew', 'sum_of_x', 'sum_of_x_sqr']:
+            np.testing.assert_allclose(stats[column].values, expected[column].values, rtol=1e-9)
+        self.assertNotIn('E13', stats['Area'].tolist())
+
+        with self.assertRaises(ValueError):
+            accumulators.AreaYearStats().update(rest['Area'], rest['Year'], rest['Price']).subtract(
+                accumulators.AreaYearStats().update(chunk['Area'], chunk['Year'], chunk['Price']))
+
+    def test_merge_different_alpha(self):
+        with self.assertRaises(ValueError):
+            accumulators.AreaYearStats(0.01).merge(accumulators.AreaYearStats(0.02))
+
+
+class TestSampleMoments(unittest.TestCase):
+    def test_update_merge(self):
+        """Chunks added one at a time or merged from other accumulators give numpy's mean and variance"""
+        rng = np.random.RandomState(2)
+        values = rng.lognormal(0, 0.8, 10000) + 1e6
+        chunked = accumulators.SampleMoments()
+        for chunk in np.array_split(values, 7):
+            chunked.update(chunk)
+        merged = accumulators.SampleMoments()
+        for chunk in np.array_split(values, 3):
+            merged.merge(accumulators.SampleMoments().update(chunk))
+        merged.add(accumulators.SampleMoments()).add([])
+        for moments in [chunked, merged]:
+            self.assertEqual(moments.n, 10000)
+            self.assertAlmostEqual(moments.mean, values.mean(), delta=1e-9 * values.mean())
+            self.assertAlmostEqual(moments.variance(), values.var(ddof=1), delta=1e-9 * values.var())
+        n, sum_of_x, sum_of_x_sqr = chunked.sums()
+        self.assertAlmostEqual(sum_of_x, values.sum(), delta=1e-9 * values.sum())
+        self.assertTrue(np.isnan(accumulators.SampleMoments().update([1.0]).variance()))
+
+    def test_reservoir(self):
+        """Every value is as likely to be in the sample, whether added in chunks or merged"""
+        counts = np.zeros(100)
+        for seed in range(400):
+            chunked = accumulators.Reservoir(10, seed)
+            for chunk in np.array_split(np.arange(60.0), 4):
+                chunked.update(chunk)
+            merged = accumulators.Reservoir(10, seed).update(np.arange(60.0, 70.0))
+            merged.merge(accumulators.Reservoir(10, seed + 1000).update(np.arange(70.0, 100.0)))
+            merged.merge(chunked)
+            self.assertEqual(merged.seen, 100)
+            self.assertEqual(len(np.unique(merged.sample())), 10)
+            counts[merged.sample().astype(int)] += 1
+        # 40 expected in each, the binomial sd is 6
+        self.assertTrue(((counts > 10) & (counts < 70)).all())
+        self.assertTrue(abs(counts[:60].mean() - counts[60:].mean()) < 3)
+
+        small = accumulators.Reservoir(10).update([1.0, 2.0])
+        self.assertEqual(sorted(small.sample()), [1.0, 2.0])
+        with self.assertRaises(ValueError):
+            small.merge(accumulators.Reservoir(5))
+        moments = accumulators.SampleMoments(reservoir=10, seed=0).update(np.arange(50.0))
+        moments.merge(accumulators.SampleMoments(reservoir=10, seed=1).update(np.arange(50.0, 80.0)))
+        self.assertEqual(moments.reservoir.seen, 80)
+        with self.assertRaises(ValueError):
+            moments.merge(accumulators.SampleMoments().update([1.0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
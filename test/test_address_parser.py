@@ -0,0 +1,135 @@
+#! /usr/local/bin/python3.6
+
+import os
+import random
+import re
+import unittest
+
+import pandas as pd
+
+from blue_plaques.blue_plaques import address_parser
+
+resources_file = '{}/Resources/'.format(os.path.dirname(os.path.dirname(__file__)))
+
+
+class OldNormalise:
+    """NormaliseDF's address parsing before address_parser, given the price paid data rather than reading it"""
+
+    def __init__(self, pp):
+        self.pp = pp
+
+    @staticmethod
+    def get_postcode(address):
+        pc = re.findall(r'[A-Z]{1,2}[0-9R][0-9A-Z]? [0-9][A-Z]{2}', address)
+        if len(pc) == 0:
+            return ''
+        else:
+            return pc[0].strip()
+
+    def get_paon(self, address):
+        postcode = self.get_postcode(address)
+        address = address.upper().replace(postcode, ' ').strip()
+
+        if re.match(r'[0-9]+ ?- ?[0-9]+', address):  # num - num
+            a, b = re.match(r'[0-9]+ ?- ?[0-9]+', address)[0].split('-')
+            return f'{a.strip()} - {b.strip()}'.strip()
+
+        elif re.match(r'[0-9]+[A-Z]? ', address):  # num or num letter
+            return re.match(r'[0-9]+[A-Z]? ', address)[0].strip()
+
+        elif re.match(r'[A-Z ]+, [0-9]+ ?- ?[0-9]+', address):  # name, num/num-num
+            a, b = re.search(r'[0-9]+ ?- ?[0-9]+', address)[0].split('-')
+            return f'{re.match(r"[A-Z ]+,", address)[0]} {a.strip()} - {b.strip()}'
+
+        elif re.match(r'[A-Z ]+, [0-9]+ ', address):  # name, num/num-num
+            return f'{re.match(r"[A-Z ]+, [0-9]+ ", address)[0]}'.strip()
+
+        else:
+            paons = list(set(self.pp.loc[self.pp['PAON'] == self.get_postcode(address)]['Street'].tolist()))
+            for paon in paons:
+                if paon in address:
+                    return paon
+        return None
+
+    def get_street(self, address):
+        address = address.upper().replace(self.get_postcode(address), '')
+
+        streets = list(set(self.pp.loc[self.pp['Postcode'] == self.get_postcode(address)]['Street'].tolist()))
+        streets = [x for x in streets if str(x) != 'nan']
+        if len(streets) == 1:
+            return streets[0]
+
+        for street in streets:
+            if street.replace("'", ' ') in address.replace("'", ' '):
+                return street
+        street_names = ['TERRACE', 'COURT', 'SQUARE', 'GATE', 'PLACE', 'ROAD', 'LANE', 'WALK', 'CRESCENT', 'AVENUE']
+        for s in street_names:
+            if len(re.findall(r'[A-Z ]+ {}'.format(s), address)) > 0:
+                return re.findall(r'[A-Z ]+ {}'.format(s), address)[0]
+        return None
+
+    def parse_address(self, address):
+        postcode = self.get_postcode(address)
+        street = self.get_street(address)
+        paon = self.get_paon(address)
+
+        return paon, street, postcode
+
+
+def mutate(rng, address):
+    """Address changed the ways that take the other paths of the parser"""
+    change = rng.randint(0, 6)
+    if change == 0:
+        return address.lower()
+    elif change == 1:
+        return re.sub(r'[A-Z]{1,2}[0-9R][0-9A-Z]? [0-9][A-Z]{2}', '', address)
+    elif change == 2:
+        return '{}-{} {}'.format(rng.randint(1, 99), rng.randint(1, 99), address.split(' ', 1)[-1])
+    elif change == 3:
+        return 'THE OLD HOUSE, {} - {} {}'.format(rng.randint(1, 9), rng.randint(10, 99), address)
+    elif change == 4:
+        return 'GATE HOUSE, {}A {} ROAD COURT, LANE'.format(rng.randint(1, 9), address)
+    elif change == 5:
+        return address + ', ' + address.lower()
+    return address.replace(',', ' ')
+
+
+class TestAddressParser(unittest.TestCase):
+    def setUp(self):
+        df = pd.read_csv(resources_file + 'normalised_bp_data.csv')
+        self.addresses = df['address'].dropna().tolist()
+        rng = random.Random(0)
+        self.addresses += [mutate(rng, rng.choice(self.addresses)) for _ in range(1000)]
+        # Price paid rows for the plaque postcodes, and ones keyed on '' and on postcodes as PAONs, which is what the
+        # old look ups asked for when the postcode had been taken out of the address already
+        streets = df['Street'].tolist()
+        rows = [[str(paon), street, postcode] for paon, street, postcode in
+                zip(df['PAON'], streets, df['Postcode'])]
+        rows += [['', 'WESTMORELAND ROAD', ''], ['1', 'UPPER STREET', ''], ['', 'LANE', 'NW1 4PT'], ['NW1 4PT', 'YORK TERRACE', 'SW1A 1AA']]
+        rows += [[postcode, rng.choice(streets), postcode] for postcode in df['Postcode'].dropna()[::3]]
+        rows += [[postcode, 'SECOND STREET', postcode] for postcode in df['Postcode'].dropna()[::5]]
+        self.pp = pd.DataFrame(rows, columns=['PAON', 'Street', 'Postcode'])
+
+    def test_same_as_before(self):
+        """Same PAON, street and postcode as the old parsing for the plaque addresses and changed ones"""
+        old = OldNormalise(self.pp)
+        parser = address_parser.AddressParser(self.pp)
+        kinds = set()
+        for address in self.addresses:
+            self.assertEqual(parser.parse(address), old.parse_address(address), address)
+            self.assertEqual(parser.get_paon(address), old.get_paon(address), address)
+            self.assertEqual(parser.get_street(address), old.get_street(address), address)
+            paon = address_parser.PAON.match(address.upper().replace(address_parser.get_postcode(address), ' ')
+                                             .strip())
+            kinds.add(None if paon is None else paon.lastgroup)
+        self.assertEqual(kinds, {None, 'range', 'number', 'named_range', 'named_number'})
+
+    def test_street_type(self):
+        for address in ['1 HIGH ROAD, THE LANE', 'A LANE ROAD, X', ' ROAD, WALK', '12 ROADS', 'GATE HOUSE, HOUSE GATE']:
+            expected = [match for name in ['GATE', 'ROAD', 'LANE', 'WALK']
+                        for match in re.findall(r'[A-Z ]+ {}'.format(name), address)] + [None]
+            self.assertEqual(address_parser.street_type(address), expected[0], address)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,20 @@
 #! /usr/local/bin/python3.6
 
 import os
+import shutil
 import unittest
 import pandas as pd
 import numpy as np
+from scipy import stats
 
+from blue_plaques.blue_plaques import accumulators
 from blue_plaques.blue_plaques import analysis_3 as analysis
+from blue_plaques.blue_plaques import store
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
 
 
 # Keep the testing functions independent of each other
@@ -96,6 +105,31 @@ class TestAnalysis3(unittest.TestCase):
         self.assertNotEqual(analysis.find_area('N 1 2NU'), 'N 1')
         self.assertEqual(analysis.find_area(np.nan), None)
 
+    def test_get_years(self):
+        """Column version of get_year"""
+        dates = pd.Series(['1995-08-09 00:00', '2017-01-01 00:00', '2017-01-01', '1995-08-09 00:00'],
+                          index=[3, 4, 5, 6])
+        years = analysis.get_years(dates)
+        self.assertEqual(years.tolist(), [1995, 2017, 2017, 1995])
+        self.assertEqual(years.index.tolist(), [3, 4, 5, 6])
+        self.assertEqual(analysis.get_years(pd.to_datetime(dates.str[:10])).tolist(), [1995, 2017, 2017, 1995])
+        self.assertTrue(pd.isnull(analysis.get_years(pd.Series(['1995-08-09 00:00', np.nan]))[1]))
+
+    def test_find_areas(self):
+        """Column version of find_area has to agree with find_area"""
+        postcodes = pd.Series(['N1 2NU', 'ALN 2NU', 'N31 2NU', np.nan, 'N1 2NU', 'N 1 2NU'], index=list('abcdef'))
+        areas = analysis.find_areas(postcodes)
+        self.assertEqual(areas.index.tolist(), list('abcdef'))
+        for postcode, area in zip(postcodes, areas):
+            if pd.isnull(postcode):
+                self.assertTrue(pd.isnull(area))
+            else:
+                self.assertEqual(area, analysis.find_area(postcode))
+
+    def test_round_sig(self):
+        values = np.array([1 / 6, 2 / 3, 7.0, 0.00012345, 123456.0, 2.5e-5, 0.0, -4 / 3, 1.0005, 0.12345])
+        self.assertEqual(analysis.round_sig(values, 4).tolist(), [float(format(v, '.4g')) for v in values])
+
     def test_read_csv(self):
         """Tests read csv
         Makes sure that the Data.read_csv method gets the correct headings from the right bits
@@ -116,6 +150,176 @@ class TestAnalysis3(unittest.TestCase):
                 else:
                     self.assertEqual(row.Street, 'HOPPING LANE')
 
+    def test_read_csv_typed(self):
+        """Only the asked for columns are read and typed, from the text and from the columnar cache"""
+        csv = '/tmp/csv_file_typed.csv'
+        shutil.copy(self.csv, csv)
+        files = analysis.Data(csv, self.bp)
+        text = pd.concat(list(analysis.Data.read_csv(files, 6)))
+        try:
+            for cache in [False, True]:
+                if cache is True:
+                    analysis.Data.ingest(files)
+                typed = pd.concat(list(analysis.Data.read_csv(files, 6, columns=analysis.match_columns, typed=True)))
+                self.assertEqual(list(typed.columns), analysis.match_columns)
+                self.assertEqual(typed['Price'].dtype, np.int64)
+                self.assertTrue(pd.api.types.is_datetime64_any_dtype(typed['Date_sold']))
+                self.assertTrue(pd.api.types.is_categorical_dtype(typed['Postcode']))
+                self.assertEqual(typed['Price'].tolist(), text['Price'].tolist())
+                self.assertEqual(typed['Date_sold'].dt.strftime('%Y-%m-%d').tolist(),
+                                 text['Date_sold'].str[:10].tolist())
+                self.assertEqual(typed['Postcode'].astype(str).tolist(), text['Postcode'].tolist())
+                self.assertEqual(typed['Street'].fillna('').tolist(), text['Street'].fillna('').tolist())
+
+                prices = pd.concat(list(analysis.Data.read_csv(files, 1, columns=analysis.price_columns, typed=True)))
+                self.assertEqual(list(prices.columns), analysis.price_columns)
+                self.assertEqual(prices['Price'].tolist(), text['Price'].tolist())
+        finally:
+            shutil.rmtree(store.cache_dir(csv), ignore_errors=True)
+            os.remove(csv)
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow not installed')
+    def test_read_csv_pyarrow(self):
+        """pyarrow engine gives the same chunks as the c one, for the whole file and for partitions"""
+        files = analysis.Data(self.csv, self.bp)
+        for part in [None] + analysis.Data.partitions(files, 3):
+            c = list(analysis.Data.read_csv(files, 6, part, analysis.match_columns, True))
+            arrow = list(analysis.Data.read_csv(files, 6, part, analysis.match_columns, True, 'pyarrow'))
+            c = pd.concat(c) if c else pd.DataFrame(columns=analysis.match_columns)
+            arrow = pd.concat(arrow) if arrow else pd.DataFrame(columns=analysis.match_columns)
+            for column in analysis.match_columns:
+                self.assertEqual(arrow[column].astype(object).fillna('').tolist(),
+                                 c[column].astype(object).fillna('').tolist())
+
+    def test_read_csv_where(self):
+        """Filtered reads give the rows of a full read that pass the filter, from the text, parts of it and a cache"""
+        csv = '/tmp/csv_file_where.csv'
+        shutil.copy(self.csv, csv)
+        with open(csv, 'a') as f:
+            f.write('\n{12},100,2017-01-01,N7 2NU,A,A,A,2,,HOPPING LANE,Islington,A,A,KENT,A,A\nbad line\n')
+        files = analysis.Data(csv, self.bp)
+        whole = pd.concat(list(analysis.Data.read_csv(files, 6)))
+        filters = [(analysis.RowFilter(county='GREATER LONDON'), whole['County'] == 'GREATER LONDON'),
+                   (analysis.RowFilter(areas=['N7']), whole['Postcode'].str.startswith('N7 ')),
+                   (analysis.RowFilter(start='2015-01-01', stop='2017-01-01'),
+                    whole['Date_sold'].str[:4].isin(['2015', '2016'])),
+                   (analysis.RowFilter(county='GREATER LONDON', areas={'N1', 'N7'}, start='2016-01-01'),
+                    (whole['County'] == 'GREATER LONDON') & (whole['Date_sold'] >= '2016'))]
+        try:
+            for where, expected in filters:
+                expected = whole[expected]['ID'].tolist()
+                self.assertTrue(0 < len(expected) < len(whole))
+                self.assertEqual(pd.concat(list(analysis.Data.read_csv(files, 6, where=where)))['ID'].tolist(),
+                                 expected)
+                parts = analysis.Data.partitions(files, 3, where)
+                pieces = pd.concat([chunk for part in parts
+                                    for chunk in analysis.Data.read_csv(files, 6, part, ['ID'], True, where=where)])
+                self.assertEqual(pieces['ID'].tolist(), expected)
+                self.assertEqual(list(pieces.columns), ['ID'])
+
+            where, expected = filters[0]
+            analysis.Data.ingest(files, where=where)
+            self.assertTrue(analysis.Data.cached(files, where))
+            self.assertFalse(analysis.Data.cached(files))
+            self.assertEqual(pd.concat(list(analysis.Data.read_csv(files, 6, where=where)))['ID'].tolist(),
+                             whole[expected]['ID'].tolist())
+            self.assertEqual(len(pd.concat(list(analysis.Data.read_csv(files, 6)))), len(whole))
+
+            # The cache of every row and the filtered cache are kept side by side, whichever is made first
+            analysis.Data.ingest(files)
+            self.assertTrue(analysis.Data.cached(files))
+            self.assertTrue(analysis.Data.cached(files, where))
+            self.assertNotEqual(store.cache_dir(csv), store.cache_dir(csv, where.describe()))
+            self.assertEqual(store.read_meta(csv, where.describe())['rows'], len(whole[expected]))
+            for where, expected in filters:
+                self.assertEqual(pd.concat(list(analysis.Data.read_csv(files, 6, where=where)))['ID'].tolist(),
+                                 whole[expected]['ID'].tolist())
+            where = filters[1][0]
+            analysis.Data.ingest(files, where=where)
+            self.assertTrue(analysis.Data.cached(files))
+            self.assertEqual(analysis.Data.partitions(files, 2)[-1], ('rows', len(whole) // 2, len(whole)))
+            self.assertEqual(store.read_meta(csv)['rows'], len(whole))
+            self.assertTrue(analysis.Data.cached(files, filters[0][0]))
+        finally:
+            shutil.rmtree(store.cache_dir(csv), ignore_errors=True)
+            for where, _ in filters:
+                shutil.rmtree(store.cache_dir(csv, where.describe()), ignore_errors=True)
+            os.remove(csv)
+
+    def test_ingest(self):
+        """Read csv has to give the same data from the columnar cache as from the text, and stop using the cache
+        when the csv file is changed"""
+        csv = '/tmp/csv_file_ingest.csv'
+        shutil.copy(self.csv, csv)
+        files = analysis.Data(csv, self.bp)
+        text = pd.concat(list(analysis.Data.read_csv(files, 6)))
+
+        meta = analysis.Data.ingest(files)
+        self.assertEqual(meta['rows'], 10)
+        self.assertTrue(store.is_current(csv))
+        cached = pd.concat(list(analysis.Data.read_csv(files, 1)))
+        self.assertEqual(len(cached), 10)
+        for column in ['ID', 'Price', 'Date_sold', 'Postcode', 'Street', 'Locality', 'County']:
+            self.assertEqual(cached[column].fillna('').tolist(), text[column].fillna('').tolist())
+        self.assertEqual(pd.to_numeric(cached['PAON']).tolist(), pd.to_numeric(text['PAON']).tolist())
+
+        with open(csv, 'a') as f:
+            f.write('{12},100,2017-01-01,N1 2NU,A,A,A,2,,HOPPING LANE,Islington,A,A,GREATER LONDON,A,A\n')
+        self.assertFalse(store.is_current(csv))
+        self.assertEqual(len(pd.concat(list(analysis.Data.read_csv(files, 6)))), 11)
+
+        shutil.rmtree(store.cache_dir(csv))
+        os.remove(csv)
+
+    def test_sales_table(self):
+        """Arrays of the cache with outward code ids, and the same area/year stats from them as from the text"""
+        csv = '/tmp/csv_file_table.csv'
+        shutil.copy(self.csv, csv)
+        files = analysis.Data(csv, self.bp)
+        text = pd.concat(list(analysis.Data.read_csv(files, 6, columns=analysis.price_columns, typed=True)))
+        stats = analysis.Data.area_year_stats(files).to_frame()
+        where = analysis.RowFilter(areas=['N7'])
+        filtered = analysis.Data.ingest(files, where=where)
+
+        table = analysis.Data.sales_table(files)
+        self.assertTrue(analysis.Data.cached(files, where))
+        self.assertEqual(store.read_meta(csv, where.describe()), filtered)
+        self.assertEqual(table.rows, 10)
+        self.assertIsInstance(table.column('Price'), np.memmap)
+        self.assertEqual(table.column('Price').tolist(), text['Price'].tolist())
+        self.assertEqual(store.years_of_days(table.column('Date_sold')).tolist(), text['Date_sold'].dt.year.tolist())
+        self.assertEqual(table.categories('Area')[table.column('Area')].tolist(),
+                         analysis.find_areas(text['Postcode']).tolist())
+        self.assertNotIn('Area', pd.concat(list(analysis.Data.read_csv(files, 6))).columns)
+        with self.assertRaises(KeyError):
+            table.column('Region')
+
+        pd.testing.assert_frame_equal(analysis.Data.area_year_stats(files).to_frame(), stats)
+        parts = analysis.Data.partitions(files, 3)
+        self.assertEqual(parts[0][0], 'rows')
+        by_parts = accumulators.AreaYearStats(0.005)
+        for part in parts:
+            by_parts.merge(analysis.Data.area_year_stats(files, partition=part))
+        pd.testing.assert_frame_equal(by_parts.to_frame(), stats)
+        self.assertTrue(analysis.Data.cached(files, where))
+
+        shutil.rmtree(store.cache_dir(csv))
+        shutil.rmtree(store.cache_dir(csv, where.describe()))
+        os.remove(csv)
+
+    def test_partitions(self):
+        """Reading each partition in turn gives the same rows as reading the whole csv"""
+        files = analysis.Data(self.csv, self.bp)
+        whole = pd.concat(list(analysis.Data.read_csv(files, 6)))
+        for n in [1, 2, 3, 20]:
+            parts = analysis.Data.partitions(files, n)
+            self.assertTrue(len(parts) <= n)
+            self.assertEqual(parts[0][1], 0)
+            self.assertEqual(parts[-1][2], os.path.getsize(self.csv))
+            pieces = pd.concat([chunk for part in parts for chunk in analysis.Data.read_csv(files, 6, part)])
+            self.assertEqual(pieces['ID'].tolist(), whole['ID'].tolist())
+            self.assertEqual(pieces['Price'].tolist(), whole['Price'].tolist())
+
     def test_read_bp(self):
         """Read and check setUp bp csv file"""
         df = analysis.Data.read_bp(analysis.Data(self.csv, self.bp))
@@ -139,6 +343,26 @@ class TestAnalysis3(unittest.TestCase):
             ], columns=['Person', 'Wiki', 'Year', 'Number', 'Address_list', 'Postcode'])
         pd.testing.assert_frame_equal(df, test_df)
 
+    def test_read_bp_cache(self):
+        """Parsed once, parsed again when the file or bp_file changes, and callers can't change the kept one"""
+        shutil.copy(self.bp, '/tmp/bp_cache.csv')
+        files = analysis.Data(self.csv, '/tmp/bp_cache.csv')
+        try:
+            first = analysis.Data.read_bp(files)
+            first['Postcode'] = 'changed'
+            self.assertEqual(analysis.Data.read_bp(files)['Postcode'].tolist(),
+                             ['N1 2NU', 'N7 2NU', 'N7 2NU', 'N7 2NU'])
+
+            bp = pd.read_csv(self.bp)
+            bp.loc[0, 'Address'] = bp.loc[0, 'Address'].replace('N1 2NU', 'N1 9ZZ')
+            bp.to_csv('/tmp/bp_cache.csv', index=False)
+            self.assertEqual(analysis.Data.read_bp(files)['Postcode'].tolist()[0], 'N1 9ZZ')
+
+            files.bp_file = self.bp
+            self.assertEqual(analysis.Data.read_bp(files)['Postcode'].tolist()[0], 'N1 2NU')
+        finally:
+            os.remove('/tmp/bp_cache.csv')
+
     def test_average_prices(self):
         """Tests average prices of setUp csv file"""
         # Make the self chunk for the analysis. Needs to be something that read_csv can handle.
@@ -157,6 +381,71 @@ class TestAnalysis3(unittest.TestCase):
 
         pd.testing.assert_frame_equal(avg, df)
 
+    def test_house_prices_stats_streaming(self):
+        """Stats from the running totals, with exact and approx medians"""
+        files = analysis.Data(self.csv, self.bp)
+        exact = analysis.Data.house_prices_stats(files, short_cut=False, median='exact')
+        self.assertEqual(exact['Area'].tolist(), ['N1', 'N1', 'N7', 'N7'])
+        self.assertEqual(exact['Year'].tolist(), [2014, 2017, 2014, 2016])
+        self.assertEqual(exact['median'].tolist(), [600.0, 200.0, 900.0, 900.0])
+        self.assertEqual(exact['mean'].tolist(), [600.0, 200.0, 900.0, 900.0])
+        self.assertEqual(exact['number'].tolist(), [5, 3, 1, 1])
+        self.assertEqual(exact['sum_of_x_sqr'].tolist(), [1900000.0, 140000.0, 810000.0, 810000.0])
+        self.assertAlmostEqual(exact['sd'][0], 158.113883, places=5)
+
+        approx = analysis.Data.house_prices_stats(files, short_cut=False, median='approx', alpha=0.01)
+        for a, b in zip(approx['median'], exact['median']):
+            self.assertLessEqual(abs(a - b), 0.01 * b)
+        with self.assertRaises(KeyError):
+            analysis.Data.house_prices_stats(files, short_cut=False, median='mode')
+
+    def test_house_prices_stats_short_cut(self):
+        """Saved in the artifact cache of the csv and loaded from it"""
+        files = analysis.Data(self.csv, self.bp)
+        analysis.Data.artifacts(files).clear()
+        built = analysis.Data.house_prices_stats(files, short_cut=True, median='exact')
+        self.assertEqual(len(analysis.Data.artifacts(files).entries()), 1)
+        loaded = analysis.Data.house_prices_stats(files, short_cut=True, median='exact')
+        pd.testing.assert_frame_equal(loaded, built)
+        pd.testing.assert_frame_equal(loaded, analysis.Data.house_prices_stats(files, short_cut=False, median='exact'))
+        # The exact medians are the default
+        pd.testing.assert_frame_equal(analysis.Data.house_prices_stats(files, short_cut=True), built)
+        self.assertEqual(len(analysis.Data.artifacts(files).entries()), 1)
+        analysis.Data.house_prices_stats(files, short_cut=True, median='approx')
+        self.assertEqual(len(analysis.Data.artifacts(files).entries()), 2)
+        analysis.Data.artifacts(files).clear()
+
+    def test_raw_for_area_year(self):
+        """Prices of one area and year from the price store and from all_prices_df"""
+        files = analysis.Data(self.csv, self.bp)
+        for short_cut in [True, False]:
+            self.assertEqual(analysis.raw_for_area_year(files, 'N1', 2014, short_cut).tolist(),
+                             [400, 500, 600, 700, 800])
+            self.assertEqual(analysis.raw_for_area_year(files, 'N7', 2016, short_cut).tolist(), [900])
+            self.assertEqual(analysis.raw_for_area_year(files, 'N7', 2017, short_cut).tolist(), [])
+        shutil.rmtree(analysis.price_store.store_dir(self.csv))
+
+    def test_average_price_index(self):
+        """Look ups by area and year, one at a time and for whole columns"""
+        avg = pd.DataFrame([
+            ['N1', '2014', 600.0, 550.0],
+            ['N1', '2017', 200.0, 150.0],
+            ['N7', '2014', 900.0, 900.0],
+            ['N1', '2014', 1.0, 1.0]
+        ], columns=['Area', 'Year', 'mean', 'median'])
+        index = analysis.AveragePriceIndex(avg)
+        self.assertIs(analysis.AveragePriceIndex.of(index), index)
+        self.assertEqual(index.get('N1', 2014, 'mean'), 600.0)
+        self.assertEqual(index.get('N1', '2017', 'median'), 150.0)
+        with self.assertRaises(KeyError):
+            index.get('N7', 2017, 'mean')
+
+        averages = index.averages(['N1', 'N7', 'N7', 'N1'], [2017, 2014, 2017, 2014], 'mean')
+        self.assertEqual(averages[[0, 1, 3]].tolist(), [200.0, 900.0, 600.0])
+        self.assertTrue(np.isnan(averages[2]))
+        self.assertEqual(index.weight(['N1', 'N1'], [2014, 2017], [300, 300], 'median').tolist(),
+                         [300 / 550.0, 2.0])
+
     def test_exact_bp_matches(self):
         """Takes chunk and bp data
         Functions returns dataframe of EXACT matches - Person, Year, ID, Price, Date_sold"""
@@ -166,6 +455,23 @@ class TestAnalysis3(unittest.TestCase):
             correct = {'Matt Barson': ['{0}', '{1}', '{2}', '{3}', '{4}', '{5}']}
             self.assertEqual(matches, correct)
 
+    def test_plaque_matcher(self):
+        """Same matches as exact_bp_matches, with PAONs matched as numbers and streets in any case"""
+        files = analysis.Data(self.csv, self.bp)
+        matcher = analysis.PlaqueMatcher(analysis.Data.read_bp(files))
+        for chunk in analysis.Data.read_csv(files, 6):
+            self.assertEqual(matcher.match(chunk), analysis.Data.exact_bp_matches(files, chunk))
+            self.assertEqual(analysis.Data.exact_bp_matches(files, chunk, matcher),
+                             {'Matt Barson': ['{0}', '{1}', '{2}', '{3}', '{4}', '{5}']})
+
+        chunk = pd.DataFrame([['{a}', '02', 'N1 2NU', 'hopping lane', np.nan, 'LONDON'],
+                              ['{b}', '2A', 'N1 2NU', 'HOPPING LANE', np.nan, 'LONDON'],
+                              ['{c}', '2', 'N1 2NU', 'OTHER LANE', np.nan, 'LEEDS'],
+                              ['{d}', '2', 'N1 2NU', np.nan, 'ISLINGTON', 'LONDON']],
+                             columns=['ID', 'PAON', 'Postcode', 'Street', 'Locality', 'Town_City'])
+        self.assertEqual(matcher.match(chunk), {'Matt Barson': ['{a}']})
+        self.assertEqual(matcher.match(chunk[chunk['ID'] == '{b}']), {})
+
     def test_population_variation(self):
         """Tests the calculation of population variance and mean form source"""
         files = analysis.Data(self.csv, self.bp)
@@ -282,6 +588,51 @@ class TestTTests(unittest.TestCase):
 
         self.assertEqual(analysis.TTests.single_sample(data, pop_var=2250000, pop_mean=6500), (2.00, 8, 7500, 6500))
 
+    def test_t_tests_arrays_and_sums(self):
+        """Lists, arrays and SampleSums of the same samples give the same results, and the t the scipy tests do"""
+        rng = np.random.RandomState(0)
+        exp = rng.lognormal(0.2, 0.8, 60)
+        ctr = rng.lognormal(0, 0.8, 200000)
+        expected = analysis.TTests.independent_samples((exp.tolist(), ctr.tolist()))
+        self.assertEqual(analysis.TTests.independent_samples((exp, ctr)), expected)
+        self.assertEqual(analysis.TTests.independent_samples((analysis.sample_sums(exp), analysis.sample_sums(ctr))),
+                         expected)
+        self.assertEqual(expected[0], round(stats.ttest_ind(exp, ctr).statistic, 2))
+        self.assertEqual(expected[1], 200058)
+
+        self.assertEqual(analysis.TTests.single_sample(exp, pop_var=0.64, pop_mean=1.1),
+                         analysis.TTests.single_sample(exp.tolist(), pop_var=0.64, pop_mean=1.1))
+        self.assertEqual(analysis.TTests.single_sample(analysis.sample_sums(exp), pop_var=0.64, pop_mean=1.1),
+                         analysis.TTests.single_sample(exp.tolist(), pop_var=0.64, pop_mean=1.1))
+        with self.assertRaises(ValueError):
+            analysis.TTests.single_sample([1.0])
+
+        people = {str(i): {'Before': rng.lognormal(0, 0.5, rng.randint(1, 5)),
+                           'After': rng.lognormal(0.1, 0.5, rng.randint(0, 5))} for i in range(30)}
+        as_lists = {person: {k: v.tolist() for k, v in bf_af.items()} for person, bf_af in people.items()}
+        as_sums = {person: {k: analysis.sample_sums(v) for k, v in bf_af.items()} for person, bf_af in people.items()}
+        expected = analysis.TTests.repeated_measures(as_lists)
+        self.assertEqual(analysis.TTests.repeated_measures(people), expected)
+        self.assertEqual(analysis.TTests.repeated_measures(as_sums), expected)
+        both = [bf_af for bf_af in people.values() if len(bf_af['After']) > 0]
+        self.assertEqual(expected[0], round(stats.ttest_rel([b['Before'].mean() for b in both],
+                                                            [b['After'].mean() for b in both]).statistic, 2))
+
+    def test_t_tests_moments(self):
+        """SampleMoments give their own mean and sd, right even where the raw sums cancel"""
+        rng = np.random.RandomState(1)
+        exp = 1e9 + rng.normal(0.2, 1, 500)
+        ctr = 1e9 + rng.normal(0, 1, 5000)
+        moments = [analysis.accumulators.SampleMoments().update(values) for values in [exp, ctr]]
+        mean, sd = analysis.sample_mean_sd(moments[0])
+        self.assertAlmostEqual(mean, exp.mean(), delta=1e-6)
+        self.assertAlmostEqual(sd, exp.std(ddof=1), places=6)
+        # The same values as raw sums have lost the sd to cancellation
+        self.assertGreater(abs(analysis.sample_mean_sd(analysis.sample_sums(exp))[1] - exp.std(ddof=1)), 0.01)
+        self.assertAlmostEqual(analysis.sum_of_squares(moments[1]), ((ctr - ctr.mean()) ** 2).sum(), places=3)
+        t_obt = analysis.TTests.independent_samples(moments)[0]
+        self.assertEqual(t_obt, round(stats.ttest_ind(exp - 1e9, ctr - 1e9).statistic, 2))
+
 
 class TestMain(unittest.TestCase):
     def setUp(self):
@@ -391,6 +742,12 @@ class TestMain(unittest.TestCase):
         pd.DataFrame.to_csv(bpdf, '/tmp/bp.csv', index=False)
         self.bp = '/tmp/bp.csv'
 
+        # Averages of every area and year of the csv, for the runner and the save methods
+        self.avg = pd.DataFrame([[area, year, 100 * (i + 1), 50 * (i + 1)]
+                                 for i, (area, year) in enumerate([('N1', 2014), ('N1', 2017), ('AL10', 2014),
+                                                                   ('AL10', 2017), ('AL9', 2014), ('AL9', 2017)])],
+                                columns=['Area', 'Year', 'mean', 'median'])
+
     def test_main(self):
         """Tests that main method is correct. It will take the defined data from class and give the repeated, single and
         independent t-test results"""
@@ -400,6 +757,58 @@ class TestMain(unittest.TestCase):
         self.assertEqual(main[1], (-0.44, 5, 0.75, 1.0))  # Single sample
         self.assertEqual(main[2], (-0.5, 19, 0.75, 1.05))  # Independent samples
 
+    def test_runner_fused(self):
+        """The single pass runner has to give the same data sets as running each save method on its own"""
+        files = analysis.Data(self.csv, self.bp)
+
+        for avg_type in ['mean', 'median']:
+            fused = analysis.runner(files, self.avg, avg_type, fused=True)
+            separate = analysis.runner(files, self.avg, avg_type, fused=False)
+            self.assertEqual(fused, separate)
+            self.assertEqual(len(fused[0]), 3)
+
+    def test_runner_workers(self):
+        """Splitting the csv between processes gives the same data sets as one process"""
+        files = analysis.Data(self.csv, self.bp)
+        serial = analysis.runner(files, self.avg, 'mean')
+        parallel = analysis.runner(files, self.avg, 'mean', workers=3)
+        self.assertEqual(parallel[0], serial[0])
+        self.assertEqual(sorted(parallel[1]), sorted(serial[1]))
+        self.assertEqual(sorted(parallel[2][0]), sorted(serial[2][0]))
+        self.assertEqual(sorted(parallel[2][1]), sorted(serial[2][1]))
+
+    def test_runner_accumulate(self):
+        """Accumulated data sets give the t-tests the list ones do, from one process or several"""
+        files = analysis.Data(self.csv, self.bp)
+        r, s, i = analysis.runner(files, self.avg, 'mean')
+        for workers in [1, 3]:
+            r_acc, s_acc, i_acc = analysis.runner(files, self.avg, 'mean', workers=workers, accumulate=True,
+                                                  reservoir=4)
+            self.assertIsInstance(s_acc, analysis.accumulators.SampleMoments)
+            self.assertEqual(analysis.TTests.repeated_measures(r_acc), analysis.TTests.repeated_measures(r))
+            self.assertEqual(analysis.TTests.single_sample(s_acc, 1.0, 1.0), analysis.TTests.single_sample(s, 1.0, 1.0))
+            self.assertEqual(analysis.TTests.independent_samples(i_acc), analysis.TTests.independent_samples(i))
+            self.assertEqual(i_acc[1].n, len(i[1]))
+            self.assertTrue(set(i_acc[1].reservoir.sample()) <= set(i[1]))
+            self.assertEqual(len(i_acc[1].reservoir.sample()), 4)
+
+    def test_independent_samples_save_whole_chunk(self):
+        """Whole chunk version gives the lists the row by row one did"""
+        files = analysis.Data(self.csv, self.bp)
+        expected = {'mean': ([0.5, 1.0, 0.25, 0.5, 0.1667, 0.3333],
+                             [1.5, 7.0, 8.0, 0.75, 2.333, 2.667, 0.5, 1.4, 16.0]),
+                    'median': ([1.0, 2.0, 0.5, 1.0, 0.3333, 0.6667],
+                               [3.0, 14.0, 16.0, 1.5, 4.667, 5.333, 1.0, 2.8, 32.0])}
+        for avg_type in ['mean', 'median']:
+            data = ([], [])
+            for chunk in analysis.Data.read_csv(files, 6):
+                stuff = analysis.Data.independent_samples_save(files, chunk, self.avg, avg_type)
+                data[0].extend(stuff[0])
+                data[1].extend(stuff[1])
+            self.assertEqual(data, expected[avg_type])
+        with self.assertRaises(KeyError):
+            analysis.Data.independent_samples_save(files, next(analysis.Data.read_csv(files, 6)), self.avg[:1], 'mean')
+
 
 def suite():
     suite = unittest.TestSuite()
@@ -0,0 +1,93 @@
+#! /usr/local/bin/python3.6
+
+import os
+import shutil
+import time
+import unittest
+import pandas as pd
+import numpy as np
+
+from blue_plaques.blue_plaques import artifacts
+
+
+class TestArtifactCache(unittest.TestCase):
+    def setUp(self):
+        self.folder = '/tmp/artifacts_test/'
+        os.makedirs(self.folder)
+        self.csv = self.folder + 'pp-complete.csv'
+        with open(self.csv, 'w') as f:
+            f.write('a,b\n1,2\n')
+        self.cache = artifacts.ArtifactCache(artifacts.cache_dir(self.csv), 3)
+        self.builds = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def build(self):
+        self.builds += 1
+        return pd.DataFrame({'median': [600.0, np.nan], 'number': np.array([5, 3], dtype=np.int64),
+                             'Area': ['N1', 'N7'], 'Year': [2014, 2017],
+                             'Date': pd.to_datetime(['2014-01-01', '2017-05-01'])},
+                            columns=['median', 'number', 'Area', 'Year', 'Date'])
+
+    def get(self, **params):
+        return self.cache.get('house_prices_stats', self.build, [self.csv], params)
+
+    def test_get(self):
+        """Worked out once then loaded, with the same values and dtypes"""
+        first = self.get(median='approx')
+        second = self.get(median='approx')
+        self.assertEqual(self.builds, 1)
+        pd.testing.assert_frame_equal(first, second)
+
+        wide = pd.DataFrame.from_dict({'N1_2014': [1.0, 2.0], 'N7_2017': [3.0]}, orient='index')
+        loaded = self.cache.get('all_prices_df', lambda: wide, [self.csv])
+        loaded = self.cache.get('all_prices_df', lambda: None, [self.csv])
+        pd.testing.assert_frame_equal(loaded, wide)
+
+        other = {'ls': [1, 2], 'frame': wide}
+        loaded = self.cache.get('other', lambda: other)
+        loaded = self.cache.get('other', lambda: None)
+        self.assertEqual(loaded['ls'], [1, 2])
+        pd.testing.assert_frame_equal(loaded['frame'], wide)
+
+    def test_key(self):
+        """Other parameters, code versions or csv files are worked out again"""
+        self.get(median='approx')
+        self.get(median='exact')
+        self.assertEqual(self.builds, 2)
+        self.cache.version = 4
+        self.get(median='approx')
+        self.assertEqual(self.builds, 3)
+        with open(self.csv, 'a') as f:
+            f.write('3,4\n')
+        self.get(median='approx')
+        self.assertEqual(self.builds, 4)
+        self.get(median='approx')
+        self.assertEqual(self.builds, 4)
+
+    def test_evict(self):
+        """Results used longest ago are deleted when the cache is too big"""
+        for median in ['a', 'b', 'c']:
+            self.get(median=median)
+            time.sleep(0.01)
+        sizes = [e[2] for e in self.cache.entries()]
+        self.assertEqual(len(sizes), 3)
+        self.get(median='a')
+        self.cache.max_bytes = sum(sizes) - 1
+        self.cache.evict()
+        self.assertEqual(len(self.cache.entries()), 2)
+        self.get(median='a')
+        self.get(median='c')
+        self.assertEqual(self.builds, 3)
+        self.get(median='b')
+        self.assertEqual(self.builds, 4)
+
+        self.cache.max_bytes = 0
+        self.get(median='d')
+        self.assertEqual([e[0] for e in self.cache.entries()],
+                         [self.cache.key('house_prices_stats', [self.csv], {'median': 'd'})])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+#! /usr/local/bin/python3.6
+
+import time
+import unittest
+
+import bs4
+import requests
+
+from blue_plaques.blue_plaques import crawler
+from blue_plaques.test import local_server
+
+
+def wiki_page(title, people, links):
+    """Page laid out like the wikipedia plaque lists: a wikitable of plaques and hatnote links to other lists"""
+    hatnotes = ''.join('<div role="note" class="hatnote navigation-not-searchable">Main article: '
+                       '<a href="{}">{}</a></div>'.format(link, link) for link in links)
+    rows = ''.join('<tr class="vevent"><th><a href="/wiki/{0}">{0}</a></th><td>Plaque</td><td>{1} Hopping Lane</td>'
+                   '<td>{2}</td></tr>'.format(person, i, 1900 + i) for i, person in enumerate(people))
+    return ('<html><head><title>{}</title></head><body>{}<table class="wikitable sortable"><tr><th>Person</th>'
+            '<th>Inscription</th><th>Location</th><th>Year</th></tr>{}</table></body></html>').format(title, hatnotes,
+                                                                                                     rows)
+
+
+def page_rows(soup):
+    return [[column.text for column in row.find_all(['th', 'td'])] for row in soup.find_all('tr', {'class': 'vevent'})]
+
+
+class Handler(local_server.QuietHandler):
+    """Serves server.pages with keep alive, failing the first server.failures[path] requests for a path with 503"""
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        server = self.server
+        server.log.append((self.path, time.monotonic()))
+        if server.failures.get(self.path, 0) > 0:
+            server.failures[self.path] -= 1
+            status, body = 503, b'busy'
+        elif self.path in server.pages:
+            status, body = 200, server.pages[self.path].encode()
+        else:
+            status, body = 404, b'not found'
+        time.sleep(server.delay)
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TestCrawler(unittest.TestCase):
+    def setUp(self):
+        people = ['Person {}'.format(i) for i in range(60)]
+        pages = {
+            '/wiki/London': wiki_page('London', people[:10], ['/wiki/Camden', '/wiki/Westminster']),
+            '/wiki/Camden': wiki_page('Camden', people[10:30], ['/wiki/London']),
+            '/wiki/Westminster': wiki_page('Westminster', people[30:50], []),
+            '/wiki/Elsewhere': wiki_page('Elsewhere', people[50:], ['/wiki/Westminster'])}
+        self.server = local_server.serve(self, Handler, pages=pages, connections=0, log=[], failures={}, delay=0.05)
+        self.head = self.server.url
+        self.urls = [self.head + path for path in ['/wiki/London', '/wiki/Camden', '/wiki/Elsewhere']]
+
+    def page_links(self, soup):
+        return [self.head + div.find('a').get('href')
+                for div in soup.find_all('div', {'class': 'hatnote navigation-not-searchable'})]
+
+    def page(self, html):
+        soup = bs4.BeautifulSoup(html, 'html.parser')
+        return page_rows(soup), self.page_links(soup)
+
+    def serial(self):
+        """Rows the way PlaqueScrape.plaque_scrape gets them, one page at a time"""
+        data = []
+        for url in self.urls:
+            soup = bs4.BeautifulSoup(requests.get(url).text, 'html.parser')
+            data.extend(page_rows(soup))
+            for link in self.page_links(soup):
+                data.extend(page_rows(bs4.BeautifulSoup(requests.get(link).text, 'html.parser')))
+        return data
+
+    def test_crawl(self):
+        """Same rows in the same order as the serial scrape, each page fetched once over kept alive connections"""
+        expected = self.serial()
+        self.server.log = []
+        self.server.connections = 0
+        data = crawler.crawl_pages(self.urls, self.page, concurrency=3, rate=None)
+        self.assertEqual(data, expected)
+        paths = [path for path, _ in self.server.log]
+        self.assertEqual(sorted(paths), sorted(self.server.pages))
+        self.assertLessEqual(self.server.connections, 3)
+
+    def test_concurrent(self):
+        """Pages are fetched at the same time, so the crawl takes about as long as the slowest chain of links"""
+        self.server.delay = 0.3
+        start = time.monotonic()
+        crawler.crawl_pages(self.urls, self.page, concurrency=4, rate=None)
+        self.assertLess(time.monotonic() - start, 4 * 0.3)
+
+    def test_rate(self):
+        """Requests to the host start at least 1 / rate apart"""
+        self.server.delay = 0
+        crawler.crawl_pages(self.urls, self.page, concurrency=4, rate=10)
+        times = sorted(t for _, t in self.server.log)
+        self.assertGreaterEqual(min(b - a for a, b in zip(times, times[1:])), 0.09)
+
+    def test_retry(self):
+        """A page that is busy is tried again after backing off, and given up on after the retries"""
+        self.server.failures['/wiki/Camden'] = 2
+        data = crawler.crawl_pages(self.urls, self.page, rate=None, backoff=0.01)
+        self.assertEqual(len(data), (10 + 20 + 20) + (20 + 10) + (10 + 20))
+        self.assertEqual([path for path, _ in self.server.log].count('/wiki/Camden'), 3)
+
+        self.server.failures['/wiki/Camden'] = 10
+        with self.assertRaises(IOError):
+            crawler.crawl_pages(self.urls, self.page, rate=None, retries=2, backoff=0.01)
+        with self.assertRaises(requests.exceptions.HTTPError):
+            crawler.crawl_pages([self.head + '/wiki/Nowhere'], self.page, rate=None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+#! /usr/local/bin/python3.6
+
+import os
+import shutil
+import unittest
+import pandas as pd
+
+from blue_plaques.blue_plaques import analysis_3 as analysis
+from blue_plaques.blue_plaques import download
+from blue_plaques.blue_plaques import store
+from blue_plaques.test import local_server
+
+
+class Handler(local_server.QuietHandler):
+    """Serves server.data, dropping the connection after server.cut bytes for the first server.drops responses"""
+
+    def do_GET(self):
+        server = self.server
+        server.ranges.append(self.headers.get('Range'))
+        start = 0
+        if self.headers.get('Range') is not None and server.ranges_allowed is True:
+            start = int(self.headers['Range'][len('bytes='):-1])
+            if start >= len(server.data):
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */{}'.format(len(server.data)))
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, len(server.data) - 1, len(server.data)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(server.data) - start))
+        self.send_header('ETag', '"synthetic"')
+        self.end_headers()
+        if server.drops > 0:
+            server.drops -= 1
+            self.wfile.write(server.data[start:start + server.cut])
+            self.close_connection = True
+        else:
+            self.wfile.write(server.data[start:])
+
+
+class TestDownload(unittest.TestCase):
+    def setUp(self):
+        self.folder = '/tmp/download_test/'
+        os.makedirs(self.folder)
+        rows = [['{%d}' % i, 100000 + i, '2017-0{}-01 00:00'.format(i % 9 + 1), 'N{} 2NU'.format(i % 20), 'T', 'N',
+                 'F', str(i % 50), '', 'HOPPING LANE', 'ISLINGTON', 'LONDON', 'ISLINGTON', 'GREATER LONDON', 'A', 'A']
+                for i in range(5000)]
+        self.local_csv = self.folder + 'local.csv'
+        pd.DataFrame(rows, columns=analysis.price_paid_columns).to_csv(self.local_csv, index=False)
+        with open(self.local_csv, 'rb') as f:
+            data = f.read()
+
+        self.server = local_server.serve(self, Handler, data=data, ranges=[], ranges_allowed=True, drops=0,
+                                         cut=len(data) // 3)
+        self.url = self.server.url + '/pp-complete.csv'
+        self.csv = self.folder + 'pp-complete.csv'
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def assertSameFile(self):
+        with open(self.csv, 'rb') as f:
+            self.assertEqual(f.read(), self.server.data)
+        self.assertFalse(os.path.exists(self.csv + '.part'))
+
+    def test_download(self):
+        """Whole file in small blocks"""
+        self.assertEqual(download.download(self.url, self.csv, block=4096), len(self.server.data))
+        self.assertSameFile()
+        self.assertEqual(self.server.ranges, [None])
+
+    def test_resume(self):
+        """Dropped connections carry on with a Range from the bytes already there"""
+        self.server.drops = 2
+        download.download(self.url, self.csv, block=4096)
+        self.assertSameFile()
+        # Where each one carries on from depends on how much of the dropped response got through the buffering
+        self.assertEqual(len(self.server.ranges), 3)
+        self.assertIsNone(self.server.ranges[0])
+        starts = [int(value[len('bytes='):-1]) for value in self.server.ranges[1:]]
+        self.assertTrue(0 < starts[0] < starts[1] <= 2 * self.server.cut, self.server.ranges)
+
+    def test_resume_part_file(self):
+        """A .part file from an earlier run is carried on from, also when the server ignores Range"""
+        for ranges_allowed in [True, False]:
+            with open(self.csv + '.part', 'wb') as f:
+                f.write(self.server.data[:1000])
+            self.server.ranges_allowed = ranges_allowed
+            self.server.ranges = []
+            download.download(self.url, self.csv, block=4096)
+            self.assertSameFile()
+            self.assertEqual(self.server.ranges, ['bytes=1000-'])
+            os.remove(self.csv)
+
+        with open(self.csv + '.part', 'wb') as f:
+            f.write(self.server.data)
+        self.server.ranges_allowed = True
+        download.download(self.url, self.csv)
+        self.assertSameFile()
+
+    def test_size_check(self):
+        """A connection that keeps dropping is given up on and the .part file kept"""
+        self.server.drops = 100
+        self.server.cut = 0
+        with self.assertRaises(IOError):
+            download.download(self.url, self.csv, retries=2)
+        self.assertFalse(os.path.exists(self.csv))
+        self.assertTrue(os.path.exists(self.csv + '.part'))
+        self.assertEqual(len(self.server.ranges), 3)
+
+        self.server.data = self.server.data + b'changed'
+        self.server.drops = 0
+        with open(self.csv + '.part', 'wb') as f:
+            f.write(self.server.data[:1000])
+        stream = download.Download(self.url, self.csv)
+        stream.connect()
+        stream.size = 10
+        with self.assertRaises(IOError):
+            stream.connect()
+        stream.close()
+
+    def test_ingest(self):
+        """Ingest while downloading makes the same file and cache as ingest of the file"""
+        self.server.drops = 1
+        files = analysis.Data(self.csv, None)
+        meta = analysis.Data.ingest(files, chunk_power=3, source=download.Download(self.url, self.csv, block=4096))
+        self.assertSameFile()
+        self.assertTrue(store.is_current(self.csv))
+        self.assertEqual(meta['rows'], 5000)
+        self.assertEqual(len(self.server.ranges), 2)
+
+        local = analysis.Data(self.local_csv, None)
+        analysis.Data.ingest(local, chunk_power=3)
+        pd.testing.assert_frame_equal(pd.concat(analysis.Data.read_csv(files, 3)),
+                                      pd.concat(analysis.Data.read_csv(local, 3)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+#! /usr/local/bin/python3.6
+
+import os
+import shutil
+import unittest
+
+import bs4
+
+from blue_plaques.blue_plaques import crawler
+from blue_plaques.blue_plaques import http_cache
+from blue_plaques.test import local_server
+
+
+class Handler(local_server.QuietHandler):
+    """Serves server.pages, answering 304 to a matching If-None-Match or If-Modified-Since"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.log.append((self.path, self.headers.get('If-None-Match'), self.headers.get('If-Modified-Since')))
+        if self.path not in server.pages:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = server.pages[self.path].encode()
+        etag = '"{}"'.format(hash(body)) if server.etags is True else None
+        modified = 'Sat, 01 Jan 2000 00:00:{:02d} GMT'.format(len(body) % 60)
+        if (etag is not None and self.headers.get('If-None-Match') == etag) or \
+                (etag is None and self.headers.get('If-Modified-Since') == modified):
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.send_header('Last-Modified', modified)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.folder = '/tmp/http_cache_test/'
+        self.server = local_server.serve(self, Handler, etags=True, log=[], pages={
+            '/wiki/London': '<html><body><div class="hatnote navigation-not-searchable">'
+                            '<a href="/wiki/Camden">Camden</a></div><p>London – plaques</p></body></html>',
+            '/wiki/Camden': '<html><body><p>Camden</p></body></html>'})
+        self.head = self.server.url
+
+    def tearDown(self):
+        if os.path.exists(self.folder):
+            shutil.rmtree(self.folder)
+
+    def test_revalidate(self):
+        """Saved pages are checked with the ETag, or Last-Modified without one, and downloaded again once changed"""
+        for etags in [True, False]:
+            self.server.etags = etags
+            self.server.log = []
+            cache = http_cache.ResponseCache(self.folder)
+            url = self.head + '/wiki/London'
+            self.assertEqual(cache.get(url), self.server.pages['/wiki/London'])
+            self.assertEqual(self.server.log[0][1:], (None, None))
+            self.assertEqual(http_cache.ResponseCache(self.folder).get(url), self.server.pages['/wiki/London'])
+            self.assertEqual(self.server.log[1][1] is not None, etags)
+            self.assertIsNotNone(self.server.log[1][2])
+
+            self.server.pages['/wiki/London'] += ' '
+            self.assertEqual(cache.get(url), self.server.pages['/wiki/London'])
+            self.assertEqual(len(self.server.log), 3)
+            shutil.rmtree(self.folder)
+
+    def test_offline_and_max_age(self):
+        url = self.head + '/wiki/London'
+        offline = http_cache.ResponseCache(self.folder, offline=True)
+        with self.assertRaises(IOError):
+            offline.get(url)
+        http_cache.ResponseCache(self.folder).get(url)
+        self.assertEqual(offline.soup(url).p.text, 'London – plaques')
+        self.assertEqual(http_cache.ResponseCache(self.folder, max_age=3600).get(url),
+                         self.server.pages['/wiki/London'])
+        self.assertEqual(len(self.server.log), 1)
+
+    def test_crawl(self):
+        """A crawl through the cache can be run again offline with the same rows"""
+        def page(html):
+            soup = bs4.BeautifulSoup(html, 'html.parser')
+            hatnotes = soup.find_all('div', {'class': 'hatnote navigation-not-searchable'})
+            return [p.text for p in soup.find_all('p')], [self.head + div.find('a').get('href') for div in hatnotes]
+
+        urls = [self.head + '/wiki/London']
+        data = crawler.crawl_pages(urls, page, rate=None,
+                                   cache=http_cache.ResponseCache(self.folder))
+        self.assertEqual(data, ['London – plaques', 'Camden'])
+        self.assertEqual(crawler.crawl_pages(urls, page, rate=None,
+                                             cache=http_cache.ResponseCache(self.folder)), data)
+        self.assertEqual([etag is not None for _, etag, _ in self.server.log], [False, False, True, True])
+        self.server.log = []
+        self.assertEqual(crawler.crawl_pages(urls, page, rate=None,
+                                             cache=http_cache.ResponseCache(self.folder, offline=True)), data)
+        self.assertEqual(self.server.log, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
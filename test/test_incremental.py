@@ -0,0 +1,107 @@
+#! /usr/local/bin/python3.6
+
+import os
+import shutil
+import unittest
+import pandas as pd
+import numpy as np
+
+from blue_plaques.blue_plaques import analysis_3 as analysis
+from blue_plaques.blue_plaques import incremental
+
+
+def sale(i, price, date, postcode, paon, street, status='A'):
+    return ['{%d}' % i, price, date, postcode, 'T', 'N', 'F', paon, '', street, 'ISLINGTON', 'LONDON', 'ISLINGTON',
+            'GREATER LONDON', 'A', status]
+
+
+class TestIncrementalState(unittest.TestCase):
+    def setUp(self):
+        """Base csv, a monthly update of it and the csv the base becomes with the update done"""
+        self.folder = '/tmp/incremental_test/'
+        os.makedirs(self.folder)
+        rng = np.random.RandomState(0)
+        postcodes = [('N1 2NU', 'HOPPING LANE'), ('N7 2NU', 'HOPPING LANE'), ('E13 1AA', 'HIGH STREET'),
+                     ('W8 4FN', 'MILL ROAD')]
+        self.base = []
+        for i in range(300):
+            postcode, street = postcodes[rng.randint(len(postcodes))]
+            date = '{}-0{}-01 00:00'.format(rng.choice([2012, 2014, 2016, 2017]), rng.randint(1, 10))
+            self.base.append(sale(i, int(np.exp(rng.normal(12, 0.5))), date, postcode, str(rng.choice([2, 4, 6])),
+                                  street))
+        # Changes, deletes and adds, with a sale that is changed twice, one that is added again and ones changed to
+        # have no postcode, which go like deleted ones
+        self.update = [sale(5, 123456, self.base[5][2], 'N1 2NU', '2', 'HOPPING LANE', 'C'),
+                       sale(6, 0, self.base[6][2], self.base[6][3], '2', 'HOPPING LANE', 'D'),
+                       sale(7, 1, '2017-05-01 00:00', 'E13 1AA', '2', 'HIGH STREET', 'C'),
+                       sale(7, 777777, '2017-05-01 00:00', 'E13 1AA', '2', 'HIGH STREET', 'C'),
+                       sale(8, 888888, self.base[8][2], self.base[8][3], self.base[8][7], self.base[8][9], 'A'),
+                       sale(9, 999999, self.base[9][2], '', self.base[9][7], self.base[9][9], 'C'),
+                       sale(10, 101010, self.base[10][2], 'N1 2NU', '2', 'HOPPING LANE', 'C'),
+                       sale(10, 101010, self.base[10][2], '', '2', 'HOPPING LANE', 'C'),
+                       sale(300, 300000, '2018-01-01 00:00', 'N1 2NU', '2', 'HOPPING LANE', 'A'),
+                       sale(301, 310000, '2018-02-01 00:00', 'W8 4FN', '4', 'MILL ROAD', 'A')]
+        updated = {row[0]: row for row in self.base}
+        for row in self.update:
+            if row[-1] == 'D':
+                del updated[row[0]]
+            else:
+                updated[row[0]] = row
+        self.updated = list(updated.values())
+
+        self.csv = self.folder + 'pp-complete.csv'
+        self.updated_csv = self.folder + 'pp-updated.csv'
+        self.update_csv = self.folder + 'pp-monthly-update.csv'
+        pd.DataFrame(self.base, columns=analysis.price_paid_columns).to_csv(self.csv, index=False)
+        pd.DataFrame(self.updated, columns=analysis.price_paid_columns).to_csv(self.updated_csv, index=False)
+        # Monthly update files have no heading line
+        pd.DataFrame(self.update).to_csv(self.update_csv, index=False, header=False)
+
+        self.bp = self.folder + 'bp.csv'
+        pd.DataFrame([['2 Hopping Lane\nIslington\nLondon, N1 2NU', 'Matt Barson', 'wiki', '2015'],
+                      ['4 Mill Road\nLondon, W8 4FN', 'Chris Barson', 'wiki', '2013']],
+                     columns=['Address', 'Person', 'Wiki', 'Year']).to_csv(self.bp, index=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def assertSameState(self, state, expected):
+        """Same stats, ledger and plaque sales, the plaque sales in any order"""
+        got, want = state.house_prices_stats(), expected.house_prices_stats()
+        self.assertEqual(got[['Area', 'Year', 'number', 'median']].values.tolist(),
+                         want[['Area', 'Year', 'number', 'median']].values.tolist())
+        for column in ['mean', 'sd', 'skew', 'sum_of_x', 'sum_of_x_sqr']:
+            np.testing.assert_allclose(got[column].values, want[column].values, rtol=1e-9)
+        for name in ['ids', 'years', 'prices']:
+            self.assertEqual(getattr(state.ledger, name).tolist(), getattr(expected.ledger, name).tolist())
+        self.assertEqual(np.array(state.ledger.areas)[state.ledger.codes].tolist(),
+                         np.array(expected.ledger.areas)[expected.ledger.codes].tolist())
+        self.assertEqual(sorted(state.plaque_sales['ID']), sorted(expected.plaque_sales['ID']))
+
+    def test_apply(self):
+        """Applying the update gives the state a build of the updated csv does"""
+        state = incremental.IncrementalState.build(analysis.Data(self.csv, self.bp), self.folder + 'state')
+        counts = state.apply(self.update_csv)
+        self.assertEqual(counts, {'added': 2, 'changed': 3, 'deleted': 3})
+        expected = incremental.IncrementalState.build(analysis.Data(self.updated_csv, self.bp),
+                                                      self.folder + 'expected')
+        self.assertSameState(state, expected)
+
+        loaded = incremental.IncrementalState.load(analysis.Data(None, self.bp), self.folder + 'state')
+        self.assertSameState(loaded, expected)
+        self.assertIsNone(loaded.apply(self.update_csv))
+        self.assertSameState(loaded, expected)
+
+    def test_runner(self):
+        """runner over the state gives the data sets runner over the csv does"""
+        files = analysis.Data(self.updated_csv, self.bp)
+        state = incremental.IncrementalState.build(files, self.folder + 'state')
+        avg_prices = state.house_prices_stats()
+        r, s, i = state.runner(avg_prices, 'mean')
+        r_csv, s_csv, i_csv = analysis.runner(files, avg_prices, 'mean')
+        self.assertEqual((r, s, i), (r_csv, s_csv, i_csv))
+        self.assertTrue(len(s) > 0 and len(i[1]) > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+#! /usr/local/bin/python3.6
+
+import json
+import os
+import shutil
+import unittest
+import urllib.parse
+
+import pandas as pd
+
+from blue_plaques.blue_plaques import analysis_3 as analysis
+from blue_plaques.blue_plaques import plaque_refresh
+from blue_plaques.blue_plaques import wiki_tables
+from blue_plaques.test import local_server
+
+
+def wiki_page(people, links):
+    """Plaque list page: hatnote links to other lists and a wikitable of (person, address, year)"""
+    hatnotes = ''.join('<div class="hatnote navigation-not-searchable"><a href="{0}">{0}</a></div>'.format(link)
+                       for link in links)
+    rows = ''.join('<tr class="vevent"><th><a href="/wiki/{0}">{0}</a></th><td>Plaque</td><td>{1}</td><td>{2}</td>'
+                   '</tr>'.format(*row) for row in people)
+    return '<html><body>{}<table class="wikitable sortable"><tr><th>Person</th></tr>{}</table></body></html>'.format(
+        hatnotes, rows)
+
+
+class Handler(local_server.QuietHandler):
+    """Serves server.pages at /wiki/Title and their revisions from server.revisions at /w/api.php"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        path, _, query = self.path.partition('?')
+        server.log.append(path)
+        if path == '/w/api.php':
+            titles = urllib.parse.parse_qs(query)['titles'][0].split('|')
+            server.titles.append(len(titles))
+            # Titles come back normalised with underscores, like the API does with them
+            normalized = [{'from': t, 'to': t.replace('_', ' ')} for t in titles if '_' in t]
+            pages = []
+            for title in titles:
+                title = title.replace('_', ' ')
+                path = '/wiki/' + title.replace(' ', '_')
+                if path in server.pages:
+                    pages.append({'title': title, 'lastrevid': server.revisions[path]})
+                else:
+                    pages.append({'title': title, 'missing': True})
+            body = json.dumps({'query': {'normalized': normalized, 'pages': pages}}).encode()
+        elif path in server.pages:
+            body = server.pages[path].encode()
+        else:
+            body = b''
+        self.send_response(200 if body else 404)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def sale(i, postcode, paon, street):
+    return ['{%d}' % i, 300000, '2015-01-01 00:00', postcode, 'T', 'N', 'F', paon, '', street, 'ISLINGTON', 'LONDON',
+            'ISLINGTON', 'GREATER LONDON', 'A', 'A']
+
+
+class TestPlaqueRefresh(unittest.TestCase):
+    def setUp(self):
+        self.folder = '/tmp/plaque_refresh_test/'
+        os.makedirs(self.folder)
+        pages = {
+            '/wiki/London': wiki_page([('Ada', '1 Road, N1 2NU', '1990')], ['/wiki/Camden', '/wiki/Islington']),
+            '/wiki/Camden': wiki_page([('Bob', '2 Lane, NW3 1AA', '1991'), ('Cat', '3 Lane, NW3 1AA', '1992')], []),
+            '/wiki/Islington': wiki_page([('Dan', '4 Hopping Lane, N1 2NU', '1993')], []),
+            '/wiki/Other_list': wiki_page([('Eve', '5 Road, W8 4FN', '1994')], ['/wiki/Camden'])}
+        self.server = local_server.serve(self, Handler, pages=pages, revisions={path: 1 for path in pages}, log=[],
+                                         titles=[])
+        self.head = self.server.url
+        self.api = self.head + '/w/api.php'
+        self.urls = [self.head + '/wiki/London', self.head + '/wiki/Other_list']
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def get_page(self, url):
+        return self.server.pages[urllib.parse.urlparse(url).path]
+
+    def scratch(self):
+        """Rows of a scrape of every page"""
+        data = []
+        for url in self.urls:
+            rows, links = wiki_tables.parse_page(self.get_page(url))
+            data.extend(rows)
+            for link in links:
+                data.extend(wiki_tables.parse_page(self.get_page(link))[0])
+        return data
+
+    def refresh(self):
+        state = plaque_refresh.PlaqueState.load(self.folder + 'state.json')
+        data, changed = state.refresh(self.urls, self.get_page, api=self.api)
+        state.save()
+        return data, [urllib.parse.urlparse(url).path for url in changed]
+
+    def test_refresh(self):
+        """Only pages with a new revision are parsed again, and the rows are those of a scrape from scratch"""
+        wiki_tables.WIKI_HEAD, head = self.head, wiki_tables.WIKI_HEAD
+        try:
+            data, changed = self.refresh()
+            self.assertEqual(data, self.scratch())
+            self.assertEqual(changed, ['/wiki/London', '/wiki/Camden', '/wiki/Islington', '/wiki/Other_list'])
+
+            self.server.log = []
+            self.assertEqual(self.refresh(), (data, []))
+            # The revisions of the start pages and the pages they link to in one request
+            self.assertEqual(self.server.log, ['/w/api.php'])
+
+            self.server.pages['/wiki/Camden'] = wiki_page([('Bob', '2 Lane, NW3 1AA', '1991')], ['/wiki/New'])
+            self.server.pages['/wiki/New'] = wiki_page([('Fay', '6 Road, N1 2NU', '1995')], [])
+            self.server.revisions['/wiki/Camden'] = 2
+            self.server.revisions['/wiki/New'] = 1
+            data, changed = self.refresh()
+            self.assertEqual(data, self.scratch())
+            self.assertEqual(changed, ['/wiki/Camden'])
+
+            self.server.pages['/wiki/London'] = wiki_page([('Ada', '1 Road, N1 2NU', '1990')], ['/wiki/New'])
+            self.server.revisions['/wiki/London'] = 2
+            data, changed = self.refresh()
+            self.assertEqual(data, self.scratch())
+            self.assertEqual(changed, ['/wiki/London', '/wiki/New'])
+            state = plaque_refresh.PlaqueState.load(self.folder + 'state.json')
+            self.assertEqual(sorted(state.pages), sorted(self.head + path for path in
+                                                         ['/wiki/London', '/wiki/New', '/wiki/Other_list',
+                                                          '/wiki/Camden']))
+        finally:
+            wiki_tables.WIKI_HEAD = head
+
+    def test_revision_ids(self):
+        urls = [self.head + '/wiki/Page_{}'.format(i) for i in range(120)] + [self.head + '/wiki/Other_list']
+        revisions = plaque_refresh.revision_ids(urls, api=self.api)
+        self.assertEqual(self.server.titles, [50, 50, 21])
+        self.assertEqual(revisions[self.head + '/wiki/Other_list'], 1)
+        self.assertIsNone(revisions[self.head + '/wiki/Page_0'])
+
+    def test_diff_rows(self):
+        """Rows compare on person, address and year whatever the layout of the year and the case of the address"""
+        old = pd.DataFrame({'person': ['Ada ', 'Bob', 'Cat'], 'address': ['1 Road, N1 2NU', '2 Lane', '3 Lane'],
+                            'wiki': ['a', 'b', 'c'], 'year': ['1990-01-01', '1991-01-01', '1992-01-01']})
+        new = pd.DataFrame({'person': ['Ada', 'Bob', 'Dan'], 'address': ['1  Road, N1 2NU', '2 Lane', '4 Lane'],
+                            'wiki': ['a', 'b', 'd'], 'year': pd.to_datetime(['1990', '1999', '1993'])})
+        added, removed = plaque_refresh.diff_rows(old, new)
+        self.assertEqual(added['person'].tolist(), ['Bob', 'Dan'])
+        self.assertEqual(removed['person'].tolist(), ['Bob', 'Cat'])
+
+        normalised = pd.DataFrame({'address': ['1 ROAD, N1 2NU', '2 LANE', '3 LANE'], 'person': ['Ada', 'Bob', 'Cat'],
+                                   'year': ['01/01/1990', '01/01/1991', '01/01/1992'], 'PAON': ['1', '2', '3']})
+        added = added.assign(PAON=['2', '4'])
+        updated = plaque_refresh.update_normalised(normalised, added, removed)
+        self.assertEqual(updated['person'].tolist(), ['Ada', 'Bob', 'Dan'])
+        self.assertEqual(updated['PAON'].tolist(), ['1', '2', '4'])
+
+    def test_update_matches(self):
+        """Only the people with plaques added or removed are matched again, over the sales in their areas"""
+        csv = self.folder + 'pp.csv'
+        pd.DataFrame([sale(1, 'N1 2NU', '1', 'ROAD'), sale(2, 'NW3 1AA', '2', 'LANE'),
+                      sale(3, 'NW3 1AA', '3', 'LANE'), sale(4, 'N1 2NU', '4', 'HOPPING LANE'),
+                      sale(5, 'W8 4FN', '5', 'ROAD')], columns=analysis.price_paid_columns).to_csv(csv, index=False)
+        files = analysis.Data(csv, None)
+        plaques = pd.DataFrame({'person': ['Ada', 'Bob', 'Cat'],
+                                'address': ['1 Road, N1 2NU', '2 Lane, NW3 1AA', '3 Lane, NW3 1AA'],
+                                'wiki': ['a', 'b', 'c'], 'year': pd.to_datetime(['1990', '1991', '1992'])})
+        state = plaque_refresh.PlaqueState(self.folder + 'state.json', {}, {})
+        self.assertEqual(state.update_matches(files, plaques, plaques, plaques[:0]),
+                         {'Ada': ['{1}'], 'Bob': ['{2}'], 'Cat': ['{3}']})
+
+        new = pd.concat([plaques[plaques['person'] != 'Cat'],
+                         pd.DataFrame({'person': ['Dan'], 'address': ['4 Hopping Lane, N1 2NU'], 'wiki': ['d'],
+                                       'year': pd.to_datetime(['1993'])})], ignore_index=True)
+        state.matches['Ada'] = ['kept']
+        added, removed = plaque_refresh.diff_rows(plaques, new)
+        self.assertEqual(state.update_matches(files, new, added, removed), {'Dan': ['{4}']})
+        self.assertEqual(state.matches, {'Ada': ['kept'], 'Bob': ['{2}'], 'Dan': ['{4}']})
+
+
+if __name__ == '__main__':
+    unittest.main()
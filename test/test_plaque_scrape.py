@@ -0,0 +1,57 @@
+#! /usr/local/bin/python3.6
+
+import os
+import shutil
+import unittest
+
+import pandas as pd
+
+from blue_plaques.blue_plaques import plaque_scrape
+from blue_plaques.test import local_server
+
+PAGE = ('<html><body><table class="wikitable sortable"><tr><th>Person</th></tr>'
+        '<tr class="vevent"><th><a href="/wiki/Ada">Ada (1815-1852)</a></th><td>Plaque</td><td>1 Road, N1 2NU</td>'
+        '<td>1990</td></tr>'
+        '<tr class="vevent"><th><a href="/wiki/Bob">Bob</a></th><td>Plaque</td><td>2 Lane, NW3 1AA</td><td>1991</td>'
+        '</tr></table></body></html>')
+
+
+class Handler(local_server.QuietHandler):
+    """Serves PAGE at every path, counting the requests"""
+
+    def do_GET(self):
+        self.server.requests += 1
+        body = PAGE.encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TestPlaqueScrape(unittest.TestCase):
+    def setUp(self):
+        self.folder = '/tmp/plaque_scrape_test/'
+        os.makedirs(self.folder)
+        self.server = local_server.serve(self, Handler, requests=0)
+        self.url = self.server.url + '/wiki/List'
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_main_cached(self):
+        """Pages are fetched through the cache in the folder, so the scrape can be run again offline"""
+        plaque_scrape.main(self.url, self.folder)
+        df = pd.read_csv(self.folder + 'bp_csv.csv')
+        self.assertEqual(df['Person'].str.strip().tolist(), ['Ada', 'Bob'])
+        self.assertEqual(df['Year'].tolist(), [1990, 1991])
+        self.assertTrue(os.listdir(self.folder + 'wiki_cache/'))
+        self.assertEqual(self.server.requests, 1)
+
+        os.remove(self.folder + 'bp_csv.csv')
+        plaque_scrape.main(self.url, self.folder, offline=True)
+        self.assertEqual(self.server.requests, 1)
+        pd.testing.assert_frame_equal(pd.read_csv(self.folder + 'bp_csv.csv'), df)
+
+
+if __name__ == '__main__':
+    unittest.main()
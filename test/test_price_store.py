@@ -0,0 +1,53 @@
+#! /usr/local/bin/python3.6
+
+import os
+import shutil
+import unittest
+import pandas as pd
+import numpy as np
+
+from blue_plaques.blue_plaques import price_store
+
+
+class TestPriceStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = '/tmp/price_store_test/'
+        os.makedirs(self.folder)
+        self.csv = self.folder + 'pp-complete.csv'
+        with open(self.csv, 'w') as f:
+            f.write('a,b\n1,2\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_build(self):
+        """Every price in its area/year's sorted run, put in place a few rows at a time"""
+        rng = np.random.RandomState(0)
+        chunks = []
+        for i in range(5):
+            areas = pd.Series(rng.choice(['N1', 'N7', 'E13', 'W8', None], 200), index=np.arange(200) + 1000 * i)
+            chunks.append((areas, rng.choice([2014, 2015, 2017], 200), rng.randint(1, 10 ** 6, 200)))
+        store = price_store.build(self.csv, iter(chunks), block=64)
+        self.assertTrue(price_store.is_current(self.csv))
+
+        df = pd.concat([pd.DataFrame({'Area': a.values, 'Year': y, 'Price': p}) for a, y, p in chunks]).dropna()
+        expected = {key: sorted(group['Price']) for key, group in df.groupby(['Area', 'Year'])}
+        self.assertEqual(store.groups(), sorted(expected))
+        self.assertEqual(store.meta['rows'], len(df))
+        for (area, year), prices in expected.items():
+            self.assertEqual(store.get(area, year).tolist(), prices)
+        self.assertEqual(store.get('N1', 2016).tolist(), [])
+        self.assertIsInstance(store.prices, np.memmap)
+
+        with open(self.csv, 'a') as f:
+            f.write('3,4\n')
+        self.assertFalse(price_store.is_current(self.csv))
+
+    def test_empty(self):
+        store = price_store.build(self.csv, iter([]))
+        self.assertEqual(store.get('N1', 2014).tolist(), [])
+        self.assertEqual(store.groups(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
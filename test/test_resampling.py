@@ -0,0 +1,88 @@
+#! /usr/local/bin/python3.6
+
+import tracemalloc
+import unittest
+import numpy as np
+from scipy import stats
+
+from blue_plaques.blue_plaques import accumulators
+from blue_plaques.blue_plaques import resampling
+
+
+class TestResamplingTests(unittest.TestCase):
+    def setUp(self):
+        """Lognormal prices rounded like the weighted prices, a few hundred bp values and many more controls"""
+        rng = np.random.RandomState(2)
+        self.ctr = np.round(np.exp(rng.normal(12, 0.7, 20000)), -3)
+        self.exp = np.round(np.exp(rng.normal(12.3, 0.7, 300)), -3)
+        self.before_after = {'P{}'.format(i): {'Before': list(rng.normal(100, 10, 3)),
+                                               'After': list(rng.normal(100 + (i % 5) - 2, 10, 4))}
+                             for i in range(40)}
+
+    def test_independent_samples(self):
+        """Interval holds the difference of the means, p agrees with Welch's t-test where it is far from 0 or 1"""
+        result = resampling.ResamplingTests.independent_samples((self.exp, self.ctr), resamples=2000)
+        self.assertEqual(result.resamples, 2000)
+        self.assertAlmostEqual(result.statistic, self.exp.mean() - self.ctr.mean())
+        self.assertLess(result.ci_low, result.statistic)
+        self.assertGreater(result.ci_high, result.statistic)
+        self.assertLess(result.p_value, 0.01)
+
+        same = resampling.ResamplingTests.independent_samples((self.ctr[:300], self.ctr[300:]), resamples=2000)
+        t_p = stats.ttest_ind(self.ctr[:300], self.ctr[300:], equal_var=False).pvalue
+        self.assertAlmostEqual(same.p_value, t_p, delta=0.08)
+        self.assertLess(same.ci_low, 0)
+        self.assertGreater(same.ci_high, 0)
+
+    def test_single_sample(self):
+        result = resampling.ResamplingTests.single_sample(self.exp, pop_mean=self.ctr.mean(), resamples=2000)
+        self.assertLess(result.p_value, 0.01)
+        result = resampling.ResamplingTests.single_sample(self.exp, pop_mean=self.exp.mean() + 10, resamples=2000)
+        self.assertGreater(result.p_value, 0.9)
+        self.assertLess(result.ci_low, self.exp.mean())
+        self.assertGreater(result.ci_high, self.exp.mean())
+
+    def test_repeated_measures(self):
+        """Differences of the means per person, p close to the paired t-test"""
+        result = resampling.ResamplingTests.repeated_measures(self.before_after, resamples=4000)
+        diff = [np.mean(ba['Before']) - np.mean(ba['After']) for ba in self.before_after.values()]
+        self.assertAlmostEqual(result.statistic, np.mean(diff))
+        self.assertAlmostEqual(result.p_value, stats.ttest_1samp(diff, 0).pvalue, delta=0.05)
+        with self.assertRaises(ValueError):
+            resampling.ResamplingTests.repeated_measures({'P': {'Before': [1.0], 'After': []}})
+
+    def test_workers(self):
+        """Same seed, same results whatever the number of processes; different seed, different results"""
+        one = resampling.ResamplingTests.independent_samples((self.exp, self.ctr), resamples=450, seed=3)
+        two = resampling.ResamplingTests.independent_samples((self.exp, self.ctr), resamples=450, seed=3, workers=2)
+        self.assertEqual(one, two)
+        other = resampling.ResamplingTests.independent_samples((self.exp, self.ctr), resamples=450, seed=4)
+        self.assertNotEqual(one.ci_low, other.ci_low)
+
+    def test_distinct_picks(self):
+        """Different indices in each row, drawn from permutations when the rows are long, keeping only the rows"""
+        rng = np.random.RandomState(0)
+        for rows, size, n in [(50, 400, 100000), (50, 20, 100000)]:
+            tracemalloc.start()
+            picks = resampling.distinct_picks(rng, rows, size, n)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.assertEqual(picks.shape, (rows, size))
+            self.assertTrue(((picks >= 0) & (picks < n)).all())
+            self.assertTrue(all(len(set(row)) == size for row in picks.tolist()))
+            # One permutation of n at a time, not one a row
+            self.assertLess(peak, 4 * n * 8)
+
+        # A bp sample big enough that the null draws use the permutations
+        ctr = np.round(np.exp(np.random.RandomState(5).normal(12, 0.7, 100000)), -3)
+        result = resampling.ResamplingTests.independent_samples((ctr[:400] * 1.5, ctr), resamples=200, seed=1)
+        self.assertAlmostEqual(result.p_value, 1 / 201)
+
+    def test_moments(self):
+        """Accumulated samples don't have the values to resample"""
+        with self.assertRaises(ValueError):
+            resampling.ResamplingTests.single_sample(accumulators.SampleMoments().update(self.exp), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
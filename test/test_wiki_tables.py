@@ -0,0 +1,142 @@
+#! /usr/local/bin/python3.6
+
+import random
+import unittest
+
+import bs4
+
+from blue_plaques.blue_plaques import wiki_tables
+
+
+SORTABLE = """<!DOCTYPE html><html><head><title>List</title><style>td { color: blue }</style></head><body>
+<div role="note" class="hatnote navigation-not-searchable">Main article: <a href="/wiki/List_of_English_Heritage_blue_plaques_in_the_London_Borough_of_Camden">Camden</a></div>
+<div class="hatnote">Not a list <a href="/wiki/Other">other</a></div>
+<table class="wikitable sortable">
+<tr><th>Person</th><th>Inscription</th><th>Location</th><th>Year</th></tr>
+<tr class="vevent">
+<th scope="row"><span class="fn"><a href="/wiki/Ada_Lovelace" title="Ada Lovelace">Ada Lovelace</a> (1815–1852)</span></th>
+<td>Mathematician &amp; <i>computer</i> pioneer</td>
+<td>12 St James's Square, SW1Y 4JH<br><span class="plainlinks nourlexpansion"><span class="geo">51.507°N 0.134°W</span></span></td>
+<td>1992 (restored)</td>
+</tr>
+<tr class="vevent summary"><th>Nobody Linked 1900-1970</th><td>Writer</td><td>
+  1  Hopping&nbsp;Lane
+</td><td>2001</td><td>photo</td></tr>
+<!-- <tr class="vevent"><th>Commented out</th></tr> -->
+<tr class="vevent"><th><a>No href</a></th><td>x</td><td>Flat 2, 3&#8211;5 Road &#x27;A&#x27; &bogus; &lt;</td><td><![CDATA[19]]>99</td></tr>
+</table>
+<table class="wikitable">
+<tr><th>Person</th><th>Inscription</th><th>Location</th><th>Year</th></tr>
+<tr><td><a href="/wiki/Sam">Sam (poet)</a></td><td>Poet</td><td>7 High Street</td><td>1950</td></tr>
+<tr><td>Only one cell</td></tr>
+<tr><td>No link</td><td>Poet</td><td><pre>  </pre>  </td><td>  1960
+</td></tr>
+</table>
+<table class="other"><tr class="vevent"><th>Not a wiki table</th></tr></table>
+</body></html>"""
+
+NESTED = """<table class="wikitable"><tr class="vevent"><th><a href="/wiki/Outer">Outer</a></th><td>i</td>
+<td>Address<table class="wikitable"><tr class="vevent"><td>Inner</td><td>j</td><td>Inner address</td><td>1901</td>
+</tr></table></td><td>1900</td></tr></table>
+<div class="hatnote navigation-not-searchable"><b><a href="/wiki/First">First</a><a href="/wiki/Second">Second</a></b>
+</div>"""
+
+UNCLOSED = """<table class="wikitable sortable"><tr class="vevent"><th><a href="/wiki/A">A</a><td>i<td>12 Road</p> x
+<td>1900<tr class="vevent"><th>B</th><td>j</td><td>13 Road</td><td>1901</td></tr></span></table><p>after"""
+
+HATNOTE = 'div class="hatnote navigation-not-searchable"'
+TAGS = ['table class="wikitable"', 'table class="wikitable sortable"', 'table', 'tr', 'tr class="vevent"', 'td', 'th',
+        'a href="/wiki/X"', 'a', 'span class="plainlinks nourlexpansion"', 'span', 'pre', 'br', 'b', 'p',
+        HATNOTE]
+TEXTS = ['Ada', ' ', '\n  ', '1900-1950', '(x)', '&amp;', '&#8211;', '\xa0', '<!-- c -->', '1 Road', '<![CDATA[z]]>']
+
+
+def random_cell(rng, name):
+    parts = ['<{}>'.format(name)]
+    for _ in range(rng.randint(0, 4)):
+        tag = rng.choice(TAGS[7:-1])
+        parts.extend(['<{}>'.format(tag), rng.choice(TEXTS), '</{}>'.format(tag.split()[0])])
+        parts.append(rng.choice(TEXTS))
+    return parts + ['</{}>'.format(name)]
+
+
+def random_page(rng):
+    """Wiki tables of random cells, with some tags left open, closed out of order or put in anywhere"""
+    parts = []
+    for _ in range(rng.randint(1, 3)):
+        if rng.random() < 0.3:
+            parts.extend(['<{}>'.format(HATNOTE), '<a href="/wiki/List">', rng.choice(TEXTS), '</a>', '</div>'])
+        parts.append('<{}>'.format(rng.choice(TAGS[:3])))
+        for _ in range(rng.randint(1, 5)):
+            row = rng.choice(TAGS[3:5] + [TAGS[4]])
+            parts.append('<{}>'.format(row))
+            for i in range(rng.choice([1] + [4] * 10 + [5] * 5)):
+                parts.extend(random_cell(rng, 'th' if i == 0 and 'vevent' in row else 'td'))
+            parts.append('</tr>')
+        parts.append('</table>')
+    page = []
+    for part in parts:
+        if rng.random() < 0.004:
+            page.append('<{}>'.format(rng.choice(TAGS[3:])))
+        if part.startswith('</') is False or rng.random() > 0.01:
+            page.append(part)
+        if rng.random() < 0.004:
+            page.append('</{}>'.format(rng.choice(TAGS).split()[0]))
+    return ''.join(page)
+
+
+def outcome(backend, html):
+    """Result of a backend, or the type of the exception it raised"""
+    try:
+        return wiki_tables.parse_page(html, backend)
+    except Exception as e:
+        return type(e)
+
+
+# The fast backend follows the rules of the bs4 version in requirements.txt
+SAME_BS4 = bs4.__version__ == '4.6.0'
+
+
+class TestWikiTables(unittest.TestCase):
+    @unittest.skipUnless(SAME_BS4, 'the fast backend gives the rows of bs4 4.6.0')
+    def test_same_rows(self):
+        """The fast backend gives the rows and links of the bs4 one"""
+        for html in [SORTABLE, NESTED, UNCLOSED, UNCLOSED.replace('</p>', '')]:
+            self.assertEqual(outcome('fast', html), outcome('bs4', html))
+
+    def test_fast_rows(self):
+        rows, links = wiki_tables.parse_page(SORTABLE)
+        self.assertEqual(links, ['https://en.wikipedia.org/wiki/List_of_English_Heritage_blue_plaques_in_the_London_'
+                                 'Borough_of_Camden'])
+        self.assertEqual(rows[0], {'person': 'Ada Lovelace    ', 'wiki': 'https://en.wikipedia.org/wiki/'
+                                   'Ada_Lovelace', 'address': '12 St James\'s Square, SW1Y 4JH', 'year': '1992  '})
+        self.assertEqual(rows[1]['wiki'], None)
+        self.assertEqual(rows[2]['address'], "Flat 2, 3–5 Road 'A' &bogus; <")
+        self.assertEqual(rows[4], {'person': 'Only one cell', 'wiki': None, 'address': None, 'year': None})
+        self.assertEqual(len(rows), 6)
+        rows, links = wiki_tables.parse_page(NESTED)
+        # The rows of a table in a table are rows of both tables, like find_all gives them
+        self.assertEqual([row['person'] for row in rows], ['Outer', 'Inner', 'Inner'])
+        self.assertEqual(rows[0]['address'], 'AddressInnerjInner address1901\n')
+        self.assertEqual(links, ['https://en.wikipedia.org/wiki/First'])
+
+    @unittest.skipUnless(SAME_BS4, 'the fast backend gives the rows of bs4 4.6.0')
+    def test_random_pages(self):
+        """Same rows, or the same exception, on random tag soup"""
+        rng = random.Random(0)
+        outcomes = set()
+        for _ in range(600):
+            html = random_page(rng)
+            expected = outcome('bs4', html)
+            self.assertEqual(outcome('fast', html), expected, html)
+            outcomes.add(expected if isinstance(expected, type) else len(expected[0]) > 0)
+        # The pages gave rows, no rows and errors
+        self.assertTrue({True, False, IndexError} <= outcomes)
+
+    def test_backend(self):
+        with self.assertRaises(KeyError):
+            wiki_tables.parse_page(SORTABLE, 'lxml')
+
+
+if __name__ == '__main__':
+    unittest.main()